@@ -1,73 +1,370 @@
 #!/usr/bin/env python3
 import argparse
 import os
+from collections import Counter
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from itertools import groupby
+from operator import itemgetter
+
 import psycopg2
-from dotenv import load_dotenv
-from psycopg2 import sql
+from psycopg2.extras import execute_values
 
-load_dotenv()
+from transcripts import fulltext, packed, phrases
+from transcripts.db import connection
+from transcripts.terms import count_terms
 
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME", "youtube_transcripts")
-DB_USER = os.getenv("DB_USER", "postgres")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
 
+def search_transcripts(keyword, limit=None, offset=0, ranked=False):
+    """Full-text search of transcript lines, streamed from a server-side cursor"""
+    conn = connection()
+    if not conn:
+        return
 
-def connection():
+    # A named cursor keeps the result set on the server; rows arrive in
+    # itersize chunks instead of being loaded into memory by fetchall().
+    cursor = conn.cursor(name="transcript_search")
+    cursor.itersize = 500
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME,
-        )
-        return conn
-    except psycopg2.Error as e:
-        print("Database connection error:", e)
-        return None
+        fulltext.search(cursor, keyword, limit=limit, offset=offset, ranked=ranked)
+        count = 0
+        for row in cursor:
+            count += 1
+            if ranked:
+                vid, start_time, rank, snippet = row
+                print(f"{rank:.4f} [{vid}] {snippet}  {fulltext.watch_url(vid, start_time)}")
+            else:
+                vid, start_time, text = row
+                print(f"[{vid}] {text}")
+        if count:
+            print(f"Found {count} matching transcript lines.")
+        else:
+            print("No matching transcripts found.")
+    finally:
+        cursor.close()
+        conn.close()
 
 
-def search_transcripts(keyword):
-    """Search transcripts for a keyword (case-insensitive)"""
+def search_phrase(phrase, within=None, limit=None, offset=0):
+    """Moments a phrase is said, from the positional phrase index"""
     conn = connection()
     if not conn:
         return
 
     cursor = conn.cursor()
     try:
-        query = sql.SQL("SELECT video_id, text FROM transcripts WHERE text ILIKE %s")
-        cursor.execute(query, (f"%{keyword}%",))  # parameterized query
-        results = cursor.fetchall()
+        results = phrases.search(cursor, phrase, within=within, limit=limit or 20, offset=offset)
+        for result in results:
+            print(f"[{result['video_id']}] line {result['segment']} +{result['offset']} "
+                  f"({result['span']} words)  {result['url']}")
         if results:
-            print(f"Found {len(results)} matching transcript lines:")
-            for vid, text in results:
-                print(f"[{vid}] {text}")
+            print(f"Found {len(results)} matches.")
         else:
-            print("No matching transcripts found.")
+            print("No matches found.")
     finally:
         cursor.close()
         conn.close()
 
 
+UNINDEXED_LINES_SQL = """
+    SELECT t.video_id, t.text, t.start_time
+    FROM transcripts t
+    WHERE NOT EXISTS (SELECT 1 FROM phrase_segments s WHERE s.video_id = t.video_id)
+    ORDER BY t.video_id, t.id
+"""
+
+UNINDEXED_PACKED_SQL = """
+    SELECT p.video_id, p.data
+    FROM transcripts_packed p
+    WHERE NOT EXISTS (SELECT 1 FROM phrase_segments s WHERE s.video_id = p.video_id)
+"""
+
+
+def iter_unindexed(conn):
+    """(video_id, [(text, start_time), ...]) for videos missing from the phrase index"""
+    with conn.cursor(name="phrase_index_lines") as cursor:
+        cursor.itersize = 5000
+        cursor.execute(UNINDEXED_LINES_SQL)
+        for video_id, rows in groupby(cursor, key=itemgetter(0)):
+            yield video_id, [(text, start_time) for _, text, start_time in rows]
+    with conn.cursor(name="phrase_index_packed") as cursor:
+        cursor.itersize = 100
+        cursor.execute(UNINDEXED_PACKED_SQL)
+        for video_id, data in cursor:
+            yield video_id, [(line["text"], line["start"]) for line in packed.PackedTranscript(data)]
+
+
+def index_phrases(videos_per_chunk=50):
+    """Add videos stored before the phrase index existed, one commit per chunk"""
+    read_conn = connection()
+    write_conn = connection()
+    if not read_conn or not write_conn:
+        return 0
+
+    write_cursor = write_conn.cursor()
+    indexed = 0
+    chunk = []
+    try:
+        for document in iter_unindexed(read_conn):
+            chunk.append(document)
+            if len(chunk) >= videos_per_chunk:
+                phrases.store(write_cursor, chunk)
+                write_conn.commit()
+                indexed += len(chunk)
+                chunk = []
+        phrases.store(write_cursor, chunk)
+        write_conn.commit()
+        indexed += len(chunk)
+    except psycopg2.Error:
+        write_conn.rollback()
+        raise
+    finally:
+        write_cursor.close()
+        read_conn.close()
+        write_conn.close()
+    return indexed
+
+
 def show_stats():
-    """Show database stats: videos, transcripts, total characters"""
+    """Show database stats from the transcript_stats rollup maintained by triggers"""
     conn = connection()
     if not conn:
         return
 
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT COUNT(*) FROM videos")
-        video_count = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*), SUM(LENGTH(text)) FROM transcripts")
-        transcript_count, total_chars = cursor.fetchone()
+        cursor.execute(
+            "SELECT videos, lines, chars, caption_seconds FROM transcript_stats "
+            "WHERE scope = 'global' AND key = ''"
+        )
+        row = cursor.fetchone()
+        video_count, transcript_count, total_chars, caption_seconds = row or (0, 0, 0, 0)
 
         print(f"Videos: {video_count}")
         print(f"Transcript lines: {transcript_count}")
         print(f"Total characters in transcripts: {total_chars}")
+        print(f"Total caption duration: {caption_seconds / 3600:.1f} hours")
+
+        cursor.execute(
+            "SELECT key, videos, lines, chars FROM transcript_stats "
+            "WHERE scope = 'channel' ORDER BY lines DESC LIMIT 10"
+        )
+        channels = cursor.fetchall()
+        if channels:
+            print("\nTop channels by transcript lines:")
+            for channel, videos, lines, chars in channels:
+                print(f"  {channel or '(unknown)':<40} {videos:>6} videos {lines:>10} lines {chars:>12} chars")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+REBUILD_VIDEO_STATS_SQL = """
+    INSERT INTO transcript_stats (scope, key, videos, lines, chars, caption_seconds)
+    SELECT 'video', v.video_id, 1, COUNT(t.id),
+           COALESCE(SUM(LENGTH(t.text)), 0), COALESCE(SUM(t.duration), 0)
+    FROM videos v LEFT JOIN transcripts t ON t.video_id = v.video_id
+    WHERE (hashtext(v.video_id) & 2147483647) %% %(parts)s = %(part)s
+    GROUP BY v.video_id
+"""
+
+REBUILD_ROLLUP_SQL = """
+    DELETE FROM transcript_stats WHERE scope IN ('channel', 'global');
+    INSERT INTO transcript_stats (scope, key, videos, lines, chars, caption_seconds)
+    SELECT 'channel', COALESCE(v.channel_name, ''), SUM(s.videos), SUM(s.lines),
+           SUM(s.chars), SUM(s.caption_seconds)
+    FROM transcript_stats s JOIN videos v ON v.video_id = s.key
+    WHERE s.scope = 'video'
+    GROUP BY COALESCE(v.channel_name, '');
+    INSERT INTO transcript_stats (scope, key, videos, lines, chars, caption_seconds)
+    SELECT 'global', '', COALESCE(SUM(videos), 0), COALESCE(SUM(lines), 0),
+           COALESCE(SUM(chars), 0), COALESCE(SUM(caption_seconds), 0)
+    FROM transcript_stats WHERE scope = 'video';
+"""
+
+# SHARE mode lets readers through but holds back ingestion while a chunk is
+# recomputed, so trigger deltas are never lost or counted twice.
+LOCK_SOURCES_SQL = "LOCK TABLE videos, transcripts IN SHARE MODE"
+
+# A rebuild scans every transcript line, which may take longer than
+# DB_STATEMENT_TIMEOUT_MS; LOCAL ends with the transaction, before the pooled
+# connection is reused.
+NO_TIMEOUT_SQL = "SET LOCAL statement_timeout = 0"
+
+
+def rebuild_video_stats(part, parts):
+    """Recompute the per-video rows for one hash partition of videos"""
+    conn = connection()
+    if not conn:
+        raise RuntimeError("Database connection failed")
+    cursor = conn.cursor()
+    try:
+        cursor.execute(NO_TIMEOUT_SQL)
+        cursor.execute(LOCK_SOURCES_SQL)
+        cursor.execute(
+            "DELETE FROM transcript_stats WHERE scope = 'video' "
+            "AND (hashtext(key) & 2147483647) %% %(parts)s = %(part)s",
+            {"parts": parts, "part": part},
+        )
+        cursor.execute(REBUILD_VIDEO_STATS_SQL, {"parts": parts, "part": part})
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def rebuild_stats(workers=None):
+    """Recompute transcript_stats from scratch, one video partition per worker"""
+    parts = workers or os.cpu_count()
+    with ThreadPoolExecutor(max_workers=parts) as pool:
+        video_rows = sum(pool.map(rebuild_video_stats, range(parts), [parts] * parts))
+
+    conn = connection()
+    if not conn:
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute(NO_TIMEOUT_SQL)
+        cursor.execute(LOCK_SOURCES_SQL)
+        cursor.execute(REBUILD_ROLLUP_SQL)
+        conn.commit()
+        print(f"Rebuilt stats for {video_rows} videos in {parts} parallel chunks")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+NEW_LINES_SQL = """
+    SELECT t.video_id, t.text
+    FROM transcripts t
+    WHERE NOT EXISTS (
+        SELECT 1 FROM term_count_runs r WHERE r.video_id = t.video_id AND r.n = %s
+    )
+    ORDER BY t.video_id, t.id
+"""
+
+
+def iter_video_chunks(cursor, videos_per_chunk):
+    """Group streamed (video_id, text) rows into chunks of whole videos"""
+    chunk = []
+    for video_id, rows in groupby(cursor, key=itemgetter(0)):
+        chunk.append((video_id, [text for _, text in rows]))
+        if len(chunk) >= videos_per_chunk:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def store_term_counts(conn, n, counted):
+    """Write one chunk's per-video counts and fold them into term_totals.
+
+    The videos are claimed in term_count_runs first and only the claimed ones
+    are added, so a run overlapping another one cannot count a video twice.
+    Returns the number of videos stored.
+    """
+    cursor = conn.cursor()
+    try:
+        claimed = execute_values(
+            cursor,
+            "INSERT INTO term_count_runs (video_id, n) VALUES %s ON CONFLICT DO NOTHING RETURNING video_id",
+            [(video_id, n) for video_id, _ in counted],
+            fetch=True,
+        )
+        claimed = {video_id for (video_id,) in claimed}
+
+        totals = Counter()
+        rows = []
+        for video_id, counts in counted:
+            if video_id in claimed:
+                totals.update(counts)
+                rows.extend((video_id, n, term, count) for term, count in counts.items())
+
+        execute_values(
+            cursor,
+            """
+                INSERT INTO video_term_counts (video_id, n, term, count) VALUES %s
+                ON CONFLICT (video_id, n, term) DO UPDATE SET count = EXCLUDED.count
+            """,
+            rows,
+            page_size=5000,
+        )
+        execute_values(
+            cursor,
+            """
+                INSERT INTO term_totals (n, term, count) VALUES %s
+                ON CONFLICT (n, term) DO UPDATE SET count = term_totals.count + EXCLUDED.count
+            """,
+            [(n, term, count) for term, count in totals.items()],
+            page_size=5000,
+        )
+        conn.commit()
+        return len(claimed)
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def count_new_videos(n=1, workers=None, videos_per_chunk=20):
+    """Count n-grams for videos not yet processed, using every core.
+
+    Lines stream through a named cursor and whole videos are tokenized in a
+    process pool. At most two chunks per worker are in flight, so memory
+    stays flat however large the corpus is.
+    """
+    read_conn = connection()
+    write_conn = connection()
+    if not read_conn or not write_conn:
+        return 0
+
+    workers = workers or os.cpu_count()
+    cursor = read_conn.cursor(name="term_count_lines")
+    cursor.itersize = 5000
+    processed = 0
+    try:
+        cursor.execute(NEW_LINES_SQL, (n,))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = set()
+            for chunk in iter_video_chunks(cursor, videos_per_chunk):
+                in_flight.add(pool.submit(count_terms, chunk, n))
+                if len(in_flight) >= workers * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        processed += store_term_counts(write_conn, n, future.result())
+            for future in as_completed(in_flight):
+                processed += store_term_counts(write_conn, n, future.result())
+    finally:
+        cursor.close()
+        read_conn.close()
+        write_conn.close()
+    return processed
+
+
+def show_top_words(limit=20, n=1, workers=None):
+    """Bring term counts up to date, then print the most common terms"""
+    processed = count_new_videos(n=n, workers=workers)
+    print(f"Counted terms for {processed} new videos")
+
+    conn = connection()
+    if not conn:
+        return
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT term, count FROM term_totals WHERE n = %s ORDER BY count DESC, term LIMIT %s",
+            (n, limit),
+        )
+        for rank, (term, count) in enumerate(cursor.fetchall(), start=1):
+            print(f"{rank:>4}. {term:<40} {count}")
     finally:
         cursor.close()
         conn.close()
@@ -76,14 +373,41 @@ def show_stats():
 def main():
     parser = argparse.ArgumentParser(description="Query YouTube transcripts DB")
     parser.add_argument("--search", type=str, help="Search transcripts by keyword")
+    parser.add_argument("--ranked", action="store_true",
+                        help="Order search results by relevance and show highlighted snippets")
+    parser.add_argument("--limit", type=int, help="Maximum number of search results")
+    parser.add_argument("--offset", type=int, default=0, help="Skip this many search results")
+    parser.add_argument("--phrase", type=str,
+                        help="Find the moments an exact phrase is said, across caption lines")
+    parser.add_argument("--within", type=int, metavar="N",
+                        help="With --phrase: match the words in any order within N words")
+    parser.add_argument("--index-phrases", action="store_true",
+                        help="Add videos stored before the phrase index existed")
     parser.add_argument("--stats", action="store_true", help="Show database statistics")
+    parser.add_argument("--rebuild-stats", action="store_true",
+                        help="Recompute the stats rollup from scratch in parallel chunks")
+    parser.add_argument("--top-words", type=int, metavar="N",
+                        help="Show the N most common words (stop words excluded)")
+    parser.add_argument("--ngram", type=int, choices=[1, 2, 3], default=1,
+                        help="Count single words (1), bigrams (2) or trigrams (3)")
+    parser.add_argument("--workers", type=int,
+                        help="Parallel tokenizer processes / stats chunks (default: all cores)")
     args = parser.parse_args()
 
     if args.search:
-        search_transcripts(args.search)
+        search_transcripts(args.search, limit=args.limit, offset=args.offset, ranked=args.ranked)
+    if args.index_phrases:
+        print(f"Indexed phrases for {index_phrases()} videos")
+    if args.phrase:
+        search_phrase(args.phrase, within=args.within, limit=args.limit, offset=args.offset)
+    if args.rebuild_stats:
+        rebuild_stats(workers=args.workers)
     if args.stats:
         show_stats()
-    if not args.search and not args.stats:
+    if args.top_words:
+        show_top_words(limit=args.top_words, n=args.ngram, workers=args.workers)
+    if not (args.search or args.phrase or args.index_phrases or args.stats
+            or args.rebuild_stats or args.top_words):
         parser.print_help()
 
 
@@ -0,0 +1,225 @@
+"""Load test: do requests queue behind slow transcript downloads?
+
+Serves the app with gunicorn twice against ``scripts.fake_youtube`` with a
+high latency: once with sync WSGI workers (``transcripts_project.wsgi``,
+the old Procfile) and once with uvicorn ASGI workers
+(``transcripts_project.asgi``, the current one), with the same number of
+workers. For each, ``--slow`` concurrent
+``POST /api/videos/{id}/fetch_transcript/`` calls are started and, while
+they are in flight, ``--fast`` ``GET /api/playlists/{id}/status/`` calls
+are timed. Under sync workers the status calls wait for a worker to finish
+a download; under ASGI they should answer in milliseconds.
+
+    python -m scripts.benchmark_asgi --slow 8 --fast 40 --latency-ms 1000 \\
+        --output scripts/benchmark_results/asgi.json
+
+Use a migrated scratch database. Rows created for the run are deleted
+afterwards. ``--serve`` is the entry point of the server subprocesses.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from scripts.benchmark_ingest import git_revision, percentile_ms
+from scripts.fake_youtube import FakeYouTube, patch_transcript_api
+
+MODES = {
+    "wsgi": ("transcripts_project.wsgi", "sync"),
+    "asgi": ("transcripts_project.asgi", "uvicorn_worker.UvicornWorker"),
+}
+
+
+def serve(mode, fake_url, bind, workers):
+    """Run gunicorn in this process, with transcript requests going to the fake server."""
+    from gunicorn.app.base import BaseApplication
+
+    module, worker_class = MODES[mode]
+    # Patched before the workers fork, so each of them inherits it
+    patch_transcript_api(fake_url)
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", [bind])
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", worker_class)
+            self.cfg.set("timeout", 300)
+            self.cfg.set("loglevel", "warning")
+
+        def load(self):
+            __import__(module)
+            return sys.modules[module].application
+
+    Server().run()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, fake_url, workers):
+    port = free_port()
+    cache_dir = tempfile.mkdtemp(prefix="transcript-cache-")
+    env = dict(os.environ, TRANSCRIPT_CACHE_DIR=cache_dir)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "scripts.benchmark_asgi", "--serve", mode, "--fake-url", fake_url,
+         "--bind", f"127.0.0.1:{port}", "--workers", str(workers)],
+        env=env,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+def wait_until_up(base_url, path, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(base_url + path, timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not come up")
+
+
+def timed(method, url, timeout):
+    started = time.perf_counter()
+    try:
+        status = requests.request(method, url, timeout=timeout).status_code
+    except requests.RequestException as e:
+        status = type(e).__name__
+    return time.perf_counter() - started, status
+
+
+def load(base_url, video_pks, job_pk, fast, fast_concurrency, fast_delay, timeout):
+    """Start the slow calls, then time the fast ones while those are in flight."""
+    slow_pool = ThreadPoolExecutor(max_workers=len(video_pks))
+    started = time.perf_counter()
+    slow = [
+        slow_pool.submit(timed, "POST", f"{base_url}/api/videos/{pk}/fetch_transcript/", timeout)
+        for pk in video_pks
+    ]
+    time.sleep(fast_delay)
+    with ThreadPoolExecutor(max_workers=fast_concurrency) as pool:
+        quick = list(pool.map(
+            lambda _: timed("GET", f"{base_url}/api/playlists/{job_pk}/status/", timeout), range(fast)
+        ))
+    slow = [future.result() for future in slow]
+    slow_pool.shutdown()
+    wall = time.perf_counter() - started
+
+    def summary(results):
+        seconds = sorted(elapsed for elapsed, _ in results)
+        statuses = {}
+        for _, status in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return {
+            "requests": len(results),
+            "statuses": statuses,
+            "p50_ms": percentile_ms(seconds, 0.50),
+            "p99_ms": percentile_ms(seconds, 0.99),
+            "max_ms": round(seconds[-1] * 1000, 2) if seconds else None,
+        }
+
+    return {"seconds": round(wall, 3), "fetch_transcript": summary(slow), "job_status": summary(quick)}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare WSGI and ASGI serving under slow transcript fetches")
+    parser.add_argument("--slow", type=int, default=8, help="Concurrent fetch_transcript calls")
+    parser.add_argument("--fast", type=int, default=40, help="job status calls made meanwhile")
+    parser.add_argument("--fast-concurrency", type=int, default=4, help="Parallel job status callers")
+    parser.add_argument("--latency-ms", type=float, default=1000.0,
+                        help="Delay of every fake YouTube response (a download makes three)")
+    parser.add_argument("--lines", type=int, default=300, help="Caption lines per transcript")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers in both modes")
+    parser.add_argument("--modes", default="wsgi,asgi", help="Comma-separated modes to run")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--output", default="benchmark_asgi.json", help="Where to write the JSON results")
+    parser.add_argument("--serve", choices=list(MODES), help=argparse.SUPPRESS)
+    parser.add_argument("--fake-url", help=argparse.SUPPRESS)
+    parser.add_argument("--bind", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.serve:
+        serve(args.serve, args.fake_url, args.bind, args.workers)
+        return
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    run_id = f"bench{uuid.uuid4().hex[:8]}"
+    fake = FakeYouTube(playlist_size=1, lines=args.lines, latency_ms=args.latency_ms).start()
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "transcripts_project.settings")
+    import django
+    django.setup()
+    from transcripts.models import PlaylistSearchJob, VideoRecord
+
+    job = PlaylistSearchJob.objects.create(playlist_id=f"{run_id}-playlist", status="completed")
+    results = {}
+    try:
+        for mode in modes:
+            videos = VideoRecord.objects.bulk_create([
+                VideoRecord(video_id=f"{run_id}-{mode}-{index:03d}", title=f"Video {index}",
+                            channel_name="Benchmark", duration=0)
+                for index in range(args.slow)
+            ])
+            process, base_url = start_server(mode, fake.url, args.workers)
+            try:
+                wait_until_up(base_url, f"/api/playlists/{job.pk}/status/")
+                results[mode] = load(
+                    base_url, [video.pk for video in videos], job.pk,
+                    args.fast, args.fast_concurrency, min(args.latency_ms / 4000, 0.5), args.timeout,
+                )
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+    finally:
+        VideoRecord.objects.filter(video_id__startswith=run_id).delete()
+        job.delete()
+        fake.stop()
+
+    report = {
+        "benchmark": "asgi",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "config": {
+            "slow": args.slow,
+            "fast": args.fast,
+            "fast_concurrency": args.fast_concurrency,
+            "latency_ms": args.latency_ms,
+            "workers": args.workers,
+        },
+        "modes": results,
+    }
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+    for mode, result in results.items():
+        quick, slow = result["job_status"], result["fetch_transcript"]
+        print(
+            f"{mode:5} job status p50 {quick['p50_ms']} ms  p99 {quick['p99_ms']} ms  "
+            f"fetch_transcript max {slow['max_ms']} ms  {slow['statuses']}"
+        )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
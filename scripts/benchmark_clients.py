@@ -0,0 +1,124 @@
+"""Micro-benchmark: a new YouTube client per call vs the shared client pool.
+
+Serves a canned ``playlists.list`` response from a local keep-alive HTTP
+server so only client-side overhead is measured: building the client,
+parsing the discovery document and opening a connection. The server counts
+the TCP connections each strategy opens. Against googleapis.com every new
+connection also pays a TLS handshake, so real savings are larger.
+
+    python -m scripts.benchmark_clients --calls 500
+"""
+import argparse
+import json
+import socket
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from googleapiclient.discovery import build
+
+from transcripts.youtube import ClientPool
+
+RESPONSE = json.dumps({
+    "kind": "youtube#playlistListResponse",
+    "etag": "bench",
+    "items": [{"id": "PLbench", "snippet": {"title": "Benchmark"}, "contentDetails": {"itemCount": 0}}],
+}).encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections open between requests
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; without TCP_NODELAY,
+        # Nagle plus delayed ACKs would add ~40 ms to every keep-alive response.
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        Handler.connections += 1
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+def per_call_client(endpoint):
+    """What every caller did before the pool: build, call once, throw away."""
+    def call():
+        youtube = build("youtube", "v3", developerKey="bench", cache_discovery=False,
+                        client_options={"api_endpoint": endpoint})
+        return youtube.playlists().list(part="snippet", id="PLbench").execute()
+    return call
+
+
+def pooled_client(endpoint):
+    pool = ClientPool(api_endpoint=endpoint)
+
+    def call():
+        with pool.client("bench") as youtube:
+            return youtube.playlists().list(part="snippet", id="PLbench").execute()
+    return call
+
+
+def per_call_session(url):
+    """A new YouTubeTranscriptApi per fetch meant a new requests.Session"""
+    def call():
+        with requests.Session() as session:
+            return session.get(url).content
+    return call
+
+
+def shared_session(url):
+    session = requests.Session()
+
+    def call():
+        return session.get(url).content
+    return call
+
+
+def run(name, call, calls):
+    call()  # warm up imports and the first connection
+    before = Handler.connections
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(
+        f"{name:<26} median {statistics.median(timings) * 1000:7.3f} ms  "
+        f"p95 {timings[int(len(timings) * 0.95)] * 1000:7.3f} ms  "
+        f"total {sum(timings):6.2f} s  connections {Handler.connections - before}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-call and pooled YouTube clients")
+    parser.add_argument("--calls", type=int, default=500, help="Calls per strategy (default: 500)")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_port}"
+
+    try:
+        print(f"Data API client, {args.calls} playlists.list calls:")
+        run("build() per call", per_call_client(endpoint), args.calls)
+        run("ClientPool", pooled_client(endpoint), args.calls)
+        print(f"\nTranscript session, {args.calls} GETs:")
+        run("new Session per fetch", per_call_session(endpoint + "/watch"), args.calls)
+        run("reused Session", shared_session(endpoint + "/watch"), args.calls)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
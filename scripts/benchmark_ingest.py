@@ -0,0 +1,379 @@
+"""Offline end-to-end ingestion benchmark against a fake YouTube.
+
+Starts ``scripts.fake_youtube`` and runs three stages against the local
+Postgres configured by ``DB_*``:
+
+    search_playlist    POST /api/playlists/search_playlist/, then the queue
+                       worker ingests the job (playlist, pages, videos.list)
+    fetch_transcripts  POST /api/playlists/{id}/fetch_transcripts/ for that job
+    script             scripts.transcript_download_db.main on a second playlist
+
+Each stage reports videos/second, database round-trips (every execute,
+COPY and server-side FETCH on any psycopg2 connection), p50/p99 latency of
+the HTTP requests made to the fake server and peak RSS. Results are written
+as JSON so they can be committed and compared in review:
+
+    python -m scripts.benchmark_ingest --videos 500 --latency-ms 20 \\
+        --output scripts/benchmark_results/ingest.json
+
+Use a scratch database that has been migrated (``manage.py migrate``) and
+initialised (``python -m scripts.init_db``). The harness refuses to run if
+other jobs are waiting in the queue, since its worker would pick them up.
+Everything it writes is deleted afterwards unless ``--keep`` is given.
+"""
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import psycopg2
+import psycopg2.extensions
+
+from scripts.fake_youtube import FakeYouTube
+
+BENCHMARK_KEY = "benchmark-fake-key"
+
+
+class RoundTrips:
+    """Counts statements sent to Postgres by every psycopg2 connection."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def add(self, n=1):
+        with self.lock:
+            self.count += n
+
+
+round_trips = RoundTrips()
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        round_trips.add()
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        round_trips.add(len(vars_list))  # psycopg2 sends one statement per row
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        round_trips.add()
+        return super().copy_expert(sql, file, size)
+
+    # A named (server-side) cursor goes back to the server on every fetch
+    def fetchone(self):
+        if self.name:
+            round_trips.add()
+        return super().fetchone()
+
+    def fetchmany(self, size=None):
+        if self.name:
+            round_trips.add()
+        return super().fetchmany(size) if size is not None else super().fetchmany()
+
+    def fetchall(self):
+        if self.name:
+            round_trips.add()
+        return super().fetchall()
+
+
+@functools.lru_cache(maxsize=None)
+def counting_factory(cursor_factory):
+    if cursor_factory in (None, psycopg2.extensions.cursor):
+        return CountingCursor
+    return type("Counting" + cursor_factory.__name__, (CountingCursor, cursor_factory), {})
+
+
+def install_round_trip_counter():
+    # Django passes its own cursor_factory, so wrap whatever is asked for
+    connect = psycopg2.connect
+
+    @functools.wraps(connect)
+    def counting_connect(*args, **kwargs):
+        kwargs["cursor_factory"] = counting_factory(kwargs.get("cursor_factory"))
+        return connect(*args, **kwargs)
+
+    psycopg2.connect = counting_connect
+
+
+class Stage:
+    """Wall clock, round-trips, HTTP latencies and peak RSS for one stage."""
+
+    current = None
+
+    def __init__(self, name, fake):
+        self.name = name
+        self.fake = fake
+        self.latencies = []
+        self.lock = threading.Lock()
+        self.peak_rss = 0
+        self.sampling = threading.Event()
+
+    def record(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def _sample_rss(self):
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        while not self.sampling.wait(0.05):
+            self.peak_rss = max(self.peak_rss, current_rss(page_size))
+
+    def __enter__(self):
+        Stage.current = self
+        self.requests_before = self.fake.stats()
+        self.round_trips_before = round_trips.count
+        self.peak_rss = current_rss()
+        self.sampler = threading.Thread(target=self._sample_rss, daemon=True)
+        self.sampler.start()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+        self.sampling.set()
+        self.sampler.join()
+        self.peak_rss = max(self.peak_rss, current_rss())
+        Stage.current = None
+        return False
+
+    def result(self, videos, **extra):
+        latencies = sorted(self.latencies)
+        after = self.fake.stats()
+        before = self.requests_before
+        return {
+            "videos": videos,
+            "seconds": round(self.seconds, 3),
+            "videos_per_second": round(videos / self.seconds, 2) if self.seconds else None,
+            "db_round_trips": round_trips.count - self.round_trips_before,
+            "db_round_trips_per_video": (
+                round((round_trips.count - self.round_trips_before) / videos, 2) if videos else None
+            ),
+            "http_requests": len(latencies),
+            "http_p50_ms": percentile_ms(latencies, 0.50),
+            "http_p99_ms": percentile_ms(latencies, 0.99),
+            "injected_errors": sum(after["injected_errors"].values())
+            - sum(before["injected_errors"].values()),
+            "peak_rss_mb": round(self.peak_rss / 1024 / 1024, 1),
+            **extra,
+        }
+
+
+def current_rss(page_size=None):
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * (page_size or os.sysconf("SC_PAGE_SIZE"))
+    except OSError:
+        # Not Linux: fall back to the process-wide peak (KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile_ms(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return round(sorted_values[index] * 1000, 2)
+
+
+def time_requests(owner, method_name):
+    """Record the latency of every call to ``owner.method_name`` in the current stage."""
+    method = getattr(owner, method_name)
+
+    @functools.wraps(method)
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            stage = Stage.current
+            if stage is not None:
+                stage.record(time.perf_counter() - started)
+
+    setattr(owner, method_name, timed)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion end to end against a fake YouTube")
+    parser.add_argument("--videos", type=int, default=200, help="Videos per playlist (default: 200)")
+    parser.add_argument("--lines", type=int, default=300, help="Caption lines per transcript (default: 300)")
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="Delay added to every fake response")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of fake responses that are 500s (retried by the app)")
+    parser.add_argument("--workers", type=int, default=8, help="Transcript fetch workers (default: 8)")
+    parser.add_argument("--rps", type=float, default=0, help="Transcript requests/second cap (0 = none)")
+    parser.add_argument("--storage", choices=["rows", "packed"], default="rows",
+                        help="Transcript storage used by the script stage")
+    parser.add_argument("--stages", default="search_playlist,fetch_transcripts,script",
+                        help="Comma-separated stages to run")
+    parser.add_argument("--output", default="benchmark_ingest.json", help="Where to write the JSON results")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark's rows in the database")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    run_id = f"bench{uuid.uuid4().hex[:8]}"
+
+    fake = FakeYouTube(args.videos, args.lines, args.latency_ms, args.error_rate).start()
+    fake.patch_transcript_api()
+
+    # Everything below must see the fake server, a key of its own, unlimited
+    # quota and an empty transcript cache.
+    os.environ["YOUTUBE_API_ENDPOINT"] = fake.url
+    os.environ["GOOGLE_DEVELOPER_API_KEYS"] = BENCHMARK_KEY
+    os.environ["YOUTUBE_DAILY_QUOTA"] = str(10 ** 9)
+    os.environ["YOUTUBE_QUOTA_BURST"] = str(10 ** 9)
+    cache_dir = tempfile.TemporaryDirectory(prefix="transcript-cache-")
+    os.environ["TRANSCRIPT_CACHE_DIR"] = cache_dir.name
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "transcripts_project.settings")
+    install_round_trip_counter()
+
+    import django
+    django.setup()
+
+    import httplib2
+    import requests
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test import Client
+
+    from transcripts.models import ApiKeyQuota, ApiQuotaLedger, PlaylistSearchJob, VideoRecord
+    from transcripts.quota import key_label
+
+    time_requests(httplib2.Http, "request")
+    time_requests(requests.Session, "request")
+
+    if PlaylistSearchJob.objects.filter(status="pending").exists():
+        sys.exit("Other jobs are pending in this database; run the benchmark on a scratch database.")
+
+    client = Client()
+    api_playlist = f"{run_id}-api"
+    script_playlist = f"{run_id}-script"
+    results = {}
+    job = None
+    try:
+        if "search_playlist" in stages:
+            with Stage("search_playlist", fake) as stage:
+                response = client.post(
+                    "/api/playlists/search_playlist/", {"playlist_id": api_playlist},
+                    content_type="application/json",
+                )
+                assert response.status_code == 202, response.content
+                call_command("run_worker", "--once", stdout=io.StringIO(), stderr=io.StringIO())
+            job = PlaylistSearchJob.objects.get(playlist_id=api_playlist)
+            results["search_playlist"] = stage.result(job.videos.count(), job_status=job.status)
+
+        if "fetch_transcripts" in stages and job is not None:
+            with Stage("fetch_transcripts", fake) as stage:
+                response = client.post(
+                    f"/api/playlists/{job.pk}/fetch_transcripts/",
+                    {"workers": args.workers, "rps": args.rps},
+                    content_type="application/json",
+                )
+            report = response.json()
+            per_video = sorted(r["elapsed"] for r in report["results"])
+            results["fetch_transcripts"] = stage.result(
+                report["stats"]["videos"],
+                fetched=report["fetched"],
+                failed=report["failed"],
+                workers=args.workers,
+                per_video_p50_ms=percentile_ms(per_video, 0.50),
+                per_video_p99_ms=percentile_ms(per_video, 0.99),
+            )
+
+        if "script" in stages:
+            from scripts import transcript_download_db
+
+            argv = sys.argv
+            sys.argv = [
+                "transcript_download_db", "--playlist", script_playlist,
+                "--fetch-workers", str(args.workers), "--storage", args.storage,
+            ]
+            try:
+                with Stage("script", fake) as stage, contextlib.redirect_stdout(io.StringIO()) as output:
+                    transcript_download_db.main()
+            finally:
+                sys.argv = argv
+            stored = [line for line in output.getvalue().splitlines() if "Processing successful" in line]
+            results["script"] = stage.result(args.videos, storage=args.storage, summary=stored[-1] if stored else None)
+    finally:
+        if not args.keep:
+            PlaylistSearchJob.objects.filter(playlist_id__startswith=run_id).delete()
+            VideoRecord.objects.filter(video_id__startswith=run_id).delete()
+            with connection.cursor() as cursor:
+                # Phrase index rows reference videos; give back their term counts
+                cursor.execute(
+                    """
+                        WITH gone AS (DELETE FROM phrase_postings WHERE video_id LIKE %s RETURNING term)
+                        UPDATE phrase_terms t SET videos = t.videos - g.videos
+                        FROM (SELECT term, count(*) AS videos FROM gone GROUP BY term) g
+                        WHERE t.term = g.term
+                    """,
+                    [run_id + "%"],
+                )
+                for table in ("phrase_segments", "transcripts", "transcripts_packed", "videos"):
+                    cursor.execute(f"DELETE FROM {table} WHERE video_id LIKE %s", [run_id + "%"])
+            label = key_label(BENCHMARK_KEY)
+            ApiKeyQuota.objects.filter(label=label).delete()
+            ApiQuotaLedger.objects.filter(label=label).delete()
+        fake.stop()
+        cache_dir.cleanup()
+
+    report = {
+        "benchmark": "ingest",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "config": {
+            "videos": args.videos,
+            "lines": args.lines,
+            "latency_ms": args.latency_ms,
+            "error_rate": args.error_rate,
+            "workers": args.workers,
+            "rps": args.rps,
+        },
+        "fake_server": fake.stats(),
+        "stages": results,
+    }
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+    for name, result in results.items():
+        print(
+            f"{name:18} {result['videos_per_second']:>8} videos/s  "
+            f"{result['db_round_trips']:>6} round-trips  "
+            f"p50 {result['http_p50_ms']} ms  p99 {result['http_p99_ms']} ms  "
+            f"peak RSS {result['peak_rss_mb']} MB"
+        )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
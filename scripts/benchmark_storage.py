@@ -0,0 +1,184 @@
+"""Benchmark: one row per caption line vs one packed row per video.
+
+Loads the same synthetic transcripts into scratch copies of ``transcripts``
+and ``transcripts_packed``, then reports on-disk size (heap, TOAST and
+indexes) and how fast each format reads a whole transcript, a single line
+at a given time, and every transcript in turn. The scratch tables are
+dropped afterwards.
+
+    python -m scripts.benchmark_storage --videos 200 --lines 800
+"""
+import argparse
+import csv
+import io
+import random
+import time
+
+import psycopg2
+
+from transcripts.db import connection
+from transcripts.packed import PackedTranscript, line_at, pack
+
+WORDS = (
+    "the of and to a in is that it for you this we on with as are be have at or "
+    "from one but not what all were when your can there use an each which she do "
+    "how their if will up other about out many then them these so some her would "
+    "make like him into time has look two more write go see number way could people "
+    "function variable memory pointer array string loop compile python lecture problem"
+).split()
+
+SCHEMA_SQL = """
+    CREATE TABLE bench_transcript_rows (
+        id SERIAL PRIMARY KEY,
+        video_id VARCHAR(255) NOT NULL,
+        text TEXT NOT NULL,
+        start_time FLOAT,
+        duration FLOAT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX bench_transcript_rows_video_id_idx ON bench_transcript_rows (video_id, id);
+    CREATE TABLE bench_transcript_packed (
+        video_id VARCHAR(255) PRIMARY KEY,
+        segments INT NOT NULL,
+        data BYTEA NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    ALTER TABLE bench_transcript_packed ALTER COLUMN data SET STORAGE EXTERNAL;
+"""
+
+DROP_SQL = "DROP TABLE IF EXISTS bench_transcript_rows, bench_transcript_packed"
+
+SIZE_SQL = """
+    SELECT pg_relation_size(%(table)s::regclass),
+           pg_total_relation_size(%(table)s::regclass)
+               - pg_relation_size(%(table)s::regclass)
+               - pg_indexes_size(%(table)s::regclass),
+           pg_indexes_size(%(table)s::regclass),
+           pg_total_relation_size(%(table)s::regclass)
+"""
+
+
+def synthetic_transcript(lines):
+    start = random.uniform(0, 5)
+    segments = []
+    for _ in range(lines):
+        duration = round(random.uniform(1.5, 6), 3)
+        text = " ".join(random.choice(WORDS) for _ in range(random.randint(3, 9)))
+        segments.append({"text": text, "start": round(start, 3), "duration": duration})
+        start += duration
+    return segments
+
+
+def load(conn, transcripts):
+    cursor = conn.cursor()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for video_id, segments in transcripts.items():
+        writer.writerows((video_id, s["text"], s["start"], s["duration"]) for s in segments)
+    buffer.seek(0)
+    cursor.copy_expert(
+        "COPY bench_transcript_rows (video_id, text, start_time, duration) FROM STDIN WITH (FORMAT csv)",
+        buffer,
+    )
+    cursor.executemany(
+        "INSERT INTO bench_transcript_packed (video_id, segments, data) VALUES (%s, %s, %s)",
+        [(video_id, len(segments), psycopg2.Binary(pack(segments)))
+         for video_id, segments in transcripts.items()],
+    )
+    conn.commit()
+    conn.autocommit = True
+    cursor.execute("VACUUM ANALYZE bench_transcript_rows")
+    cursor.execute("VACUUM ANALYZE bench_transcript_packed")
+    conn.autocommit = False
+    cursor.close()
+
+
+def read_rows(cursor, video_id):
+    cursor.execute(
+        "SELECT start_time, duration, text FROM bench_transcript_rows WHERE video_id = %s ORDER BY id",
+        [video_id],
+    )
+    return [{"text": text, "start": start, "duration": duration}
+            for start, duration, text in cursor.fetchall()]
+
+
+def read_packed(cursor, video_id):
+    cursor.execute("SELECT data FROM bench_transcript_packed WHERE video_id = %s", [video_id])
+    return PackedTranscript(cursor.fetchone()[0])
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items) * 1000
+
+
+def mb(size):
+    return f"{size / 1024 / 1024:8.2f} MB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare row-per-line and packed transcript storage")
+    parser.add_argument("--videos", type=int, default=200, help="Synthetic videos (default: 200)")
+    parser.add_argument("--lines", type=int, default=800, help="Caption lines per video (default: 800)")
+    parser.add_argument("--reads", type=int, default=200, help="Random single-video reads per test")
+    args = parser.parse_args()
+
+    random.seed(42)
+    transcripts = {f"bench{i:05d}": synthetic_transcript(args.lines) for i in range(args.videos)}
+
+    conn = connection()
+    if not conn:
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute(DROP_SQL)
+        cursor.execute(SCHEMA_SQL)
+        conn.commit()
+        load(conn, transcripts)
+
+        print(f"{args.videos} videos x {args.lines} lines = {args.videos * args.lines} lines\n")
+        print(f"{'':10}{'heap':>12}{'toast':>12}{'indexes':>12}{'total':>12}")
+        totals = {}
+        for name, table in (("rows", "bench_transcript_rows"), ("packed", "bench_transcript_packed")):
+            cursor.execute(SIZE_SQL, {"table": table})
+            heap, toast, indexes, total = cursor.fetchone()
+            totals[name] = total
+            print(f"{name:10}{mb(heap):>12}{mb(toast):>12}{mb(indexes):>12}{mb(total):>12}")
+        print(f"packed is {totals['rows'] / totals['packed']:.1f}x smaller\n")
+
+        sample = random.choices(list(transcripts), k=args.reads)
+        probes = [(video_id, random.uniform(0, 600)) for video_id in sample]
+        results = [
+            ("whole transcript, rows", timed(lambda v: read_rows(cursor, v), sample)),
+            ("whole transcript, packed", timed(lambda v: list(read_packed(cursor, v)), sample)),
+            ("line at time, rows", timed(lambda p: line_at(read_rows(cursor, p[0]), p[1]), probes)),
+            ("line at time, packed", timed(lambda p: line_at(read_packed(cursor, p[0]), p[1]), probes)),
+        ]
+        for label, ms in results:
+            print(f"{label:28} {ms:8.3f} ms per video")
+
+        start = time.perf_counter()
+        for video_id in transcripts:
+            read_rows(cursor, video_id)
+        rows_scan = time.perf_counter() - start
+        start = time.perf_counter()
+        for video_id in transcripts:
+            list(read_packed(cursor, video_id))
+        packed_scan = time.perf_counter() - start
+        print(f"\nevery transcript, rows      {rows_scan:8.2f} s")
+        print(f"every transcript, packed    {packed_scan:8.2f} s")
+
+        # Decoded lines must match what was stored
+        assert list(read_packed(cursor, sample[0])) == transcripts[sample[0]]
+    finally:
+        conn.rollback()
+        cursor.execute(DROP_SQL)
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from functools import partial
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from scripts.analyze_common_words import iter_video_chunks
+from transcripts import enrichment
+from transcripts.db import connection
+
+NEW_LINES_SQL = """
+    SELECT t.video_id, t.text
+    FROM transcripts t
+    WHERE NOT EXISTS (SELECT 1 FROM transcript_enrichments e WHERE e.video_id = t.video_id)
+    ORDER BY t.video_id, t.id
+"""
+
+NEW_PACKED_SQL = """
+    SELECT p.video_id, p.data
+    FROM transcripts_packed p
+    WHERE NOT EXISTS (SELECT 1 FROM transcript_enrichments e WHERE e.video_id = p.video_id)
+    ORDER BY p.video_id
+"""
+
+# Only one run may fold its document frequencies into enrichment_term_df
+ENRICH_LOCK_ID = 0x656E72
+
+STORE_ENRICHMENTS_SQL = """
+    INSERT INTO transcript_enrichments (video_id, summary, keywords, sentiment, language) VALUES %s
+    ON CONFLICT (video_id) DO NOTHING
+"""
+
+STORE_TERM_DF_SQL = """
+    INSERT INTO enrichment_term_df (term, documents) VALUES %s
+    ON CONFLICT (term) DO UPDATE SET documents = enrichment_term_df.documents + EXCLUDED.documents
+"""
+
+
+def iter_packed_chunks(cursor, videos_per_chunk):
+    """Group streamed (video_id, blob) rows into chunks"""
+    chunk = []
+    for video_id, data in cursor:
+        chunk.append((video_id, bytes(data)))
+        if len(chunk) >= videos_per_chunk:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def load_corpus_stats(conn):
+    """Videos enriched so far and the number of them each term occurs in"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM transcript_enrichments")
+        doc_count = cursor.fetchone()[0]
+        cursor.execute("SELECT term, documents FROM enrichment_term_df")
+        doc_freq = dict(cursor.fetchall())
+        conn.commit()
+        return doc_count, doc_freq
+    finally:
+        cursor.close()
+
+
+def store_enrichments(conn, result):
+    """Write one chunk's enrichments and fold its document frequencies in"""
+    rows, doc_freq = result
+    cursor = conn.cursor()
+    try:
+        execute_values(cursor, STORE_ENRICHMENTS_SQL, rows, page_size=1000)
+        execute_values(cursor, STORE_TERM_DF_SQL, list(doc_freq.items()), page_size=5000)
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(rows)
+
+
+def enrich_new_videos(workers=None, videos_per_chunk=20, keywords=enrichment.KEYWORDS,
+                      summary_sentences=enrichment.SUMMARY_SENTENCES):
+    """Enrich every video that has a transcript but no enrichment, using every core.
+
+    Both storage formats are read through named cursors and whole videos are
+    enriched in a process pool; at most two chunks per worker are in flight.
+    Each chunk is committed on its own, so an interrupted run loses at most
+    the chunks in flight and the next run picks up the rest.
+    """
+    read_conn = connection()
+    write_conn = connection()
+    if not read_conn or not write_conn:
+        return 0
+
+    workers = workers or os.cpu_count()
+    enrich = partial(enrichment.enrich_chunk, keywords=keywords, summary_sentences=summary_sentences)
+    processed = 0
+    lock_cursor = write_conn.cursor()
+    try:
+        lock_cursor.execute("SELECT pg_try_advisory_lock(%s)", (ENRICH_LOCK_ID,))
+        if not lock_cursor.fetchone()[0]:
+            print("Another enrichment run is in progress")
+            return 0
+        doc_count, doc_freq = load_corpus_stats(write_conn)
+
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=enrichment.init_worker, initargs=(doc_count, doc_freq)
+        ) as pool:
+            sources = (
+                ("enrich_lines", NEW_LINES_SQL, iter_video_chunks),
+                ("enrich_packed", NEW_PACKED_SQL, iter_packed_chunks),
+            )
+            for name, sql, chunks in sources:
+                cursor = read_conn.cursor(name=name)
+                cursor.itersize = 5000 if chunks is iter_video_chunks else videos_per_chunk
+                try:
+                    cursor.execute(sql)
+                    in_flight = set()
+                    for chunk in chunks(cursor, videos_per_chunk):
+                        in_flight.add(pool.submit(enrich, chunk))
+                        if len(in_flight) >= workers * 2:
+                            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                processed += store_enrichments(write_conn, future.result())
+                    for future in as_completed(in_flight):
+                        processed += store_enrichments(write_conn, future.result())
+                finally:
+                    cursor.close()
+                    read_conn.commit()
+    finally:
+        lock_cursor.execute("SELECT pg_advisory_unlock_all()")
+        lock_cursor.close()
+        write_conn.commit()
+        read_conn.close()
+        write_conn.close()
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Add keywords, a summary, sentiment and language to newly ingested videos")
+    parser.add_argument("--workers", type=int, help="Parallel enrichment processes (default: all cores)")
+    parser.add_argument("--videos-per-chunk", type=int, default=20,
+                        help="Videos enriched together in one task")
+    parser.add_argument("--keywords", type=int, default=enrichment.KEYWORDS,
+                        help="Keywords stored per video")
+    parser.add_argument("--summary-sentences", type=int, default=enrichment.SUMMARY_SENTENCES,
+                        help="Sentences in each summary")
+    parser.add_argument("--follow", type=int, metavar="SECONDS",
+                        help="Keep running, checking for new videos every SECONDS")
+    args = parser.parse_args()
+
+    while True:
+        started = time.perf_counter()
+        processed = enrich_new_videos(
+            workers=args.workers,
+            videos_per_chunk=args.videos_per_chunk,
+            keywords=args.keywords,
+            summary_sentences=args.summary_sentences,
+        )
+        if processed or not args.follow:
+            elapsed = time.perf_counter() - started
+            print(f"Enriched {processed} videos in {elapsed:.1f}s")
+        if not args.follow:
+            break
+        time.sleep(args.follow)
+
+
+if __name__ == "__main__":
+    main()
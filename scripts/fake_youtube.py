@@ -0,0 +1,264 @@
+"""Local stand-in for the YouTube Data API and the transcript endpoints.
+
+Serves ``playlists.list``, ``playlistItems.list`` and ``videos.list`` under
+``/youtube/v3/`` (with ETags and ``If-None-Match``), plus the three requests
+``youtube-transcript-api`` makes per video: the watch page, the innertube
+player call and the timedtext XML. Every playlist id exists and holds
+``playlist_size`` videos with ids derived from the playlist id, so separate
+runs never collide. ``latency_ms`` delays every response and ``error_rate``
+answers that fraction of requests with a 500.
+
+Point the app at it with ``YOUTUBE_API_ENDPOINT=http://127.0.0.1:<port>/``
+and ``FakeYouTube.patch_transcript_api()``; ``scripts.benchmark_ingest``
+does both. Standalone:
+
+    python -m scripts.fake_youtube --port 8765 --playlist-size 500 --latency-ms 20
+"""
+import argparse
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+WORDS = (
+    "so today we are going to look at how memory works in a program and why the "
+    "pointer you get back from malloc matters when you write a loop over an array"
+).split()
+
+PAGE_SIZE = 50
+
+
+class FakeYouTube:
+    def __init__(self, playlist_size=200, lines=300, latency_ms=0.0, error_rate=0.0,
+                 host="127.0.0.1", port=0, seed=0):
+        self.playlist_size = playlist_size
+        self.lines = lines
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.errors = Counter()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self.lock:
+            return {"requests": dict(self.requests), "injected_errors": dict(self.errors)}
+
+    def patch_transcript_api(self):
+        """Send youtube-transcript-api's watch-page and player requests here."""
+        patch_transcript_api(self.url)
+
+    # Fake data
+
+    def video_ids(self, playlist_id):
+        return [f"{playlist_id}-{index:05d}" for index in range(self.playlist_size)]
+
+    def _should_fail(self):
+        with self.lock:
+            return self.error_rate and self.random.random() < self.error_rate
+
+    def playlists(self, params):
+        playlist_id = params.get("id", [""])[0]
+        return {
+            "kind": "youtube#playlistListResponse",
+            "items": [{
+                "id": playlist_id,
+                "snippet": {"title": f"Benchmark {playlist_id}", "channelTitle": "Fake Channel"},
+                "contentDetails": {"itemCount": self.playlist_size},
+            }],
+        }
+
+    def playlist_items(self, params):
+        playlist_id = params.get("playlistId", [""])[0]
+        size = min(int(params.get("maxResults", [PAGE_SIZE])[0]), PAGE_SIZE)
+        start = int(params.get("pageToken", ["0"])[0] or 0)
+        ids = self.video_ids(playlist_id)
+        response = {
+            "kind": "youtube#playlistItemListResponse",
+            "items": [
+                {
+                    "snippet": {
+                        "title": f"Video {video_id}",
+                        "channelTitle": "Fake Channel",
+                        "resourceId": {"kind": "youtube#video", "videoId": video_id},
+                    },
+                    "contentDetails": {"videoId": video_id},
+                }
+                for video_id in ids[start:start + size]
+            ],
+        }
+        if start + size < len(ids):
+            response["nextPageToken"] = str(start + size)
+        return response
+
+    def videos(self, params):
+        ids = [video_id for video_id in params.get("id", [""])[0].split(",") if video_id]
+        return {
+            "kind": "youtube#videoListResponse",
+            "items": [
+                {
+                    "id": video_id,
+                    "snippet": {"title": f"Lecture {video_id}", "channelTitle": "Fake Channel"},
+                    "contentDetails": {"duration": "PT1H2M3S"},
+                    "statistics": {"viewCount": str(len(video_id) * 1000)},
+                }
+                for video_id in ids
+            ],
+        }
+
+    def player(self, video_id):
+        return {
+            "playabilityStatus": {"status": "OK"},
+            "captions": {
+                "playerCaptionsTracklistRenderer": {
+                    "captionTracks": [{
+                        "baseUrl": f"{self.url}api/timedtext?v={video_id}&lang=en",
+                        "name": {"runs": [{"text": "English"}]},
+                        "languageCode": "en",
+                        "kind": "",
+                        "isTranslatable": False,
+                    }],
+                    "translationLanguages": [],
+                },
+            },
+        }
+
+    def timedtext(self, video_id):
+        rng = random.Random(video_id)
+        start = 0.0
+        lines = []
+        for _ in range(self.lines):
+            duration = round(rng.uniform(1.5, 5), 3)
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 9)))
+            lines.append(f'<text start="{start:.3f}" dur="{duration}">{escape(text)}</text>')
+            start += duration
+        return '<?xml version="1.0" encoding="utf-8" ?><transcript>' + "".join(lines) + "</transcript>"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def send(self, status, body, content_type="application/json", headers=()):
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body)
+                if isinstance(body, str):
+                    body = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def handle_one(self, method):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                body = b""
+                if method == "POST":
+                    body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                endpoint = url.path.rstrip("/").rsplit("/", 1)[-1] or "root"
+                with fake.lock:
+                    fake.requests[endpoint] += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if fake._should_fail():
+                    with fake.lock:
+                        fake.errors[endpoint] += 1
+                    return self.send(500, {"error": {"code": 500, "message": "Injected failure"}})
+
+                if url.path.startswith("/youtube/v3/"):
+                    handler = {
+                        "playlists": fake.playlists,
+                        "playlistItems": fake.playlist_items,
+                        "videos": fake.videos,
+                    }.get(endpoint)
+                    if handler is None:
+                        return self.send(404, {"error": {"code": 404, "message": "Unknown method"}})
+                    response = handler(params)
+                    etag = hashlib.md5(json.dumps(response, sort_keys=True).encode()).hexdigest()
+                    if self.headers.get("If-None-Match") == etag:
+                        return self.send(304, b"")
+                    response["etag"] = etag
+                    return self.send(200, response, headers=[("ETag", etag)])
+
+                if url.path == "/watch":
+                    video_id = params.get("v", [""])[0]
+                    html = f'<html><script>var ytcfg = {{"INNERTUBE_API_KEY": "fake-{video_id[:4]}"}};</script></html>'
+                    return self.send(200, html, "text/html")
+                if url.path == "/youtubei/v1/player":
+                    return self.send(200, fake.player(json.loads(body or b"{}").get("videoId", "")))
+                if url.path == "/api/timedtext":
+                    return self.send(200, fake.timedtext(params.get("v", [""])[0]), "text/xml")
+                return self.send(404, {"error": "not found"})
+
+            def do_GET(self):
+                self.handle_one("GET")
+
+            def do_POST(self):
+                self.handle_one("POST")
+
+        return Handler
+
+
+def patch_transcript_api(url):
+    """Send this process's youtube-transcript-api requests to a fake server at ``url``."""
+    from youtube_transcript_api import _transcripts
+
+    _transcripts.WATCH_URL = url + "watch?v={video_id}"
+    _transcripts.INNERTUBE_API_URL = url + "youtubei/v1/player?key={api_key}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake YouTube Data API and transcript endpoint")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--playlist-size", type=int, default=200, help="Videos in every playlist")
+    parser.add_argument("--lines", type=int, default=300, help="Caption lines per transcript")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    args = parser.parse_args()
+
+    fake = FakeYouTube(args.playlist_size, args.lines, args.latency_ms, args.error_rate, port=args.port)
+    print(f"Fake YouTube listening on {fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
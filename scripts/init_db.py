@@ -1,27 +1,20 @@
-import os
+import argparse
 import sys
 from dotenv import load_dotenv
 import psycopg2
 from psycopg2 import sql
 
-load_dotenv()
+from transcripts.db import connect
 
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME", "youtube_transcripts")
-DB_USER = os.getenv("DB_USER", "postgres")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
+load_dotenv()
 
 
 def connection():
+    """Unpooled and without a statement timeout: backfills and index builds
+    on a large table legitimately run for a long time.
+    """
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME,
-        )
+        conn = connect(statement_timeout=0)
         print("Database successfully connected")
         return conn
 
@@ -31,7 +24,252 @@ def connection():
         return None
 
 
-def init_database():
+def migrate_fulltext(conn, batch_size=10000):
+    """Add the full-text search column and GIN index to transcripts, online.
+
+    Adding a GENERATED ... STORED column would rewrite the whole table under
+    an exclusive lock, so instead the column is added empty (a catalog-only
+    change), kept current for new rows by a trigger, backfilled in short
+    id-range transactions and indexed with CREATE INDEX CONCURRENTLY. Ingestion
+    keeps running throughout. Safe to re-run.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("ALTER TABLE transcripts ADD COLUMN IF NOT EXISTS text_tsv tsvector")
+        cursor.execute("DROP TRIGGER IF EXISTS transcripts_text_tsv_update ON transcripts")
+        cursor.execute(
+            """
+            CREATE TRIGGER transcripts_text_tsv_update
+            BEFORE INSERT OR UPDATE OF text ON transcripts
+            FOR EACH ROW EXECUTE FUNCTION
+            tsvector_update_trigger(text_tsv, 'pg_catalog.english', text)
+        """
+        )
+        conn.commit()
+
+        # Backfill rows written before the trigger existed
+        cursor.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM transcripts")
+        low, high = cursor.fetchone()
+        backfilled = 0
+        for start in range(low, high + 1, batch_size):
+            cursor.execute(
+                """
+                UPDATE transcripts SET text_tsv = to_tsvector('english', text)
+                WHERE id >= %s AND id < %s AND text_tsv IS NULL
+            """,
+                (start, start + batch_size),
+            )
+            backfilled += cursor.rowcount
+            conn.commit()
+        if backfilled:
+            print(f"Backfilled search vectors for {backfilled} transcript lines")
+
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+        conn.autocommit = True
+        cursor.execute(
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS transcripts_text_tsv_idx
+            ON transcripts USING GIN (text_tsv)
+        """
+        )
+        print("Full-text search index ready")
+
+    except psycopg2.Error as e:
+        print("Error creating full-text search index:")
+        print(e)
+        conn.rollback()
+
+    finally:
+        conn.autocommit = False
+        cursor.close()
+
+
+STATS_ROLLUP_SQL = """
+CREATE TABLE IF NOT EXISTS transcript_stats (
+    -- 'global' (key ''), 'channel' (key channel_name) or 'video' (key video_id)
+    scope VARCHAR(10) NOT NULL,
+    key VARCHAR(255) NOT NULL,
+    videos BIGINT NOT NULL DEFAULT 0,
+    lines BIGINT NOT NULL DEFAULT 0,
+    chars BIGINT NOT NULL DEFAULT 0,
+    caption_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, key)
+);
+
+-- Adds per-video deltas (a jsonb array of video_id, channel_name, videos,
+-- lines, chars, seconds) to the video, channel and global rows.
+CREATE OR REPLACE FUNCTION transcript_stats_apply(deltas JSONB, sign INT)
+RETURNS VOID AS $$
+BEGIN
+    WITH per_video AS (
+        SELECT * FROM jsonb_to_recordset(deltas) AS d (
+            video_id TEXT, channel_name TEXT, videos BIGINT, lines BIGINT,
+            chars BIGINT, seconds DOUBLE PRECISION
+        )
+    ), rollup AS (
+        SELECT 'video' AS scope, video_id AS key, videos, lines, chars, seconds
+        FROM per_video
+        UNION ALL
+        SELECT 'channel', COALESCE(channel_name, ''),
+               SUM(videos), SUM(lines), SUM(chars), SUM(seconds)
+        FROM per_video GROUP BY COALESCE(channel_name, '')
+        UNION ALL
+        SELECT 'global', '', SUM(videos), SUM(lines), SUM(chars), SUM(seconds)
+        FROM per_video
+    )
+    INSERT INTO transcript_stats AS s (scope, key, videos, lines, chars, caption_seconds)
+    SELECT scope, key, sign * videos, sign * lines, sign * chars, sign * seconds
+    FROM rollup
+    WHERE videos IS NOT NULL
+    ORDER BY scope, key
+    ON CONFLICT (scope, key) DO UPDATE SET
+        videos = s.videos + EXCLUDED.videos,
+        lines = s.lines + EXCLUDED.lines,
+        chars = s.chars + EXCLUDED.chars,
+        caption_seconds = s.caption_seconds + EXCLUDED.caption_seconds;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables are only visible inside the trigger function itself, so
+-- each trigger aggregates its batch and hands the result to the helper.
+CREATE OR REPLACE FUNCTION transcript_stats_lines_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM transcript_stats_apply((
+            SELECT jsonb_agg(d) FROM (
+                SELECT r.video_id, v.channel_name, 0 AS videos, COUNT(*) AS lines,
+                       COALESCE(SUM(LENGTH(r.text)), 0) AS chars,
+                       COALESCE(SUM(r.duration), 0) AS seconds
+                FROM new_rows r LEFT JOIN videos v ON v.video_id = r.video_id
+                GROUP BY r.video_id, v.channel_name
+            ) d
+        ), 1);
+    ELSE
+        PERFORM transcript_stats_apply((
+            SELECT jsonb_agg(d) FROM (
+                SELECT r.video_id, v.channel_name, 0 AS videos, COUNT(*) AS lines,
+                       COALESCE(SUM(LENGTH(r.text)), 0) AS chars,
+                       COALESCE(SUM(r.duration), 0) AS seconds
+                FROM old_rows r LEFT JOIN videos v ON v.video_id = r.video_id
+                GROUP BY r.video_id, v.channel_name
+            ) d
+        ), -1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION transcript_stats_videos_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM transcript_stats_apply((
+            SELECT jsonb_agg(d) FROM (
+                SELECT video_id, channel_name, 1 AS videos, 0 AS lines, 0 AS chars, 0 AS seconds
+                FROM new_rows
+            ) d
+        ), 1);
+    ELSE
+        PERFORM transcript_stats_apply((
+            SELECT jsonb_agg(d) FROM (
+                SELECT video_id, channel_name, 1 AS videos, 0 AS lines, 0 AS chars, 0 AS seconds
+                FROM old_rows
+            ) d
+        ), -1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Moves a video's totals between channel rows when enrichment renames it
+CREATE OR REPLACE FUNCTION transcript_stats_channel_renamed() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO transcript_stats AS s (scope, key, videos, lines, chars, caption_seconds)
+    SELECT 'channel', moved.channel, moved.sign * v.videos, moved.sign * v.lines,
+           moved.sign * v.chars, moved.sign * v.caption_seconds
+    FROM transcript_stats v,
+         (VALUES (COALESCE(OLD.channel_name, ''), -1), (COALESCE(NEW.channel_name, ''), 1))
+             AS moved (channel, sign)
+    WHERE v.scope = 'video' AND v.key = NEW.video_id
+    ORDER BY moved.channel
+    ON CONFLICT (scope, key) DO UPDATE SET
+        videos = s.videos + EXCLUDED.videos,
+        lines = s.lines + EXCLUDED.lines,
+        chars = s.chars + EXCLUDED.chars,
+        caption_seconds = s.caption_seconds + EXCLUDED.caption_seconds;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS transcript_stats_lines_insert ON transcripts;
+CREATE TRIGGER transcript_stats_lines_insert
+AFTER INSERT ON transcripts REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION transcript_stats_lines_changed();
+
+DROP TRIGGER IF EXISTS transcript_stats_lines_delete ON transcripts;
+CREATE TRIGGER transcript_stats_lines_delete
+AFTER DELETE ON transcripts REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION transcript_stats_lines_changed();
+
+DROP TRIGGER IF EXISTS transcript_stats_videos_insert ON videos;
+CREATE TRIGGER transcript_stats_videos_insert
+AFTER INSERT ON videos REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION transcript_stats_videos_changed();
+
+DROP TRIGGER IF EXISTS transcript_stats_videos_delete ON videos;
+CREATE TRIGGER transcript_stats_videos_delete
+AFTER DELETE ON videos REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION transcript_stats_videos_changed();
+
+DROP TRIGGER IF EXISTS transcript_stats_channel_update ON videos;
+CREATE TRIGGER transcript_stats_channel_update
+AFTER UPDATE OF channel_name ON videos
+FOR EACH ROW WHEN (OLD.channel_name IS DISTINCT FROM NEW.channel_name)
+EXECUTE FUNCTION transcript_stats_channel_renamed();
+"""
+
+
+def create_stats_rollup(conn):
+    """Rollup table of video/line/character/duration totals kept by triggers.
+
+    Statement-level triggers fold each INSERT/COPY/DELETE batch into the
+    per-video, per-channel and global rows, so --stats never scans the
+    transcripts table. Run `analyze_common_words --rebuild-stats` once after
+    creating it on a database that already has data.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(STATS_ROLLUP_SQL)
+        conn.commit()
+        print("Stats rollup ready")
+    except psycopg2.Error as e:
+        print("Error creating stats rollup:")
+        print(e)
+        conn.rollback()
+    finally:
+        cursor.close()
+
+
+def create_indexes(conn):
+    """Indexes on large existing tables, built without blocking writes"""
+    cursor = conn.cursor()
+    conn.autocommit = True
+    try:
+        # Reading one video's lines in order (term counting, exports)
+        cursor.execute(
+            """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS transcripts_video_id_idx
+            ON transcripts (video_id, id)
+        """
+        )
+    except psycopg2.Error as e:
+        print("Error creating indexes:")
+        print(e)
+    finally:
+        conn.autocommit = False
+        cursor.close()
+
+
+def init_database(fulltext_batch_size=10000):
     conn = connection()
     if conn is None:
         print("Database connection failed. Cannot initialize schema.")
@@ -48,12 +286,23 @@ def init_database():
                 title VARCHAR(255) NOT NULL,
                 channel_name VARCHAR(255),
                 duration INT,
-                views INT DEFAULT 0,
+                views BIGINT DEFAULT 0,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """
         )
 
+        # View counts outgrow INT on popular videos. Widening the column
+        # rewrites the table under an exclusive lock, so only do it once.
+        cursor.execute(
+            """
+            SELECT data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'videos' AND column_name = 'views'
+        """
+        )
+        if cursor.fetchone()[0] != "bigint":
+            cursor.execute("ALTER TABLE videos ALTER COLUMN views TYPE BIGINT")
+
         cursor.execute(
             """
             CREATE TABLE IF NOT EXISTS transcripts (
@@ -80,6 +329,148 @@ def init_database():
             )
         """
         )
+        # One enrichment per video, so enrich_transcripts can skip done videos
+        # with ON CONFLICT DO NOTHING.
+        cursor.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS transcript_enrichments_video_id_key "
+            "ON transcript_enrichments (video_id)"
+        )
+
+        # Number of enriched videos each term occurs in: the idf part of the
+        # TF-IDF keywords, kept up to date one chunk at a time.
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS enrichment_term_df (
+                term TEXT PRIMARY KEY,
+                documents INT NOT NULL
+            )
+        """
+        )
+
+        # Compact storage: one row per video with every line packed into a
+        # single blob (transcripts.packed). The blob is compressed already, so
+        # EXTERNAL keeps TOAST from trying to compress it again.
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS transcripts_packed (
+                video_id VARCHAR(255) PRIMARY KEY REFERENCES videos(video_id),
+                segments INT NOT NULL,
+                data BYTEA NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """
+        )
+        cursor.execute("ALTER TABLE transcripts_packed ALTER COLUMN data SET STORAGE EXTERNAL")
+
+        # Per-video term counts written by analyze_common_words --top-words.
+        # term_count_runs records which videos have been counted for each
+        # n-gram size, so later runs only read new videos.
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS video_term_counts (
+                video_id VARCHAR(255) NOT NULL REFERENCES videos(video_id),
+                n SMALLINT NOT NULL,
+                term TEXT NOT NULL,
+                count INT NOT NULL,
+                PRIMARY KEY (video_id, n, term)
+            )
+        """
+        )
+
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS term_count_runs (
+                video_id VARCHAR(255) NOT NULL REFERENCES videos(video_id),
+                n SMALLINT NOT NULL,
+                processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (video_id, n)
+            )
+        """
+        )
+
+        # Corpus-wide totals, so the top terms are an index scan rather than
+        # a GROUP BY over every per-video count.
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS term_totals (
+                n SMALLINT NOT NULL,
+                term TEXT NOT NULL,
+                count BIGINT NOT NULL,
+                PRIMARY KEY (n, term)
+            )
+        """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS term_totals_n_count_idx ON term_totals (n, count DESC)"
+        )
+
+        # Positional phrase index (transcripts.phrases), written with the
+        # transcript lines. Tokens are numbered across a whole video, so a
+        # phrase split over two caption lines is still found.
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS phrase_postings (
+                term TEXT NOT NULL,
+                video_id VARCHAR(255) NOT NULL REFERENCES videos(video_id),
+                positions INT[] NOT NULL,
+                PRIMARY KEY (term, video_id)
+            )
+        """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS phrase_postings_video_id_idx ON phrase_postings (video_id)"
+        )
+
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS phrase_segments (
+                video_id VARCHAR(255) PRIMARY KEY REFERENCES videos(video_id),
+                first_positions INT[] NOT NULL,
+                start_times FLOAT[] NOT NULL
+            )
+        """
+        )
+
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS phrase_terms (
+                term TEXT PRIMARY KEY,
+                videos INT NOT NULL
+            )
+        """
+        )
+
+        # Data API quota ledger (transcripts.quota). Migration 0008 creates the
+        # same tables with IF NOT EXISTS, so init_db and manage.py migrate may
+        # run in either order on a shared database; keep the two in step.
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS youtube_api_quota (
+                id BIGSERIAL PRIMARY KEY,
+                label VARCHAR(64) UNIQUE NOT NULL,
+                day DATE NOT NULL,
+                units_used INT NOT NULL DEFAULT 0,
+                daily_limit INT NOT NULL DEFAULT 10000,
+                tokens DOUBLE PRECISION NOT NULL DEFAULT 0,
+                refilled_at TIMESTAMPTZ NOT NULL,
+                exhausted BOOLEAN NOT NULL DEFAULT false
+            )
+        """
+        )
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS youtube_api_quota_ledger (
+                id BIGSERIAL PRIMARY KEY,
+                label VARCHAR(64) NOT NULL,
+                method VARCHAR(100) NOT NULL,
+                units INT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL
+            )
+        """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS youtube_api_created_37abd1_idx ON youtube_api_quota_ledger (created_at)"
+        )
 
         conn.commit()
         print("Database tables created successfully")
@@ -87,11 +478,22 @@ def init_database():
     except psycopg2.Error as e:
         print("Error creating schema:")
         print(e)
+        cursor.close()
+        conn.close()
+        return
 
+    cursor.close()
+    try:
+        create_stats_rollup(conn)
+        create_indexes(conn)
+        migrate_fulltext(conn, fulltext_batch_size)
     finally:
-        cursor.close()
         conn.close()
 
 
 if __name__ == "__main__":
-    init_database()
+    parser = argparse.ArgumentParser(description="Create or upgrade the transcripts schema")
+    parser.add_argument("--fulltext-batch-size", type=int, default=10000,
+                        help="Rows per transaction when backfilling search vectors")
+    args = parser.parse_args()
+    init_database(args.fulltext_batch_size)
@@ -5,7 +5,7 @@ from .models import PlaylistSearchJob, VideoRecord
 
 @admin.register(PlaylistSearchJob)
 class PlaylistSearchJobAdmin(admin.ModelAdmin):
-    list_display = ('playlist_id','playlist_title','video_count','status','created_at','completed_at')
+    list_display = ('playlist_id','playlist_title','video_count','status','attempts','worker_id','created_at','completed_at')
     list_filter = ('status', 'created_at')
     search_fields = ('playlist_id', 'playlist_title')
 
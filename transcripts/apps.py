@@ -1,6 +1,21 @@
+from contextlib import contextmanager
+
 from django.apps import AppConfig
 
 
 class TranscriptsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "transcripts"
+
+    def ready(self):
+        from django.db import connection, transaction
+
+        from .youtube import quota_scheduler
+
+        @contextmanager
+        def atomic():
+            with transaction.atomic(), connection.cursor() as cursor:
+                yield cursor
+
+        # Keep the Data API quota ledger in the app's database
+        quota_scheduler.configure(atomic)
@@ -0,0 +1,85 @@
+"""Many playlists submitted together, and how much their videos overlap.
+
+A batch only groups ordinary queued jobs, so its playlists are paged as
+concurrently as there are workers (``run_worker --threads``, or several
+workers). Videos are linked to playlists through ``PlaylistMembership``; a
+video that appears in several playlists of a channel is stored, enriched
+and transcribed once, and the report shows how many of each playlist's
+videos it shares with the others.
+"""
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q
+
+from . import jobqueue
+from .models import PlaylistBatch, PlaylistMembership, VideoRecord
+
+# Upper bound on the playlists in one submission
+MAX_PLAYLISTS = 200
+
+
+def submit(playlist_ids):
+    """Queue each playlist and group the jobs in a new batch.
+
+    Playlists that were ingested before are linked as they are; failed ones
+    are queued again. Returns ``(batch, [(job, created), ...])``.
+    """
+    with transaction.atomic():
+        batch = PlaylistBatch.objects.create()
+        entries = [jobqueue.enqueue(playlist_id) for playlist_id in playlist_ids]
+        batch.jobs.add(*[job for job, _ in entries])
+    return batch, entries
+
+
+def _live_memberships(batch):
+    return PlaylistMembership.objects.filter(job__batches=batch, removed_at__isnull=True)
+
+
+def videos(batch):
+    """Each video in any of the batch's playlists, once."""
+    return VideoRecord.objects.filter(pk__in=_live_memberships(batch).values('video'))
+
+
+def report(batch):
+    """Per-playlist shared/unique video counts plus batch totals.
+
+    A video is shared when another playlist of the batch also contains it.
+    """
+    live = _live_memberships(batch)
+    elsewhere = live.filter(video=OuterRef('video')).exclude(job=OuterRef('job'))
+    counts = {
+        row['job']: row
+        for row in live.annotate(is_shared=Exists(elsewhere))
+        .values('job')
+        .annotate(videos=Count('pk'), shared=Count('pk', filter=Q(is_shared=True)))
+    }
+
+    playlists = []
+    for job in batch.jobs.order_by('pk'):
+        row = counts.get(job.pk, {'videos': 0, 'shared': 0})
+        playlists.append({
+            'job_id': job.pk,
+            'playlist_id': job.playlist_id,
+            'playlist_title': job.playlist_title,
+            'status': job.status,
+            'videos': row['videos'],
+            'shared_videos': row['shared'],
+            'unique_videos': row['videos'] - row['shared'],
+        })
+
+    memberships = sum(playlist['videos'] for playlist in playlists)
+    distinct = videos(batch)
+    distinct_videos = distinct.count()
+    return {
+        'batch_id': batch.pk,
+        'created_at': batch.created_at,
+        'playlists': playlists,
+        'totals': {
+            'playlists': len(playlists),
+            'pending': sum(1 for playlist in playlists if playlist['status'] in ('pending', 'processing')),
+            'memberships': memberships,
+            'distinct_videos': distinct_videos,
+            # Stored and transcribed once instead of once per playlist
+            'duplicates_avoided': memberships - distinct_videos,
+            'transcripts_fetched': distinct.filter(transcript_fetched=True).count(),
+        },
+    }
@@ -0,0 +1,229 @@
+"""Database settings and a psycopg2 connection pool shared with the scripts.
+
+``SETTINGS`` is read from the ``DB_*`` environment variables once, here, and
+used both by ``transcripts_project/settings.py`` (through
+``django_database()``) and by the tools in ``scripts/``, so both always
+talk to the same database with the same timeouts.
+
+The scripts get their connections from ``pool``. Opening a connection to a
+managed Postgres in another region costs several round-trips for TCP, TLS
+and authentication, so a connection is kept after ``close()`` and handed
+out again. Before reuse, a connection that has been idle for a while is
+health-checked with ``SELECT 1``, and one older than ``DB_CONN_MAX_AGE`` is
+replaced, the same policy Django applies with ``CONN_MAX_AGE`` and
+``CONN_HEALTH_CHECKS``. No Django imports.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SETTINGS = {
+    'name': os.getenv('DB_NAME', 'youtube_pipeline_db'),
+    'user': os.getenv('DB_USER', 'youtube_pipeline_db_user'),
+    'password': os.getenv('DB_PASSWORD', 'yourpassword'),
+    'host': os.getenv('DB_HOST', 'dpg-d4legh8dl3ps73853mbg-a.oregon-postgres.render.com'),
+    'port': os.getenv('DB_PORT', '5432'),
+    'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '10')),
+    # Per statement, in milliseconds; 0 disables the limit
+    'statement_timeout': int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '300000')),
+    # Seconds a connection is reused before it is replaced; 0 closes it after each use
+    'conn_max_age': int(os.getenv('DB_CONN_MAX_AGE', '600')),
+    # Idle seconds after which a pooled connection is checked before reuse
+    'health_check_after': int(os.getenv('DB_HEALTH_CHECK_AFTER', '30')),
+    'pool_size': int(os.getenv('DB_POOL_SIZE', '10')),
+}
+
+
+def connect_options(statement_timeout=None):
+    """libpq parameters other than the database/user/password/host/port."""
+    timeout = SETTINGS['statement_timeout'] if statement_timeout is None else statement_timeout
+    return {
+        'connect_timeout': SETTINGS['connect_timeout'],
+        'options': f'-c statement_timeout={timeout}',
+        # Notice a dead server or NAT drop on an idle pooled connection
+        'keepalives': 1,
+        'keepalives_idle': 60,
+        'keepalives_interval': 10,
+        'keepalives_count': 3,
+        'application_name': os.getenv('DB_APPLICATION_NAME', 'youtube-pipeline'),
+    }
+
+
+def django_database():
+    """The ``DATABASES['default']`` entry for the Django settings."""
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': SETTINGS['name'],
+        'USER': SETTINGS['user'],
+        'PASSWORD': SETTINGS['password'],
+        'HOST': SETTINGS['host'],
+        'PORT': SETTINGS['port'],
+        'CONN_MAX_AGE': SETTINGS['conn_max_age'],
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': connect_options(),
+    }
+
+
+def connect(statement_timeout=None, **kwargs):
+    """A new, unpooled connection, e.g. for long-running schema changes."""
+    return psycopg2.connect(
+        host=SETTINGS['host'],
+        port=SETTINGS['port'],
+        user=SETTINGS['user'],
+        password=SETTINGS['password'],
+        dbname=SETTINGS['name'],
+        **connect_options(statement_timeout),
+        **kwargs,
+    )
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """A connection whose ``close()`` gives it back to its pool."""
+
+    pool = None
+    checked_out = False
+
+    def close(self):
+        if self.pool is not None and self.checked_out:
+            self.pool.release(self)
+        elif self.pool is None:
+            super().close()
+
+    def disconnect(self):
+        psycopg2.extensions.connection.close(self)
+
+
+class ConnectionPool:
+    """Thread-safe pool of at most ``size`` connections.
+
+    ``acquire()`` blocks while every connection is checked out. Idle
+    connections are reused most recently returned first, since those are the
+    least likely to have been dropped by the server or a proxy.
+    """
+
+    def __init__(self, size=None, max_age=None, health_check_after=None):
+        self.size = size or SETTINGS['pool_size']
+        self.max_age = SETTINGS['conn_max_age'] if max_age is None else max_age
+        self.health_check_after = (
+            SETTINGS['health_check_after'] if health_check_after is None else health_check_after
+        )
+        self.slots = threading.BoundedSemaphore(self.size)
+        self.lock = threading.Lock()
+        self.idle = deque()  # (connection, released_at)
+        self.opened_at = {}
+        self.counters = {'acquired': 0, 'connected': 0, 'health_checks': 0, 'discarded': 0}
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _connect(self):
+        conn = connect(connection_factory=PooledConnection)
+        conn.pool = self
+        self._count('connected')
+        with self.lock:
+            self.opened_at[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        self._count('discarded')
+        with self.lock:
+            self.opened_at.pop(id(conn), None)
+        try:
+            conn.disconnect()
+        except psycopg2.Error:
+            pass
+
+    def _usable(self, conn, released_at):
+        now = time.monotonic()
+        if conn.closed or now - self.opened_at.get(id(conn), now) >= self.max_age:
+            return False
+        if now - released_at < self.health_check_after:
+            return True
+        self._count('health_checks')
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def acquire(self, timeout=None):
+        if not self.slots.acquire(timeout=timeout):
+            raise psycopg2.pool.PoolError(f'No database connection free after {timeout}s')
+        try:
+            while True:
+                with self.lock:
+                    conn, released_at = self.idle.pop() if self.idle else (None, None)
+                if conn is None:
+                    conn = self._connect()
+                    break
+                if self._usable(conn, released_at):
+                    break
+                self._discard(conn)
+        except BaseException:
+            self.slots.release()
+            raise
+        conn.checked_out = True
+        self._count('acquired')
+        return conn
+
+    def release(self, conn):
+        """Return ``conn``: roll back anything uncommitted and keep it for reuse."""
+        if not conn.checked_out:
+            return
+        conn.checked_out = False
+        try:
+            if conn.closed or conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                self._discard(conn)
+            elif self.max_age <= 0:
+                self._discard(conn)
+            else:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+                with self.lock:
+                    self.idle.append((conn, time.monotonic()))
+        except psycopg2.Error:
+            self._discard(conn)
+        finally:
+            self.slots.release()
+
+    def closeall(self):
+        with self.lock:
+            idle = [conn for conn, _ in self.idle]
+            self.idle.clear()
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            counters['idle'] = len(self.idle)
+        return counters
+
+
+pool = ConnectionPool()
+
+
+def connection():
+    """A pooled connection, or None (after printing why) if the database is unreachable.
+
+    ``close()`` returns it to the pool.
+    """
+    try:
+        return pool.acquire()
+    except psycopg2.Error as e:
+        print("Error connecting to the database")
+        print(e)
+        return None
@@ -0,0 +1,214 @@
+"""Offline transcript enrichment: keywords, summary, sentiment and language.
+
+Everything runs locally, a chunk of videos at a time, in the worker
+processes of ``scripts/enrich_transcripts.py``:
+
+- keywords are the top TF-IDF unigrams. A chunk becomes one sparse
+  document-term matrix (scipy CSR) weighted by sublinear term frequency and
+  by idf from the corpus document frequencies plus the chunk's own, with
+  rows L2-normalised; there is no per-term Python loop after tokenizing.
+- summaries are extractive: the sentences (or, for unpunctuated captions,
+  ~30-word spans) whose terms carry the most TF-IDF weight in their video,
+  scored for the whole chunk with one sparse product, in spoken order.
+- sentiment counts words from a small lexicon, flipping a word that follows
+  a negation.
+- language is the one whose common function words best cover the text.
+
+No Django imports.
+"""
+import re
+
+import numpy as np
+from scipy import sparse
+
+from .packed import PackedTranscript
+from .terms import ngrams, tokenize
+
+KEYWORDS = 10
+SUMMARY_SENTENCES = 3
+SENTENCE_WORDS = 30
+
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+LETTERS_RE = re.compile(r'[^\W\d_]+')
+
+# The most frequent function words of each language
+LANGUAGE_WORDS = {
+    language: frozenset(words.split())
+    for language, words in {
+        'en': "the and of to is in that it you for this was with on are be have not they we",
+        'es': "el la los las que de y en un una es por con para se del lo como pero más",
+        'fr': "le la les des et est une du que dans pour pas qui sur vous ce il elle avec",
+        'de': "der die das und ist nicht ein eine zu den mit sich des auf für im dem auch",
+        'pt': "o os as que não uma para com se na por mais dos como mas ao ele das é",
+        'it': "il lo gli che non per una sono del della con si questo anche come è",
+        'nl': "het een van en is dat niet op te zijn met voor er maar ook als wordt",
+    }.items()
+}
+UNKNOWN_LANGUAGE = 'und'
+
+POSITIVE_WORDS = frozenset("""
+amazing awesome beautiful best better brilliant clear clever cool correct easy
+elegant enjoy enjoyed excellent excited exciting fantastic fast favorite fine
+fun glad good great happy helpful ideal impressive incredible interesting
+love loved lovely nice perfect pleasant powerful pretty proud quick right
+simple smart solid success successful super thank thanks useful valuable
+welcome win wonderful works
+""".split())
+
+NEGATIVE_WORDS = frozenset("""
+annoying awful bad boring broken bug bugs confused confusing crash crashes
+difficult disappointing error errors fail failed failing fails failure fault
+hard hate horrible impossible incorrect mess messy mistake mistakes painful
+poor problem problems sad slow sorry stuck terrible tricky ugly unfortunately
+useless wrong worse worst
+""".split())
+
+NEGATIONS = frozenset("""
+not no never nothing nobody none don't doesn't didn't isn't aren't wasn't
+weren't can't cannot couldn't won't wouldn't shouldn't
+""".split())
+NEGATION_WINDOW = 3
+
+
+def document_text(content):
+    """Lines of a video (or a packed transcript blob) as one string."""
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        return ' '.join(segment['text'] for segment in PackedTranscript(content))
+    return ' '.join(content)
+
+
+def split_sentences(text, max_words=SENTENCE_WORDS):
+    """Sentences where the captions are punctuated, else ``max_words`` spans."""
+    sentences = []
+    for sentence in SENTENCE_END_RE.split(text):
+        words = sentence.split()
+        for start in range(0, len(words), max_words):
+            sentences.append(' '.join(words[start:start + max_words]))
+    return sentences
+
+
+def detect_language(text):
+    """ISO 639-1 code of the best-covered language, or ``'und'``."""
+    words = LETTERS_RE.findall(text[:20000].lower())
+    if not words:
+        return UNKNOWN_LANGUAGE
+    hits = {language: sum(word in common for word in words) for language, common in LANGUAGE_WORDS.items()}
+    language = max(hits, key=hits.get)
+    # Function words are a fifth or more of ordinary speech
+    return language if hits[language] >= max(3, 0.05 * len(words)) else UNKNOWN_LANGUAGE
+
+
+def sentiment(tokens):
+    """``'positive'``, ``'negative'`` or ``'neutral'`` from lexicon hits."""
+    positive = negative = 0
+    negated_until = -1
+    for position, token in enumerate(tokens):
+        if token in NEGATIONS:
+            negated_until = position + NEGATION_WINDOW
+            continue
+        polarity = (token in POSITIVE_WORDS) - (token in NEGATIVE_WORDS)
+        if polarity and position <= negated_until:
+            polarity = -polarity
+        if polarity > 0:
+            positive += 1
+        elif polarity < 0:
+            negative += 1
+    if positive + negative == 0:
+        return 'neutral'
+    score = (positive - negative) / (positive + negative)
+    if score > 0.2:
+        return 'positive'
+    if score < -0.2:
+        return 'negative'
+    return 'neutral'
+
+
+def _count_matrix(token_lists, vocabulary, grow=True):
+    """Sparse counts, one row per token list; new terms are added to ``vocabulary`` if ``grow``."""
+    indices = []
+    indptr = [0]
+    for tokens in token_lists:
+        for token in tokens:
+            index = vocabulary.setdefault(token, len(vocabulary)) if grow else vocabulary.get(token)
+            if index is not None:
+                indices.append(index)
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr)),
+        shape=(len(token_lists), len(vocabulary)),
+    )
+    matrix.sum_duplicates()
+    return matrix
+
+
+def _normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+# Corpus statistics for the worker processes, set once by ``init_worker``
+_doc_count = 0
+_doc_freq = {}
+
+
+def init_worker(doc_count, doc_freq):
+    """Pool initializer: documents enriched so far and each term's document count."""
+    global _doc_count, _doc_freq
+    _doc_count = doc_count
+    _doc_freq = doc_freq
+
+
+def enrich_chunk(documents, keywords=KEYWORDS, summary_sentences=SUMMARY_SENTENCES):
+    """Enrich ``[(video_id, lines or packed blob), ...]``.
+
+    Returns ``(rows, doc_freq)``: one ``(video_id, summary, keywords,
+    sentiment, language)`` tuple per video, and the number of the chunk's
+    videos each term occurs in, to add to the corpus statistics.
+    """
+    video_ids = [video_id for video_id, _ in documents]
+    texts = [document_text(content) for _, content in documents]
+    tokens = [tokenize(text) for text in texts]
+    languages = [detect_language(text) for text in texts]
+    # ngrams() drops English stop words; drop the detected language's too
+    doc_terms = [
+        [term for term in ngrams(doc_tokens, 1) if term not in LANGUAGE_WORDS.get(language, ())]
+        for doc_tokens, language in zip(tokens, languages)
+    ]
+
+    # Documents x terms, sublinear tf, idf from the corpus plus this chunk
+    vocabulary = {}
+    counts = _count_matrix(doc_terms, vocabulary)
+    terms = np.array(list(vocabulary), dtype=object)
+    chunk_df = np.bincount(counts.indices, minlength=len(terms))
+    corpus_df = np.fromiter((_doc_freq.get(term, 0) for term in terms), dtype=np.float64, count=len(terms))
+    idf = np.log((1 + _doc_count + len(documents)) / (1 + corpus_df + chunk_df)) + 1
+    weights = counts.copy()
+    weights.data = 1 + np.log(weights.data)
+    weights = _normalize_rows((weights @ sparse.diags(idf)).tocsr())
+
+    # Sentences x terms, scored against their own video's term weights
+    sentences = [split_sentences(text) for text in texts]
+    sentence_doc = np.repeat(np.arange(len(texts)), [len(doc_sentences) for doc_sentences in sentences])
+    flat_sentences = [sentence for doc_sentences in sentences for sentence in doc_sentences]
+    sentence_tokens = [tokenize(sentence) for sentence in flat_sentences]
+    sentence_counts = _count_matrix([ngrams(t, 1) for t in sentence_tokens], vocabulary, grow=False)
+    scores = np.asarray(sentence_counts.multiply(weights[sentence_doc]).sum(axis=1)).ravel()
+    scores /= np.sqrt(np.maximum([len(t) for t in sentence_tokens], 1))
+
+    rows = []
+    first_sentence = 0
+    for row, video_id in enumerate(video_ids):
+        start, end = weights.indptr[row], weights.indptr[row + 1]
+        data = weights.data[start:end]
+        top = np.argsort(-data, kind='stable')[:keywords]
+        keyword_list = ', '.join(terms[weights.indices[start:end][top]])
+
+        count = len(sentences[row])
+        doc_scores = scores[first_sentence:first_sentence + count]
+        chosen = np.sort(np.argsort(-doc_scores, kind='stable')[:summary_sentences])
+        summary = ' '.join(sentences[row][index] for index in chosen)
+        first_sentence += count
+
+        rows.append((video_id, summary, keyword_list, sentiment(tokens[row]), languages[row]))
+    return rows, dict(zip(terms.tolist(), chunk_df.tolist()))
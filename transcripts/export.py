@@ -0,0 +1,100 @@
+"""Streaming bulk export of a job's transcript lines as NDJSON or CSV.
+
+Rows come from a server-side cursor a chunk at a time and are encoded (and
+optionally gzipped) as they arrive, so memory use does not grow with the
+playlist and the first bytes go out before the query has finished. Plain
+DB-API code with no Django imports; the view supplies the cursor.
+"""
+import csv
+import io
+import json
+import zlib
+
+from .packed import PackedTranscript
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'jsonl'),
+    'csv': ('text/csv', 'csv'),
+}
+
+COLUMNS = ['video_id', 'title', 'channel_name', 'start_time', 'duration', 'text']
+
+# Videos come in playlist order from the (job, position) index on
+# memberships. Those stored packed (transcripts_packed) come back as one row
+# carrying the blob; the rest join their lines through
+# transcripts_video_id_idx (video_id, id), in insertion order. Lines are
+# sorted one video at a time (an incremental sort), so the cursor returns its
+# first rows without sorting the whole export.
+EXPORT_SQL = """
+    SELECT v.video_id, v.title, v.channel_name, p.data, t.start_time, t.duration, t.text
+    FROM transcripts_playlistmembership m
+    JOIN transcripts_videorecord v ON v.id = m.video_id
+    LEFT JOIN transcripts_packed p ON p.video_id = v.video_id
+    LEFT JOIN transcripts t ON p.video_id IS NULL AND t.video_id = v.video_id
+    WHERE m.job_id = %s AND m.removed_at IS NULL
+      AND (p.video_id IS NOT NULL OR t.id IS NOT NULL)
+    ORDER BY m.position, v.id, t.id
+"""
+
+CHUNK_ROWS = 2000
+
+
+def iter_rows(cursor, job_id, chunk_rows=CHUNK_ROWS):
+    """Yield lists of rows in ``COLUMNS`` order; pass a server-side cursor.
+
+    Chunks hold up to ``chunk_rows`` database rows, plus the lines of any
+    packed transcripts among them.
+    """
+    cursor.execute(EXPORT_SQL, [job_id])
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            return
+        chunk = []
+        for video_id, title, channel_name, data, start_time, duration, text in rows:
+            if data is None:
+                chunk.append((video_id, title, channel_name, start_time, duration, text))
+            else:
+                chunk.extend(
+                    (video_id, title, channel_name, line['start'], line['duration'], line['text'])
+                    for line in PackedTranscript(data)
+                )
+        yield chunk
+
+
+def encode_ndjson(chunks):
+    for rows in chunks:
+        yield ''.join(
+            json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + '\n' for row in rows
+        ).encode()
+
+
+def encode_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header only: the job has no transcript lines
+        yield buffer.getvalue().encode()
+
+
+def gzip_stream(blocks, level=6):
+    """Gzip an iterable of byte strings on the fly, one member for the whole stream."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip header and trailer
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(cursor, job_id, fmt, compress=False):
+    """Encoded export body for ``job_id`` as an iterator of bytes."""
+    encode = encode_ndjson if fmt == 'ndjson' else encode_csv
+    body = encode(iter_rows(cursor, job_id))
+    return gzip_stream(body) if compress else body
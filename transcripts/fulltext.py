@@ -0,0 +1,60 @@
+"""Full-text search over the raw ``transcripts`` table.
+
+Queries use the ``text_tsv`` column and its GIN index created by
+``scripts/init_db.py``. Plain DB-API code with no Django imports, so the same
+SQL serves both the REST API and ``scripts/analyze_common_words.py``.
+"""
+
+TEXT_SEARCH_CONFIG = 'english'
+
+# Snippet markers; plain text so the result prints cleanly in a terminal.
+HEADLINE_OPTIONS = 'StartSel=[, StopSel=], MaxWords=20, MinWords=8'
+
+MATCH_SQL = """
+    SELECT t.video_id, t.start_time, t.text
+    FROM transcripts t, websearch_to_tsquery(%(config)s, %(query)s) q
+    WHERE t.text_tsv @@ q
+    ORDER BY t.id
+    LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+# Rank and page first, then build headlines only for the rows being returned.
+RANKED_SQL = """
+    SELECT hit.video_id, hit.start_time, hit.rank,
+           ts_headline(%(config)s, hit.text, q, %(headline)s) AS snippet
+    FROM (
+        SELECT t.id, t.video_id, t.start_time, t.text, ts_rank(t.text_tsv, q) AS rank
+        FROM transcripts t, websearch_to_tsquery(%(config)s, %(query)s) q
+        WHERE t.text_tsv @@ q
+        ORDER BY rank DESC, t.id
+        LIMIT %(limit)s OFFSET %(offset)s
+    ) hit, websearch_to_tsquery(%(config)s, %(query)s) q
+    ORDER BY hit.rank DESC, hit.id
+"""
+
+
+def search(cursor, query, limit=None, offset=0, ranked=False):
+    """Run a search on ``cursor`` and return it for iteration.
+
+    Plain mode yields ``(video_id, start_time, text)`` in insertion order;
+    ranked mode yields ``(video_id, start_time, rank, snippet)`` best match
+    first. ``limit=None`` returns every match, so pass a named (server-side)
+    cursor when the result set may be large.
+    """
+    params = {
+        'config': TEXT_SEARCH_CONFIG,
+        'query': query,
+        'limit': limit,
+        'offset': offset,
+        'headline': HEADLINE_OPTIONS,
+    }
+    cursor.execute(RANKED_SQL if ranked else MATCH_SQL, params)
+    return cursor
+
+
+def watch_url(video_id, start_time):
+    """Link to the moment a line is said."""
+    url = f'https://www.youtube.com/watch?v={video_id}'
+    if start_time is not None:
+        url += f'&t={int(start_time)}s'
+    return url
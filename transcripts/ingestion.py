@@ -0,0 +1,247 @@
+import math
+from operator import itemgetter
+
+from django.db import transaction
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from . import progress
+from .metrics import DB_WRITE_SECONDS
+from .models import PlaylistMembership, VideoRecord
+from .quota import QuotaDeferred, next_reset
+from .youtube import execute, quota_scheduler
+from .youtube_metadata import BATCH_SIZE, fetch_video_metadata
+
+# Videos written back per bulk UPDATE by enrich_videos
+ENRICH_BATCH_SIZE = 500
+
+
+class PlaylistNotFound(Exception):
+    pass
+
+
+def execute_conditional(build_request, method, etag):
+    """Execute the request with ``If-None-Match``; None means 304 Not Modified."""
+    try:
+        return execute(build_request, method, headers={'If-None-Match': etag} if etag else None)
+    except HttpError as e:
+        if e.resp.status == 304:
+            return None
+        raise
+
+
+def store_page(job, items, position=0):
+    """Write one page of playlist items in a single transaction.
+
+    Videos that are already stored (by this job on an earlier attempt, or by
+    another playlist) are reused as they are, so a video shared by several
+    playlists is stored, enriched and transcribed once. Every video on the
+    page is then linked to ``job``, numbered from ``position``. Returns
+    ``(inserted_ids, known_ids)``, where known videos are those stored by
+    another job; ones this job inserted on an earlier attempt are in neither.
+    """
+    videos = {}
+    for item in items:
+        video_id = item['snippet']['resourceId'].get('videoId')
+        if not video_id or video_id in videos:
+            continue
+        videos[video_id] = VideoRecord(
+            video_id=video_id,
+            title=item['snippet']['title'],
+            channel_name=item['snippet']['channelTitle'],
+            duration=0,
+            playlist_job=job
+        )
+
+    with DB_WRITE_SECONDS.time(operation='insert_videos'), transaction.atomic():
+        stored = set(VideoRecord.objects.filter(video_id__in=list(videos)).values_list('video_id', flat=True))
+        # In video_id order, so workers paging overlapping playlists take the
+        # unique index locks in the same order and cannot deadlock.
+        # ignore_conflicts covers a concurrent worker inserting the same video
+        # between the lookup and the insert.
+        VideoRecord.objects.bulk_create(
+            [videos[video_id] for video_id in sorted(videos) if video_id not in stored], ignore_conflicts=True
+        )
+        # Read after the insert, so videos a concurrent job got in first count as known
+        owners = {
+            video_id: (pk, job_id)
+            for video_id, pk, job_id in VideoRecord.objects.filter(video_id__in=list(videos))
+            .values_list('video_id', 'pk', 'playlist_job_id')
+        }
+        PlaylistMembership.objects.bulk_create(
+            [
+                PlaylistMembership(job=job, video_id=owners[video_id][0], position=position + offset)
+                for offset, video_id in sorted(enumerate(videos), key=itemgetter(1))
+            ],
+            update_conflicts=True,
+            unique_fields=['job', 'video'],
+            update_fields=['position'],
+        )
+    inserted = [video_id for video_id in videos if video_id not in stored and owners[video_id][1] == job.pk]
+    known = [video_id for video_id in videos if owners[video_id][1] != job.pk]
+    return inserted, known
+
+
+def enrich_videos(video_ids):
+    """Fill in duration, views and canonical title/channel for ``video_ids``.
+
+    Looks videos up 50 at a time and writes each batch of 500 back with one
+    bulk UPDATE, so batches already paid for are kept if a later one raises
+    ``QuotaDeferred``. Every video looked up gets ``metadata_fetched_at``,
+    including private or deleted ones that ``videos.list`` leaves out.
+    Returns the number of videos updated.
+    """
+    video_ids = list(dict.fromkeys(video_ids))
+    updated = 0
+    for start in range(0, len(video_ids), ENRICH_BATCH_SIZE):
+        batch = video_ids[start:start + ENRICH_BATCH_SIZE]
+        metadata = {item['video_id']: item for item in fetch_video_metadata(batch)}
+        videos = list(VideoRecord.objects.filter(video_id__in=batch))
+        now = timezone.now()
+        for video in videos:
+            for field, value in metadata.get(video.video_id, {}).items():
+                if field != 'video_id':
+                    setattr(video, field, value)
+            video.metadata_fetched_at = now
+            video.updated_at = now
+        with DB_WRITE_SECONDS.time(operation='update_video_metadata'):
+            VideoRecord.objects.bulk_update(
+                videos, ['title', 'channel_name', 'duration', 'views', 'metadata_fetched_at', 'updated_at']
+            )
+        updated += sum(1 for video in videos if video.video_id in metadata)
+    return updated
+
+
+def current_videos(job):
+    """Videos in the playlist of ``job`` as of its latest sync."""
+    return VideoRecord.objects.filter(memberships__job=job, memberships__removed_at__isnull=True)
+
+
+def pending_metadata(job):
+    """Current videos of ``job`` that ``enrich_videos`` has not looked up yet."""
+    return current_videos(job).filter(metadata_fetched_at__isnull=True)
+
+
+def pending_transcripts(job):
+    """Current videos of ``job`` whose transcript has not been stored yet."""
+    return current_videos(job).filter(transcript_fetched=False)
+
+
+def sync_playlist(job, heartbeat=None):
+    """Bring the stored videos of ``job`` in line with the playlist on YouTube.
+
+    Used for the first ingest and for every resync. Requests carry the ETags
+    saved by the previous sync, and unchanged pages reuse their saved video
+    ids. Every page is checked even when the playlist itself is unchanged:
+    its ETag only covers the title and item count, so a video swapped for
+    another would go unnoticed. New videos are inserted; then every current
+    video without metadata (see ``pending_metadata``) is enriched with
+    ``videos.list``, so videos stored by an interrupted attempt are picked
+    up by the next one. Memberships of videos no longer in the playlist get
+    ``removed_at``. Runs inside a worker process, never in the request
+    cycle; ``heartbeat`` (the worker's ``jobqueue.Heartbeat``) is checked
+    between pages. Returns counts.
+
+    Raises QuotaDeferred before touching the videos if the playlist needs
+    more Data API quota than is left today, or whenever a call cannot be paid
+    for; the worker then defers the job instead of failing it.
+    """
+    result = {'inserted': 0, 'known': 0, 'removed': 0, 'enriched': 0, 'unchanged': False}
+
+    # Fetch playlist info
+    playlist_response = execute_conditional(
+        lambda youtube: youtube.playlists().list(part='snippet,contentDetails', id=job.playlist_id),
+        'playlists.list',
+        job.etag,
+    )
+    if playlist_response is None:
+        item_count = job.video_count
+    elif not playlist_response['items']:
+        raise PlaylistNotFound('Playlist not found')
+    else:
+        item_count = playlist_response['items'][0].get('contentDetails', {}).get('itemCount', job.video_count)
+    # One playlistItems page per 50 videos, and at worst one videos.list per 50 new ones
+    needed = 2 * math.ceil(item_count / BATCH_SIZE)
+    remaining = quota_scheduler.remaining()
+    if needed > remaining:
+        raise QuotaDeferred(
+            f'Playlist needs about {needed} quota units, {remaining} left today',
+            next_reset(timezone.now()),
+        )
+
+    progress.set_phase(job, 'syncing', videos_expected=item_count, pages_fetched=0, videos_discovered=0)
+    if playlist_response is not None:
+        job.playlist_title = playlist_response['items'][0]['snippet']['title']
+        job.save(update_fields=['playlist_title', 'updated_at'])
+
+    # Fetch videos page by page, one bulk write per changed 50-item page
+    saved_pages = {page['token']: page for page in job.page_etags}
+    pages = []
+    current_ids = []
+    changed_pages = 0
+    next_page_token = None
+    while True:
+        if heartbeat:
+            heartbeat.check()
+        saved = saved_pages.get(next_page_token or '')
+        response = execute_conditional(
+            lambda youtube: youtube.playlistItems().list(
+                part='snippet',
+                playlistId=job.playlist_id,
+                maxResults=50,
+                pageToken=next_page_token
+            ),
+            'playlistItems.list',
+            saved and saved['etag'],
+        )
+        if response is None:
+            page = saved
+        else:
+            changed_pages += 1
+            inserted_ids, known_ids = store_page(job, response['items'], position=len(current_ids))
+            result['inserted'] += len(inserted_ids)
+            result['known'] += len(known_ids)
+            page = {
+                'token': next_page_token or '',
+                'etag': response.get('etag', ''),
+                'next': response.get('nextPageToken', ''),
+                'video_ids': [
+                    item['snippet']['resourceId']['videoId']
+                    for item in response['items']
+                    if item['snippet']['resourceId'].get('videoId')
+                ],
+            }
+        pages.append(page)
+        current_ids.extend(page['video_ids'])
+        progress.add(job, pages_fetched=1, videos_discovered=len(page['video_ids']))
+
+        next_page_token = page['next']
+        if not next_page_token:
+            break
+
+    now = timezone.now()
+    current = set(current_ids)
+    memberships = PlaylistMembership.objects.filter(job=job)
+    result['removed'] = memberships.filter(removed_at__isnull=True).exclude(
+        video__video_id__in=current
+    ).update(removed_at=now)
+    # Videos that were removed earlier and have come back
+    memberships.filter(video__video_id__in=current, removed_at__isnull=False).update(removed_at=None)
+
+    # playlistItems has no duration or view count; look up every video still
+    # without them, not only this attempt's insertions
+    progress.set_phase(job, 'enriching')
+    result['enriched'] = enrich_videos(pending_metadata(job).values_list('video_id', flat=True))
+    result['unchanged'] = playlist_response is None and not changed_pages
+
+    job.video_count = len(current)
+    if not job.last_synced_at:
+        job.known_video_count = result['known']
+    if playlist_response is not None:
+        job.etag = playlist_response.get('etag', '')
+    job.page_etags = pages
+    job.last_synced_at = now
+    job.save(update_fields=[
+        'video_count', 'known_video_count', 'etag', 'page_etags', 'last_synced_at', 'updated_at'
+    ])
+    return result
@@ -0,0 +1,218 @@
+"""Postgres-backed queue for playlist ingestion jobs.
+
+Jobs are plain ``PlaylistSearchJob`` rows. Workers claim them with
+``SELECT ... FOR UPDATE SKIP LOCKED`` and hold a time-limited lease that they
+renew with heartbeats, so any number of workers on any number of machines can
+share one database. A job whose lease runs out (the worker died or lost its
+connection) becomes claimable again until it runs out of attempts.
+"""
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import progress
+from .models import JobProgress, PlaylistSearchJob
+
+LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '60'))
+MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+
+
+class LeaseLost(Exception):
+    """The worker no longer holds the lease on its job."""
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(playlist_id):
+    """Create a pending job, or put a failed one back in the queue."""
+    job, created = PlaylistSearchJob.objects.get_or_create(playlist_id=playlist_id)
+    if created:
+        progress.reset(job)
+    elif job.status == 'failed':
+        requeue(job, job.task)
+        job.refresh_from_db()
+    return job, created
+
+
+def requeue(job, task, force=False):
+    """Put a finished job back in the queue to run ``task``.
+
+    Returns False if the job is already queued or running. ``force`` drops
+    the saved playlist and page ETags, so every page is downloaded and
+    stored again instead of being answered with 304 Not Modified.
+    """
+    updates = {
+        'status': 'pending',
+        'task': task,
+        'error_message': '',
+        'attempts': 0,
+        'worker_id': '',
+        'lease_expires_at': None,
+        'run_after': None,
+        'updated_at': timezone.now(),
+    }
+    if force:
+        updates['etag'] = ''
+        updates['page_etags'] = []
+    requeued = bool(
+        PlaylistSearchJob.objects.filter(pk=job.pk, status__in=['completed', 'failed']).update(**updates)
+    )
+    if requeued:
+        progress.reset(job)
+    return requeued
+
+
+def _claimable(now):
+    expired = Q(status='processing', lease_expires_at__lt=now)
+    due = Q(run_after__isnull=True) | Q(run_after__lte=now)
+    return PlaylistSearchJob.objects.filter(
+        Q(status='pending') | expired, due, attempts__lt=MAX_ATTEMPTS
+    )
+
+
+def claim_job(worker_id, lease_seconds=LEASE_SECONDS):
+    """Lease the oldest claimable job to ``worker_id``, or return None."""
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            _claimable(now)
+            .select_for_update(skip_locked=True)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = 'processing'
+        job.worker_id = worker_id
+        job.heartbeat_at = now
+        job.lease_expires_at = now + timedelta(seconds=lease_seconds)
+        job.attempts = F('attempts') + 1
+        job.save(update_fields=[
+            'status', 'worker_id', 'heartbeat_at', 'lease_expires_at', 'attempts', 'updated_at'
+        ])
+    job.refresh_from_db(fields=['attempts'])
+    return job
+
+
+def heartbeat(job, worker_id, lease_seconds=LEASE_SECONDS):
+    """Extend the lease on ``job``. Raises LeaseLost if another worker took it."""
+    now = timezone.now()
+    renewed = PlaylistSearchJob.objects.filter(
+        pk=job.pk, status='processing', worker_id=worker_id
+    ).update(heartbeat_at=now, lease_expires_at=now + timedelta(seconds=lease_seconds))
+    if not renewed:
+        raise LeaseLost(f'Lost lease on job {job.pk}')
+
+
+def complete_job(job, worker_id):
+    now = timezone.now()
+    completed = PlaylistSearchJob.objects.filter(
+        pk=job.pk, status='processing', worker_id=worker_id
+    ).update(status='completed', completed_at=now, lease_expires_at=None, updated_at=now)
+    if completed:
+        progress.set_phase(job, 'completed')
+    return completed
+
+
+def fail_job(job, worker_id, error_message, retry=True):
+    """Mark the job failed, or hand it back to the queue if it has attempts left."""
+    now = timezone.now()
+    status = 'pending' if retry and job.attempts < MAX_ATTEMPTS else 'failed'
+    updated = PlaylistSearchJob.objects.filter(
+        pk=job.pk, status='processing', worker_id=worker_id
+    ).update(status=status, error_message=error_message, lease_expires_at=None, updated_at=now)
+    if updated:
+        progress.set_phase(job, 'queued' if status == 'pending' else 'failed')
+    return updated
+
+
+def defer_job(job, worker_id, run_after, reason=''):
+    """Hand the job back to the queue, not to be claimed before ``run_after``.
+
+    Deferring is not a failure, so the attempt the worker used is given back.
+    """
+    now = timezone.now()
+    deferred = PlaylistSearchJob.objects.filter(
+        pk=job.pk, status='processing', worker_id=worker_id
+    ).update(
+        status='pending',
+        run_after=run_after,
+        error_message=reason,
+        attempts=F('attempts') - 1,
+        lease_expires_at=None,
+        updated_at=now,
+    )
+    if deferred:
+        progress.set_phase(job, 'deferred')
+    return deferred
+
+
+def reclaim_expired():
+    """Fail jobs whose lease expired after their last allowed attempt.
+
+    Expired jobs with attempts left need no action: ``claim_job`` picks them
+    up directly.
+    """
+    now = timezone.now()
+    expired = PlaylistSearchJob.objects.filter(
+        status='processing', lease_expires_at__lt=now, attempts__gte=MAX_ATTEMPTS
+    )
+    pks = list(expired.values_list('pk', flat=True))
+    if not pks:
+        return 0
+    failed = expired.filter(pk__in=pks).update(
+        status='failed',
+        error_message='Worker lease expired too many times',
+        lease_expires_at=None,
+        updated_at=now,
+    )
+    JobProgress.objects.filter(job_id__in=pks, job__status='failed').update(phase='failed', updated_at=now)
+    return failed
+
+
+class Heartbeat(threading.Thread):
+    """Background thread that keeps a job's lease alive while it is processed."""
+
+    def __init__(self, job, worker_id, lease_seconds=LEASE_SECONDS):
+        super().__init__(daemon=True, name=f'heartbeat-{job.pk}')
+        self.job = job
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.lost = threading.Event()
+        self._done = threading.Event()
+
+    def run(self):
+        interval = max(self.lease_seconds / 3, 1)
+        try:
+            while not self._done.wait(interval):
+                close_old_connections()
+                try:
+                    heartbeat(self.job, self.worker_id, self.lease_seconds)
+                except LeaseLost:
+                    self.lost.set()
+                    return
+        finally:
+            connection.close()
+
+    def check(self):
+        if self.lost.is_set():
+            raise LeaseLost(f'Lost lease on job {self.job.pk}')
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
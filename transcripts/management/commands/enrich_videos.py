@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from transcripts.ingestion import enrich_videos
+from transcripts.models import VideoRecord
+
+
+class Command(BaseCommand):
+    help = "Fill in duration, views, title and channel for stored videos"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="Refresh every video, not only those never looked up")
+        parser.add_argument("--chunk-size", type=int, default=500,
+                            help="Videos loaded per database round-trip")
+
+    def handle(self, *args, **options):
+        videos = VideoRecord.objects.order_by("pk")
+        if not options["all"]:
+            videos = videos.filter(metadata_fetched_at__isnull=True)
+
+        updated = 0
+        video_ids = []
+        for video_id in videos.values_list("video_id", flat=True).iterator(chunk_size=options["chunk_size"]):
+            video_ids.append(video_id)
+            if len(video_ids) >= options["chunk_size"]:
+                updated += enrich_videos(video_ids)
+                video_ids = []
+        if video_ids:
+            updated += enrich_videos(video_ids)
+
+        self.stdout.write(f"Updated metadata for {updated} videos")
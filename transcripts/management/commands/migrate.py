@@ -0,0 +1,24 @@
+from django.core.management.commands import migrate
+from django.db import connections
+
+from transcripts.db import connect_options
+
+
+class Command(migrate.Command):
+    """Django's ``migrate`` without ``DB_STATEMENT_TIMEOUT_MS``.
+
+    The timeout protects request-serving connections; data migrations and
+    column rewrites on a large table legitimately run longer, like the
+    schema changes in ``scripts/init_db.py``.
+    """
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        if connection.vendor == "postgresql":
+            # Reconnect with the timeout disabled; reconnects keep the setting
+            connection.close()
+            connection.settings_dict["OPTIONS"] = {
+                **connection.settings_dict["OPTIONS"],
+                "options": connect_options(statement_timeout=0)["options"],
+            }
+        return super().handle(*args, **options)
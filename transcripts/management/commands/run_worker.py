@@ -0,0 +1,113 @@
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from transcripts import jobqueue, transcript_fetcher
+from transcripts.ingestion import PlaylistNotFound, pending_transcripts, sync_playlist
+from transcripts.quota import QuotaDeferred
+
+
+class Command(BaseCommand):
+    help = "Claim and process queued playlist ingestion jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--worker-id", default=jobqueue.default_worker_id(),
+                            help="Identifier recorded on claimed jobs (default: host:pid)")
+        parser.add_argument("--poll-interval", type=float, default=5.0,
+                            help="Seconds to wait when the queue is empty")
+        parser.add_argument("--lease", type=int, default=jobqueue.LEASE_SECONDS,
+                            help="Lease length in seconds; renewed by heartbeats")
+        parser.add_argument("--once", action="store_true",
+                            help="Exit when the queue is empty instead of polling")
+        parser.add_argument("--threads", type=int, default=1,
+                            help="Jobs processed at once, e.g. the playlists of a batch (default: 1)")
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+
+        worker_id = options["worker_id"]
+        if options["threads"] <= 1:
+            self.run(worker_id, options)
+            return
+
+        # Each thread claims jobs on its own, with its own database connection
+        threads = [
+            threading.Thread(target=self.run_thread, args=(f"{worker_id}/{n}", options), daemon=True)
+            for n in range(options["threads"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_thread(self, worker_id, options):
+        try:
+            self.run(worker_id, options)
+        finally:
+            connection.close()
+
+    def run(self, worker_id, options):
+        self.stdout.write(f"Worker {worker_id} started")
+
+        while not self.stopping:
+            close_old_connections()
+            reclaimed = jobqueue.reclaim_expired()
+            if reclaimed:
+                self.stdout.write(f"Failed {reclaimed} job(s) with expired leases")
+
+            job = jobqueue.claim_job(worker_id, options["lease"])
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+                continue
+
+            self.process(job, worker_id, options["lease"])
+
+        self.stdout.write(f"Worker {worker_id} stopped")
+
+    def process(self, job, worker_id, lease_seconds):
+        self.stdout.write(
+            f"Processing {job.task} job {job.pk} ({job.playlist_id}), attempt {job.attempts}"
+        )
+        try:
+            with jobqueue.Heartbeat(job, worker_id, lease_seconds) as heartbeat:
+                counts = sync_playlist(job, heartbeat=heartbeat)
+                # Chosen from the database, so videos stored by an interrupted
+                # attempt are not missed
+                missing = list(pending_transcripts(job)) if job.task == 'resync' else []
+                if missing:
+                    report = transcript_fetcher.fetch_transcripts(missing, job=job)
+                    self.stdout.write(
+                        f"Fetched {report['fetched']} transcripts, {report['failed']} failed"
+                    )
+        except jobqueue.LeaseLost as e:
+            self.stderr.write(str(e))
+        except QuotaDeferred as e:
+            jobqueue.defer_job(job, worker_id, e.retry_at, str(e))
+            self.stdout.write(f"Job {job.pk} deferred until {e.retry_at:%Y-%m-%d %H:%M} UTC: {e}")
+        except PlaylistNotFound as e:
+            jobqueue.fail_job(job, worker_id, str(e), retry=False)
+            self.stderr.write(f"Job {job.pk} failed: {e}")
+        except Exception as e:
+            jobqueue.fail_job(job, worker_id, str(e))
+            self.stderr.write(f"Job {job.pk} failed: {e}")
+        else:
+            jobqueue.complete_job(job, worker_id)
+            if counts['unchanged']:
+                self.stdout.write(f"Job {job.pk} completed: playlist unchanged")
+            else:
+                self.stdout.write(
+                    f"Job {job.pk} completed: {counts['inserted']} videos added, "
+                    f"{counts['known']} already known, {counts['removed']} removed, "
+                    f"{counts['enriched']} enriched"
+                )
+
+    def request_stop(self, signum, frame):
+        # Finish the current job, then exit.
+        self.stopping = True
@@ -0,0 +1,224 @@
+"""Counters, gauges and histograms rendered in the Prometheus text format.
+
+Hot paths record into the module-level metrics below: Data API calls,
+client builds, transcript downloads, retries and the database writes of the
+views, the queue worker and the scripts. Recording is a dict update under a
+per-metric lock (plus a bisect for histograms), cheap enough to leave on in
+production. The web app serves ``render()`` at ``/metrics``; scripts can
+write it to a file with ``write()`` for the node exporter's textfile
+collector.
+
+Values are per process. Under gunicorn each worker keeps its own, so scrape
+with a single worker or sum over the ``instance`` label Prometheus adds.
+No Django imports.
+"""
+import bisect
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from a local cache hit to a slow YouTube call
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Queries per request
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+        if not self.label_names and self.kind != 'histogram':
+            self.values[()] = 0  # export unlabelled counters and gauges from the start
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f'{self.name} takes labels {self.label_names}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for key, value in sorted(values.items()):
+            yield self.name + _labels(self.label_names, key), value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(f'{name} {_number(value)}' for name, value in self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    @contextmanager
+    def track_in_progress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # one count per bucket, then +Inf, then the sum
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the ``with`` block, even if it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        with self.lock:
+            values = {key: list(counts) for key, counts in self.values.items()}
+        for key, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield (f'{self.name}_bucket'
+                       + _labels(self.label_names, key, [('le', _number(float(bound)))]), cumulative)
+            yield f'{self.name}_count' + _labels(self.label_names, key), cumulative
+            yield f'{self.name}_sum' + _labels(self.label_names, key), counts[-1]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics)
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+registry = Registry()
+
+# YouTube Data API
+DATA_API_SECONDS = registry.histogram(
+    'youtube_api_request_seconds', 'Data API request latency, per attempt', ['method'])
+DATA_API_REQUESTS = registry.counter(
+    'youtube_api_requests_total', 'Data API requests by outcome (ok, not_modified, HTTP status or error)',
+    ['method', 'outcome'])
+DATA_API_IN_FLIGHT = registry.gauge('youtube_api_requests_in_flight', 'Data API requests being sent')
+CLIENT_BUILD_SECONDS = registry.histogram('youtube_client_build_seconds', 'Time to build a Data API client')
+
+# Transcript downloads (cache misses only)
+TRANSCRIPT_FETCH_SECONDS = registry.histogram(
+    'transcript_fetch_seconds', 'Transcript download latency, per attempt', ['outcome'])
+TRANSCRIPT_FETCH_IN_FLIGHT = registry.gauge('transcript_fetches_in_flight', 'Transcript downloads in progress')
+
+# Shared retry policies (see retry.py)
+RETRY_EVENTS = registry.counter(
+    'youtube_retry_events_total',
+    'Retry policy events: calls, attempts, retries, failures, budget_exhausted, rejected_open',
+    ['policy', 'event'])
+RETRY_SLEEP_SECONDS = registry.counter(
+    'youtube_retry_sleep_seconds_total', 'Seconds spent in retry backoff or waiting on an open breaker',
+    ['policy', 'reason'])
+
+# Database writes
+DB_WRITE_SECONDS = registry.histogram('db_write_seconds', 'Duration of database writes', ['operation'])
+
+# HTTP requests to this app (see middleware.py)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'http_request_seconds', 'Time to produce a response (headers only for streams)',
+    ['route', 'method', 'status'])
+HTTP_REQUEST_QUERIES = registry.histogram(
+    'http_request_db_queries', 'Database queries per request', ['route'], buckets=QUERY_BUCKETS)
+HTTP_REQUESTS_IN_FLIGHT = registry.gauge('http_requests_in_flight', 'Requests being handled')
+
+
+def render():
+    return registry.render()
+
+
+def write(path):
+    """Atomically write the current metrics to ``path`` (textfile collector format)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(render())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
@@ -0,0 +1,63 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+
+from .metrics import HTTP_REQUEST_QUERIES, HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_FLIGHT
+
+
+class QueryCounter:
+    """``connection.execute_wrapper`` that counts the queries it lets through."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """Per-route latency and query count histograms for every request.
+
+    Routes are labelled by their URL pattern (``api/playlists/<int:pk>/export/``),
+    not the path, so label cardinality stays bounded. For streaming responses
+    the time is up to the first byte; queries run while the body streams are
+    not counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Under ASGI the chain below is async; stay async so async views
+        # are not pushed onto a thread
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = QueryCounter()
+        started = time.perf_counter()
+        with HTTP_REQUESTS_IN_FLIGHT.track_in_progress(), connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        self.observe(request, response, started, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = QueryCounter()
+        started = time.perf_counter()
+        with HTTP_REQUESTS_IN_FLIGHT.track_in_progress(), connection.execute_wrapper(queries):
+            response = await self.get_response(request)
+        self.observe(request, response, started, queries)
+        return response
+
+    def observe(self, request, response, started, queries):
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, route=route, method=request.method, status=response.status_code
+        )
+        HTTP_REQUEST_QUERIES.observe(queries.count, route=route)
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcripts", "0003_remove_videorecord_transcript"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="playlistsearchjob",
+            name="attempts",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="playlistsearchjob",
+            name="heartbeat_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="playlistsearchjob",
+            name="lease_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="playlistsearchjob",
+            name="worker_id",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name="playlistsearchjob",
+            index=models.Index(
+                fields=["status", "created_at"], name="transcripts_status_173efa_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcripts", "0004_playlistsearchjob_lease"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="playlistsearchjob",
+            name="known_video_count",
+            field=models.IntegerField(default=0),
+        ),
+    ]
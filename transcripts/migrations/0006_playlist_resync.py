@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcripts", "0005_playlistsearchjob_known_video_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="playlistsearchjob",
+            name="etag",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="playlistsearchjob",
+            name="last_synced_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="playlistsearchjob",
+            name="page_etags",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name="playlistsearchjob",
+            name="task",
+            field=models.CharField(
+                choices=[("ingest", "Ingest"), ("resync", "Resync")],
+                default="ingest",
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="videorecord",
+            name="removed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcripts", "0006_playlist_resync"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="videorecord",
+            name="views",
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:26
+
+from django.db import migrations, models
+
+# scripts/init_db.py creates the same tables for the scripts, so either may
+# run first on a shared database; this SQL must stay in step with it.
+CREATE_QUOTA_SQL = """
+    CREATE TABLE IF NOT EXISTS youtube_api_quota (
+        id BIGSERIAL PRIMARY KEY,
+        label VARCHAR(64) UNIQUE NOT NULL,
+        day DATE NOT NULL,
+        units_used INT NOT NULL DEFAULT 0,
+        daily_limit INT NOT NULL DEFAULT 10000,
+        tokens DOUBLE PRECISION NOT NULL DEFAULT 0,
+        refilled_at TIMESTAMPTZ NOT NULL,
+        exhausted BOOLEAN NOT NULL DEFAULT false
+    );
+    CREATE TABLE IF NOT EXISTS youtube_api_quota_ledger (
+        id BIGSERIAL PRIMARY KEY,
+        label VARCHAR(64) NOT NULL,
+        method VARCHAR(100) NOT NULL,
+        units INT NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS youtube_api_created_37abd1_idx ON youtube_api_quota_ledger (created_at);
+"""
+
+DROP_QUOTA_SQL = """
+    DROP TABLE IF EXISTS youtube_api_quota_ledger;
+    DROP TABLE IF EXISTS youtube_api_quota;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcripts", "0007_videorecord_views"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="playlistsearchjob",
+            name="run_after",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(CREATE_QUOTA_SQL, DROP_QUOTA_SQL),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name="ApiKeyQuota",
+                    fields=[
+                        (
+                            "id",
+                            models.BigAutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name="ID",
+                            ),
+                        ),
+                        ("label", models.CharField(max_length=64, unique=True)),
+                        ("day", models.DateField()),
+                        ("units_used", models.IntegerField(default=0)),
+                        ("daily_limit", models.IntegerField(default=10000)),
+                        ("tokens", models.FloatField(default=0)),
+                        ("refilled_at", models.DateTimeField()),
+                        ("exhausted", models.BooleanField(default=False)),
+                    ],
+                    options={
+                        "db_table": "youtube_api_quota",
+                    },
+                ),
+                migrations.CreateModel(
+                    name="ApiQuotaLedger",
+                    fields=[
+                        (
+                            "id",
+                            models.BigAutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name="ID",
+                            ),
+                        ),
+                        ("label", models.CharField(max_length=64)),
+                        ("method", models.CharField(max_length=100)),
+                        ("units", models.IntegerField()),
+                        ("created_at", models.DateTimeField(auto_now_add=True)),
+                    ],
+                    options={
+                        "db_table": "youtube_api_quota_ledger",
+                        "indexes": [
+                            models.Index(
+                                fields=["created_at"], name="youtube_api_created_37abd1_idx"
+                            )
+                        ],
+                    },
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcripts", "0008_api_quota"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JobProgress",
+            fields=[
+                (
+                    "job",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="progress",
+                        serialize=False,
+                        to="transcripts.playlistsearchjob",
+                    ),
+                ),
+                ("phase", models.CharField(default="queued", max_length=20)),
+                ("phase_started_at", models.DateTimeField(blank=True, null=True)),
+                ("videos_expected", models.IntegerField(default=0)),
+                ("pages_fetched", models.IntegerField(default=0)),
+                ("videos_discovered", models.IntegerField(default=0)),
+                ("transcripts_total", models.IntegerField(default=0)),
+                ("transcripts_fetched", models.IntegerField(default=0)),
+                ("transcripts_failed", models.IntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
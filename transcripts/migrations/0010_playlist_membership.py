@@ -0,0 +1,140 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_memberships(apps, schema_editor):
+    """Every stored video becomes a member of the job that stored it."""
+    VideoRecord = apps.get_model("transcripts", "VideoRecord")
+    PlaylistMembership = apps.get_model("transcripts", "PlaylistMembership")
+    memberships = []
+    positions = {}
+    videos = VideoRecord.objects.filter(playlist_job__isnull=False).order_by("id")
+    for video in videos.iterator(chunk_size=2000):
+        position = positions.get(video.playlist_job_id, 0)
+        positions[video.playlist_job_id] = position + 1
+        memberships.append(
+            PlaylistMembership(
+                job_id=video.playlist_job_id,
+                video_id=video.id,
+                position=position,
+                removed_at=video.removed_at,
+            )
+        )
+        if len(memberships) >= 2000:
+            PlaylistMembership.objects.bulk_create(memberships)
+            memberships = []
+    PlaylistMembership.objects.bulk_create(memberships)
+
+
+def restore_removed_at(apps, schema_editor):
+    VideoRecord = apps.get_model("transcripts", "VideoRecord")
+    PlaylistMembership = apps.get_model("transcripts", "PlaylistMembership")
+    removed = PlaylistMembership.objects.filter(removed_at__isnull=False)
+    for membership in removed.select_related("video").iterator(chunk_size=2000):
+        if membership.video.playlist_job_id == membership.job_id:
+            VideoRecord.objects.filter(pk=membership.video_id).update(
+                removed_at=membership.removed_at
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcripts", "0009_jobprogress"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="videorecord",
+            name="playlist_job",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="discovered_videos",
+                to="transcripts.playlistsearchjob",
+            ),
+        ),
+        migrations.CreateModel(
+            name="PlaylistMembership",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("position", models.IntegerField(default=0)),
+                ("added_at", models.DateTimeField(auto_now_add=True)),
+                ("removed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "job",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="memberships",
+                        to="transcripts.playlistsearchjob",
+                    ),
+                ),
+                (
+                    "video",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="memberships",
+                        to="transcripts.videorecord",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="PlaylistBatch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "jobs",
+                    models.ManyToManyField(
+                        related_name="batches", to="transcripts.playlistsearchjob"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="playlistsearchjob",
+            name="videos",
+            field=models.ManyToManyField(
+                related_name="playlists",
+                through="transcripts.PlaylistMembership",
+                to="transcripts.videorecord",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="playlistmembership",
+            index=models.Index(
+                fields=["job", "position"], name="transcripts_job_id_da95ac_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="playlistmembership",
+            constraint=models.UniqueConstraint(
+                fields=("job", "video"), name="unique_playlist_membership"
+            ),
+        ),
+        migrations.RunPython(copy_memberships, restore_removed_at),
+        migrations.RemoveField(
+            model_name="videorecord",
+            name="removed_at",
+        ),
+    ]
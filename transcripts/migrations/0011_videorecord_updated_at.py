@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcripts", "0010_playlist_membership"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="videorecord",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
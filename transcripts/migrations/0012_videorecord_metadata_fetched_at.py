@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:40
+
+from django.db import migrations, models
+from django.db.models import F, Q
+
+
+def mark_enriched(apps, schema_editor):
+    """Videos with a duration or views came from videos.list already."""
+    VideoRecord = apps.get_model("transcripts", "VideoRecord")
+    VideoRecord.objects.filter(Q(duration__gt=0) | Q(views__gt=0)).update(
+        metadata_fetched_at=F("updated_at")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcripts", "0011_videorecord_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="videorecord",
+            name="metadata_fetched_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_enriched, migrations.RunPython.noop),
+    ]
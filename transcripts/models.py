@@ -13,6 +13,8 @@ class PlaylistSearchJob(models.Model):
     playlist_id = models.CharField(max_length=100, unique=True)
     playlist_title = models.CharField(max_length=255, blank=True, null=True)
     video_count = models.IntegerField(default=0)
+    # Videos in the playlist that were already stored before this job ran
+    known_video_count = models.IntegerField(default=0)
 
     status = models.CharField(
         max_length=20,
@@ -22,26 +24,160 @@ class PlaylistSearchJob(models.Model):
 
     error_message = models.TextField(blank=True)
 
+    # What the worker should do when it claims the job
+    task = models.CharField(
+        max_length=20,
+        choices=[('ingest', 'Ingest'), ('resync', 'Resync')],
+        default='ingest'
+    )
+
+    # Conditional-request state from the last sync: the playlist's ETag and,
+    # per playlistItems page, its token, ETag, next token and video ids.
+    etag = models.CharField(max_length=255, blank=True)
+    page_etags = models.JSONField(default=list, blank=True)
+    last_synced_at = models.DateTimeField(blank=True, null=True)
+
+    # Queue bookkeeping: the worker holding the lease, when the lease runs out
+    # and how many times the job has been claimed.
+    worker_id = models.CharField(max_length=255, blank=True)
+    lease_expires_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+    # Deferred until this time, e.g. when the API quota ran out
+    run_after = models.DateTimeField(blank=True, null=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     completed_at = models.DateTimeField(blank=True, null=True)
 
+    # Every video in the playlist. A video shared by several playlists is
+    # stored once and linked to each of them.
+    videos = models.ManyToManyField('VideoRecord', through='PlaylistMembership', related_name='playlists')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
     def __str__(self):
         return f"{self.playlist_title or self.playlist_id} ({self.status})"
 
 class VideoRecord(models.Model):
+    # The job that first stored the video; membership is ``playlists``
     playlist_job = models.ForeignKey(
         PlaylistSearchJob,
-        on_delete=models.CASCADE,
-        related_name='videos'
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='discovered_videos'
     )
     video_id = models.CharField(max_length=255, unique=True)
     title = models.CharField(max_length=500)
     channel_name = models.CharField(max_length=255)
     duration = models.IntegerField()
+    views = models.BigIntegerField(default=0)
+
+    # Set once videos.list has been asked for the video's duration and views
+    # (also when it no longer returns it); syncs enrich videos where it is null
+    metadata_fetched_at = models.DateTimeField(blank=True, null=True)
 
     transcript_fetched = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bulk updates (bulk_update, QuerySet.update) must set it themselves;
+    # cached job pages are revalidated against it.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.title} ({self.video_id})"
+
+
+class PlaylistMembership(models.Model):
+    """A video's place in one playlist."""
+    job = models.ForeignKey(PlaylistSearchJob, on_delete=models.CASCADE, related_name='memberships')
+    video = models.ForeignKey(VideoRecord, on_delete=models.CASCADE, related_name='memberships')
+    position = models.IntegerField(default=0)
+    added_at = models.DateTimeField(auto_now_add=True)
+    # Set when a resync no longer finds the video in the playlist
+    removed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'video'], name='unique_playlist_membership'),
+        ]
+        indexes = [
+            models.Index(fields=['job', 'position']),
+        ]
+
+    def __str__(self):
+        return f"{self.video_id} in job {self.job_id} at {self.position}"
+
+
+class PlaylistBatch(models.Model):
+    """Playlists submitted together, e.g. every playlist of a channel."""
+    jobs = models.ManyToManyField(PlaylistSearchJob, related_name='batches')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Batch {self.pk}"
+
+
+class ApiKeyQuota(models.Model):
+    """Data API quota state per key, shared by every process through Postgres.
+
+    ``label`` identifies the key without storing it. ``tokens`` is the key's
+    token bucket, refilled at ``daily_limit`` units per day.
+    """
+    label = models.CharField(max_length=64, unique=True)
+    day = models.DateField()
+    units_used = models.IntegerField(default=0)
+    daily_limit = models.IntegerField(default=10000)
+    tokens = models.FloatField(default=0)
+    refilled_at = models.DateTimeField()
+    exhausted = models.BooleanField(default=False)
+
+    class Meta:
+        db_table = 'youtube_api_quota'
+
+    def __str__(self):
+        return f"{self.label}: {self.units_used}/{self.daily_limit} on {self.day}"
+
+
+class ApiQuotaLedger(models.Model):
+    """One row per Data API call and the quota units it cost."""
+    label = models.CharField(max_length=64)
+    method = models.CharField(max_length=100)
+    units = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'youtube_api_quota_ledger'
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.method} ({self.units}) via {self.label}"
+
+
+class JobProgress(models.Model):
+    """Running counters for one job, updated in place as the work advances.
+
+    Progress streams read this single row instead of counting ``VideoRecord``
+    rows, so watching a job costs one primary-key lookup per interval.
+    """
+    job = models.OneToOneField(
+        PlaylistSearchJob, on_delete=models.CASCADE, primary_key=True, related_name='progress'
+    )
+    phase = models.CharField(max_length=20, default='queued')
+    # When the current phase began, for the ETA
+    phase_started_at = models.DateTimeField(blank=True, null=True)
+    videos_expected = models.IntegerField(default=0)
+    pages_fetched = models.IntegerField(default=0)
+    videos_discovered = models.IntegerField(default=0)
+    transcripts_total = models.IntegerField(default=0)
+    transcripts_fetched = models.IntegerField(default=0)
+    transcripts_failed = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.title} ({self.video_id})"
\ No newline at end of file
+        return f"Job {self.job_id}: {self.phase}"
@@ -0,0 +1,188 @@
+"""Compact one-row-per-video transcript storage.
+
+The ``transcripts`` table keeps one row per caption line, which costs a
+tuple header, a serial id, a timestamp and an index entry for every five or
+so words. ``transcripts_packed`` instead keeps each video's transcript as a
+single ``bytea`` blob laid out in columns::
+
+    header    magic b'TPK1', segment count n, compressed text length
+    starts    n x uint32, milliseconds
+    durations n x uint32, milliseconds
+    offsets   (n + 1) x uint32, byte offsets of each line in the text block
+    text      zlib-compressed UTF-8, all lines concatenated
+
+All integers are little-endian.
+
+``PackedTranscript`` reads a blob without copying it: the timing columns
+are ``memoryview`` casts over the original buffer and the text block is only
+decompressed when a line's text is first needed, so finding the line at a
+given second touches nothing but the starts column. Times are whole
+milliseconds, the precision YouTube captions come in, so they round-trip
+exactly and decode with one division instead of float rounding. A missing
+start is stored as the previous line's (0 for the first), so the starts
+column stays sorted for bisecting; a missing duration is ``MISSING``.
+
+No Django imports; ``read_transcript`` works on any DB-API cursor.
+"""
+import array
+import bisect
+import struct
+import sys
+import zlib
+
+MAGIC = b'TPK1'
+HEADER = struct.Struct('<4sII')
+MISSING = 0xFFFFFFFF  # a duration that was NULL / None
+
+# Storage modes accepted by the writers
+STORAGE_ROWS = 'rows'
+STORAGE_PACKED = 'packed'
+
+READ_PACKED_SQL = "SELECT data FROM transcripts_packed WHERE video_id = %s"
+READ_ROWS_SQL = "SELECT start_time, duration, text FROM transcripts WHERE video_id = %s ORDER BY id"
+
+
+def _field(item, name):
+    return item.get(name) if isinstance(item, dict) else getattr(item, name)
+
+
+def _ms(seconds):
+    return MISSING if seconds is None else round(seconds * 1000)
+
+
+def pack(segments, level=6):
+    """Encode ``[{'text', 'start', 'duration'}, ...]`` (or snippet objects) as one blob."""
+    starts = array.array('I')
+    durations = array.array('I')
+    offsets = array.array('I', [0])
+    text = bytearray()
+    for item in segments:
+        start = _field(item, 'start')
+        starts.append((starts[-1] if starts else 0) if start is None else _ms(start))
+        durations.append(_ms(_field(item, 'duration')))
+        text += (_field(item, 'text') or '').encode()
+        offsets.append(len(text))
+    if sys.byteorder == 'big':
+        for column in (starts, durations, offsets):
+            column.byteswap()
+    compressed = zlib.compress(bytes(text), level)
+    return b''.join([
+        HEADER.pack(MAGIC, len(starts), len(compressed)),
+        starts.tobytes(), durations.tobytes(), offsets.tobytes(), compressed,
+    ])
+
+
+def _column(view, typecode):
+    if sys.byteorder == 'little':
+        return view.cast(typecode)
+    column = array.array(typecode, view.tobytes())  # copy only on big-endian hosts
+    column.byteswap()
+    return memoryview(column)
+
+
+class PackedTranscript:
+    """Read-only sequence of segments backed by a packed blob.
+
+    Indexing and iteration yield ``{'text', 'start', 'duration'}`` dicts, the
+    same shape as ``FetchedTranscript.to_raw_data()``.
+    """
+
+    def __init__(self, data):
+        view = memoryview(data).cast('B')
+        magic, count, text_length = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError('Not a packed transcript')
+        position = HEADER.size
+        self.starts = _column(view[position:position + 4 * count], 'I')
+        position += 4 * count
+        self.durations = _column(view[position:position + 4 * count], 'I')
+        position += 4 * count
+        self.offsets = _column(view[position:position + 4 * (count + 1)], 'I')
+        position += 4 * (count + 1)
+        self._compressed = view[position:position + text_length]
+        self._text = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def text_block(self):
+        if self._text is None:
+            self._text = memoryview(zlib.decompress(self._compressed))
+        return self._text
+
+    def text(self, index):
+        return str(self.text_block[self.offsets[index]:self.offsets[index + 1]], 'utf-8')
+
+    def _time(self, column, index):
+        value = column[index]
+        return None if value == MISSING else value / 1000
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return {
+            'text': self.text(index),
+            'start': self._time(self.starts, index),
+            'duration': self._time(self.durations, index),
+        }
+
+    def __iter__(self):
+        # Bulk path: one pass over each column instead of per-line indexing
+        text = self.text_block.tobytes()
+        offsets = self.offsets.tolist()
+        for start, duration, begin, end in zip(
+            self.starts.tolist(), self.durations.tolist(), offsets, offsets[1:]
+        ):
+            yield {
+                'text': text[begin:end].decode(),
+                'start': None if start == MISSING else start / 1000,
+                'duration': None if duration == MISSING else duration / 1000,
+            }
+
+    def index_at(self, seconds):
+        """Index of the line being spoken at ``seconds``; reads only the starts column.
+
+        Only meaningful for a non-empty transcript.
+        """
+        return max(bisect.bisect_right(self.starts, seconds * 1000) - 1, 0)
+
+    def to_raw_data(self):
+        return list(self)
+
+
+def read_transcript(cursor, video_id):
+    """Stored segments of ``video_id`` in whichever format they were written.
+
+    Returns a ``PackedTranscript``, a list of segment dicts for the rows
+    format, or None when nothing is stored.
+    """
+    cursor.execute(READ_PACKED_SQL, [video_id])
+    row = cursor.fetchone()
+    if row is not None:
+        return PackedTranscript(row[0])
+    cursor.execute(READ_ROWS_SQL, [video_id])
+    segments = [
+        {'text': text, 'start': start, 'duration': duration}
+        for start, duration, text in cursor.fetchall()
+    ]
+    return segments or None
+
+
+def line_at(segments, seconds):
+    """The segment being spoken at ``seconds``, for either storage format.
+
+    None for an empty transcript. A line without a start counts as starting
+    with the line before it, as in ``pack``.
+    """
+    if not len(segments):
+        return None
+    if isinstance(segments, PackedTranscript):
+        return segments[segments.index_at(seconds)]
+    starts = []
+    for segment in segments:
+        start = segment['start']
+        starts.append((starts[-1] if starts else 0) if start is None else start)
+    return segments[max(bisect.bisect_right(starts, seconds) - 1, 0)]
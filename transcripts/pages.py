@@ -0,0 +1,92 @@
+"""Cached, conditional rendering of the HTML pages.
+
+Each page has a version computed with one small query: the index from its
+jobs' ``updated_at``, a job page from the job's ``updated_at`` plus the
+newest ``updated_at`` and the number of its current videos (the job is
+saved at the end of every sync, when memberships change). The version is
+both the ``ETag`` and part of the cache key, so a change to the job or any
+of its videos makes a new page and the stale one simply expires. Browsers
+revalidating an unchanged page get a 304 without a render, and other
+visitors get the cached HTML.
+
+Job pages list ``JOB_PAGE_SIZE`` videos at a time in playlist order.
+"""
+import hashlib
+import math
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Count, Max, Q
+from django.template.loader import render_to_string
+
+from .models import PlaylistSearchJob
+
+CACHE_SECONDS = 3600
+INDEX_JOBS = 10
+JOB_PAGE_SIZE = 100
+
+
+def _etag(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def recent_jobs():
+    # Newest first, on the primary key index
+    return PlaylistSearchJob.objects.order_by('-pk')[:INDEX_JOBS]
+
+
+def index_version():
+    """``(etag, last_modified)`` of the index page."""
+    jobs = list(recent_jobs().values_list('pk', 'updated_at'))
+    return _etag('index', jobs), max((updated_at for _, updated_at in jobs), default=None)
+
+
+def job_version(pk, page):
+    """``(etag, last_modified)`` of one page of a job, or ``(None, None)`` if there is no such job."""
+    live = Q(memberships__removed_at__isnull=True)
+    row = (
+        PlaylistSearchJob.objects.filter(pk=pk)
+        .annotate(
+            videos_updated_at=Max('memberships__video__updated_at', filter=live),
+            live_videos=Count('memberships', filter=live),
+        )
+        .values_list('updated_at', 'videos_updated_at', 'live_videos')
+        .first()
+    )
+    if row is None:
+        return None, None
+    updated_at, videos_updated_at, videos = row
+    # Out-of-range pages show the last page, as Paginator.get_page does
+    page = min(page, max(math.ceil(videos / JOB_PAGE_SIZE), 1))
+    last_modified = max(filter(None, (updated_at, videos_updated_at)))
+    return _etag('job', pk, page, updated_at, videos_updated_at, videos), last_modified
+
+
+def page_number(request):
+    """``?page=`` as a positive int; anything else is the first page."""
+    try:
+        return max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        return 1
+
+
+def cached_render(etag, template_name, context):
+    """Render ``template_name`` once per ``etag``; ``context`` is called only on a miss."""
+    key = f'page:{template_name}:{etag}'
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(template_name, context())
+        cache.set(key, html, CACHE_SECONDS)
+    return html
+
+
+def index_context():
+    return {'jobs': list(recent_jobs())}
+
+
+def job_context(job, page):
+    memberships = (
+        job.memberships.filter(removed_at__isnull=True).select_related('video').order_by('position', 'pk')
+    )
+    page_obj = Paginator(memberships, JOB_PAGE_SIZE).get_page(page)
+    return {'job': job, 'videos': [membership.video for membership in page_obj], 'page_obj': page_obj}
@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class VideoCursorPagination(CursorPagination):
+    """Keyset pagination on the primary key.
+
+    Pages are fetched with ``WHERE id < <cursor>`` on the index, so deep pages
+    cost the same as the first one and no ``COUNT(*)`` is run.
+    """
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+    max_page_size = 200
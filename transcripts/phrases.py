@@ -0,0 +1,219 @@
+"""Positional phrase index: where in a video each word is said.
+
+Caption lines are short and cut phrases in half, so the index numbers the
+tokens of a whole video consecutively, ignoring line breaks:
+
+- ``phrase_postings`` has one row per (term, video) with every position of
+  the term in that video;
+- ``phrase_segments`` keeps, per video, the position each caption line
+  starts at and its ``start_time``, which turns a position back into
+  (segment, offset) and a timestamp;
+- ``phrase_terms`` counts the videos each term occurs in.
+
+A query looks up its rarest term first and fetches the other terms' postings
+only for the videos that are still candidates, by primary key, so the work
+follows the rarest term rather than the corpus size. Stop words are indexed
+too, since phrases need them. Tables are created by ``scripts/init_db.py``
+and written in the same transaction as the transcript lines. Plain DB-API
+code with no Django imports, like ``fulltext``.
+"""
+import bisect
+from collections import Counter, defaultdict
+
+from psycopg2.extras import execute_values
+
+from .fulltext import watch_url
+from .terms import tokenize
+
+DELETE_POSTINGS_SQL = "DELETE FROM phrase_postings WHERE video_id = ANY(%s) RETURNING term"
+
+# Sorted by term, so concurrent writers take the row locks in the same order
+TERMS_SQL = """
+    INSERT INTO phrase_terms (term, videos) VALUES %s
+    ON CONFLICT (term) DO UPDATE SET videos = phrase_terms.videos + EXCLUDED.videos
+"""
+
+POSTINGS_SQL = "INSERT INTO phrase_postings (term, video_id, positions) VALUES %s"
+
+SEGMENTS_SQL = """
+    INSERT INTO phrase_segments (video_id, first_positions, start_times) VALUES %s
+    ON CONFLICT (video_id) DO UPDATE
+    SET first_positions = EXCLUDED.first_positions, start_times = EXCLUDED.start_times
+"""
+
+
+def index_video(segments):
+    """``(postings, first_positions, start_times)`` for ``[(text, start_time), ...]``."""
+    postings = defaultdict(list)
+    first_positions = []
+    start_times = []
+    position = 0
+    for text, start_time in segments:
+        first_positions.append(position)
+        start_times.append(start_time)
+        for token in tokenize(text or ''):
+            postings[token].append(position)
+            position += 1
+    return postings, first_positions, start_times
+
+
+def store(cursor, documents, page_size=5000):
+    """Index ``[(video_id, [(text, start_time), ...]), ...]``, replacing earlier entries.
+
+    Runs on the caller's cursor and leaves committing to the caller.
+    """
+    if not documents:
+        return
+    video_ids = [video_id for video_id, _ in documents]
+    cursor.execute(DELETE_POSTINGS_SQL, (video_ids,))
+    videos_per_term = Counter()
+    for (term,) in cursor.fetchall():
+        videos_per_term[term] -= 1
+
+    postings_rows = []
+    segment_rows = []
+    for video_id, segments in documents:
+        postings, first_positions, start_times = index_video(segments)
+        videos_per_term.update(postings.keys())
+        postings_rows.extend((term, video_id, positions) for term, positions in postings.items())
+        segment_rows.append((video_id, first_positions, start_times))
+
+    changed = sorted((term, delta) for term, delta in videos_per_term.items() if delta)
+    execute_values(cursor, TERMS_SQL, changed, page_size=page_size)
+    execute_values(cursor, POSTINGS_SQL, postings_rows, page_size=page_size)
+    execute_values(cursor, SEGMENTS_SQL, segment_rows, page_size=page_size)
+
+
+def _postings(cursor, term, video_ids=None):
+    if video_ids is None:
+        cursor.execute("SELECT video_id, positions FROM phrase_postings WHERE term = %s", (term,))
+    else:
+        cursor.execute(
+            "SELECT video_id, positions FROM phrase_postings WHERE term = %s AND video_id = ANY(%s)",
+            (term, list(video_ids)),
+        )
+    return cursor.fetchall()
+
+
+def _rarest_first(cursor, terms):
+    """Distinct ``terms``, rarest first; None if any of them is not indexed."""
+    cursor.execute("SELECT term, videos FROM phrase_terms WHERE term = ANY(%s) AND videos > 0", (terms,))
+    videos = dict(cursor.fetchall())
+    if len(videos) < len(set(terms)):
+        return None
+    return sorted(videos, key=videos.get)
+
+
+def _phrase_matches(cursor, tokens, order):
+    """{video_id: sorted start positions} of the exact token sequence."""
+    starts = None
+    for term in order:
+        offsets = [i for i, token in enumerate(tokens) if token == term]
+        found = {}
+        for video_id, positions in _postings(cursor, term, starts):
+            # A term repeated in the phrase must occur at each of its offsets
+            candidates = set.intersection(*({position - offset for position in positions} for offset in offsets))
+            if starts is not None:
+                candidates &= starts[video_id]
+            if candidates:
+                found[video_id] = candidates
+        starts = found
+        if not starts:
+            return {}
+    return {video_id: sorted(found) for video_id, found in starts.items()}
+
+
+def _windows(positions_by_term, within):
+    """Non-overlapping ``(start, span)`` windows of at most ``within`` tokens holding every term."""
+    events = sorted((position, term) for term, positions in enumerate(positions_by_term) for position in positions)
+    counts = [0] * len(positions_by_term)
+    present = 0
+    left = 0
+    last_end = -1
+    windows = []
+    for position, term in events:
+        if counts[term] == 0:
+            present += 1
+        counts[term] += 1
+        # Drop leading positions whose term occurs again later in the window
+        while counts[events[left][1]] > 1:
+            counts[events[left][1]] -= 1
+            left += 1
+        start = events[left][0]
+        if present == len(counts) and start > last_end and position - start < within:
+            windows.append((start, position - start + 1))
+            last_end = position
+    return windows
+
+
+def _proximity_matches(cursor, order, within):
+    """{video_id: [(start, span), ...]} where every term occurs within ``within`` tokens."""
+    positions = None
+    for term in order:
+        rows = _postings(cursor, term, positions)
+        found = {}
+        for video_id, term_positions in rows:
+            found[video_id] = (positions[video_id] if positions is not None else []) + [term_positions]
+        positions = found
+        if not positions:
+            return {}
+    matches = {}
+    for video_id, positions_by_term in positions.items():
+        windows = _windows(positions_by_term, within)
+        if windows:
+            matches[video_id] = windows
+    return matches
+
+
+def search(cursor, query, within=None, limit=20, offset=0):
+    """Moments ``query`` is said, as a list of dicts.
+
+    Without ``within`` the tokens must occur in order as an exact phrase;
+    with it, in any order within a window of ``within`` tokens. Either may
+    span caption lines. Exact matches are ranked by how often the video
+    says the phrase, proximity matches by how close together the words are.
+    Each result has ``video_id``, ``start_time`` (of the line the match
+    starts in), ``segment`` and ``offset`` (line number, and token offset in
+    that line), ``span`` in tokens and a ``url`` to that moment.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    order = _rarest_first(cursor, tokens)
+    if order is None:
+        return []
+
+    if within is None:
+        matches = _phrase_matches(cursor, tokens, order)
+        ranked = sorted(
+            ((-len(starts), video_id, start, len(tokens)) for video_id, starts in matches.items() for start in starts)
+        )
+    else:
+        matches = _proximity_matches(cursor, order, max(within, len(order)))
+        ranked = sorted(
+            (span, video_id, start, span) for video_id, windows in matches.items() for start, span in windows
+        )
+    page = ranked[offset:offset + limit]
+    if not page:
+        return []
+
+    cursor.execute(
+        "SELECT video_id, first_positions, start_times FROM phrase_segments WHERE video_id = ANY(%s)",
+        (sorted({video_id for _, video_id, _, _ in page}),),
+    )
+    segments = {video_id: (first_positions, start_times) for video_id, first_positions, start_times in cursor}
+
+    results = []
+    for _, video_id, start, span in page:
+        first_positions, start_times = segments.get(video_id, ([0], [None]))
+        segment = bisect.bisect_right(first_positions, start) - 1
+        start_time = start_times[segment]
+        results.append({
+            'video_id': video_id,
+            'start_time': start_time,
+            'segment': segment,
+            'offset': start - first_positions[segment],
+            'span': span,
+            'url': watch_url(video_id, start_time),
+        })
+    return results
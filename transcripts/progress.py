@@ -0,0 +1,170 @@
+"""Cheap per-job progress counters for the progress stream.
+
+Ingestion and transcript fetching bump counters on the job's
+``JobProgress`` row with ``F()`` updates, at most once per playlist page or
+transcript chunk. Readers go through ``snapshot``, which caches each row for
+a second, so any number of clients watching the same job cost one query per
+second per process.
+"""
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .models import JobProgress
+
+CACHE_SECONDS = 1
+
+# Phases after which the counters no longer change
+FINAL_PHASES = {'completed', 'failed'}
+
+PAGE_SIZE = 50
+
+
+def reset(job, phase='queued'):
+    """Zero the counters when a job is queued or requeued."""
+    JobProgress.objects.update_or_create(job=job, defaults={
+        'phase': phase,
+        'phase_started_at': timezone.now(),
+        'videos_expected': 0,
+        'pages_fetched': 0,
+        'videos_discovered': 0,
+        'transcripts_total': 0,
+        'transcripts_fetched': 0,
+        'transcripts_failed': 0,
+    })
+    cache.delete(_key(job.pk))
+
+
+def set_phase(job, phase, **fields):
+    """Enter ``phase``; ``fields`` sets counters such as ``videos_expected``."""
+    updated = JobProgress.objects.filter(job_id=job.pk).update(
+        phase=phase, phase_started_at=timezone.now(), updated_at=timezone.now(), **fields
+    )
+    if not updated:
+        JobProgress.objects.create(job_id=job.pk, phase=phase, phase_started_at=timezone.now(), **fields)
+
+
+def current_phase(job):
+    """The phase ``job`` is in, or None before it was ever queued."""
+    return JobProgress.objects.filter(job_id=job.pk).values_list('phase', flat=True).first()
+
+
+def leave_phase(job, phase, next_phase):
+    """Go from ``phase`` to ``next_phase``, unless another process has moved the job on meanwhile."""
+    JobProgress.objects.filter(job_id=job.pk, phase=phase).update(
+        phase=next_phase, phase_started_at=timezone.now(), updated_at=timezone.now()
+    )
+
+
+def add(job, **deltas):
+    """Increment counters, e.g. ``add(job, pages_fetched=1, videos_discovered=50)``."""
+    deltas = {name: F(name) + value for name, value in deltas.items() if value}
+    if deltas:
+        JobProgress.objects.filter(job_id=job.pk).update(updated_at=timezone.now(), **deltas)
+
+
+def _key(job_id):
+    return f'job-progress:{job_id}'
+
+
+def _eta(row, now):
+    """Seconds left in the current phase, extrapolated from its rate so far."""
+    if row['phase'] == 'syncing':
+        done, total = row['pages_fetched'], -(-row['videos_expected'] // PAGE_SIZE)
+    elif row['phase'] == 'transcripts':
+        done = row['transcripts_fetched'] + row['transcripts_failed']
+        total = row['transcripts_total']
+    else:
+        return None
+    if not done or not row['phase_started_at'] or done >= total:
+        return None
+    elapsed = (now - row['phase_started_at']).total_seconds()
+    return round(elapsed / done * (total - done), 1)
+
+
+def snapshot(job_id):
+    """Counters for ``job_id`` plus an ETA, at most ``CACHE_SECONDS`` old."""
+    key = _key(job_id)
+    row = cache.get(key)
+    if row is None:
+        row = JobProgress.objects.filter(job_id=job_id).values(
+            'phase', 'phase_started_at', 'videos_expected', 'pages_fetched', 'videos_discovered',
+            'transcripts_total', 'transcripts_fetched', 'transcripts_failed', 'updated_at',
+        ).first() or {
+            'phase': 'queued', 'phase_started_at': None, 'videos_expected': 0, 'pages_fetched': 0,
+            'videos_discovered': 0, 'transcripts_total': 0, 'transcripts_fetched': 0,
+            'transcripts_failed': 0, 'updated_at': None,
+        }
+        cache.set(key, row, CACHE_SECONDS)
+    data = dict(row, eta_seconds=_eta(row, timezone.now()))
+    for name in ('phase_started_at', 'updated_at'):
+        if data[name]:
+            data[name] = data[name].isoformat()
+    return data
+
+
+# How long one stream stays open before the client reconnects (EventSource
+# does so by itself), and the longest silence before a keepalive comment
+STREAM_SECONDS = 300
+KEEPALIVE_SECONDS = 15
+
+
+class EventStream:
+    """Server-Sent Events with one job's counters, checked every ``interval`` seconds.
+
+    An event is sent whenever the counters change, and a comment line keeps
+    idle connections open. The stream ends once the job completes or fails.
+    Iterate it from a WSGI worker thread, or ``async for`` it under ASGI,
+    where waiting between checks holds no thread. Under WSGI every open
+    stream holds a whole worker for up to ``STREAM_SECONDS``, longer than
+    gunicorn's default timeout, so serve the app over ASGI (see Procfile).
+    """
+
+    def __init__(self, job_id, interval):
+        self.job_id = job_id
+        self.interval = interval
+        self.last = None
+        self.last_sent = time.monotonic()
+        self.deadline = self.last_sent + STREAM_SECONDS
+        self.done = False
+
+    def _step(self, data):
+        """The text to send for a fresh ``snapshot``, if any."""
+        # The ETA moves every second; only a counter change is news
+        counters = {name: value for name, value in data.items() if name != 'eta_seconds'}
+        if counters != self.last:
+            self.last = counters
+            self.last_sent = time.monotonic()
+            self.done = data['phase'] in FINAL_PHASES
+            return f'event: progress\ndata: {json.dumps(data)}\n\n'
+        if time.monotonic() - self.last_sent >= KEEPALIVE_SECONDS:
+            self.last_sent = time.monotonic()
+            return ': keepalive\n\n'
+        return None
+
+    def _open(self):
+        return not self.done and time.monotonic() < self.deadline
+
+    def __iter__(self):
+        # Reconnect after a second if the connection drops
+        yield 'retry: 1000\n\n'
+        while self._open():
+            event = self._step(snapshot(self.job_id))
+            if event:
+                yield event
+            if not self.done:
+                time.sleep(self.interval)
+
+    async def __aiter__(self):
+        yield 'retry: 1000\n\n'
+        while self._open():
+            event = self._step(await sync_to_async(snapshot)(self.job_id))
+            if event:
+                yield event
+            if not self.done:
+                await asyncio.sleep(self.interval)
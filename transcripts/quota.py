@@ -0,0 +1,228 @@
+"""Daily YouTube Data API quota, shared by every process through Postgres.
+
+Each API key has a row in ``youtube_api_quota`` with the units spent today
+and a token bucket that refills at ``daily_limit`` units per day. Every call
+first reserves its cost with ``acquire``, which locks the key rows, picks the
+key with the most tokens and writes a ``youtube_api_quota_ledger`` row. When
+the bucket is empty the call waits for the refill, which spreads the quota
+over the day instead of spending it all in the first large ingest. Quota
+resets at midnight Pacific time, like Google's.
+
+No Django imports: the web app and the queue workers pass a Django cursor
+factory to ``configure``, the scripts pass ``psycopg2_atomic(conn)``.
+"""
+import hashlib
+import math
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+PACIFIC = ZoneInfo('America/Los_Angeles')
+
+# Units per call (https://developers.google.com/youtube/v3/determine_quota_cost).
+# Every list method not named here costs 1.
+COSTS = {
+    'search.list': 100,
+}
+
+READ_SQL = """
+    SELECT label, day, units_used, tokens, refilled_at, exhausted
+    FROM youtube_api_quota
+    WHERE label = ANY(%s)
+    ORDER BY label
+"""
+
+LOCK_SQL = READ_SQL + "FOR UPDATE\n"
+
+ENSURE_SQL = """
+    INSERT INTO youtube_api_quota
+        (label, day, units_used, daily_limit, tokens, refilled_at, exhausted)
+    VALUES (%s, %s, 0, %s, %s, %s, false)
+    ON CONFLICT (label) DO NOTHING
+"""
+
+UPDATE_SQL = """
+    UPDATE youtube_api_quota
+    SET day = %s, units_used = %s, daily_limit = %s, tokens = %s, refilled_at = %s,
+        exhausted = %s
+    WHERE label = %s
+"""
+
+LEDGER_SQL = """
+    INSERT INTO youtube_api_quota_ledger (label, method, units, created_at)
+    VALUES (%s, %s, %s, %s)
+"""
+
+
+class QuotaDeferred(Exception):
+    """No key can pay for the call before ``retry_at``."""
+
+    def __init__(self, message, retry_at):
+        super().__init__(message)
+        self.retry_at = retry_at
+
+
+def cost(method):
+    return COSTS.get(method, 1)
+
+
+def key_label(api_key):
+    """Stable name for a key; the key itself is never written to the database."""
+    return 'key-' + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+
+
+def quota_day(now):
+    return now.astimezone(PACIFIC).date()
+
+
+def next_reset(now):
+    """The next midnight Pacific time, when Google resets the daily quota."""
+    tomorrow = quota_day(now) + timedelta(days=1)
+    return datetime(tomorrow.year, tomorrow.month, tomorrow.day, tzinfo=PACIFIC).astimezone(timezone.utc)
+
+
+def psycopg2_atomic(conn):
+    """Cursor factory for ``configure`` backed by a dedicated psycopg2 connection."""
+    lock = threading.Lock()
+
+    @contextmanager
+    def atomic():
+        with lock, conn, conn.cursor() as cursor:
+            yield cursor
+
+    return atomic
+
+
+class QuotaScheduler:
+    def __init__(self, api_keys, daily_limit=10000, burst=500, max_wait=60.0):
+        self.keys = {key_label(api_key): api_key for api_key in api_keys}
+        self.daily_limit = daily_limit
+        self.burst = min(burst, daily_limit)
+        self.rate = daily_limit / 86400  # units per second
+        self.max_wait = max_wait
+        self.atomic = None
+        # Used only until ``configure`` is called, e.g. in a Python shell
+        self.local_exhausted = set()
+
+    def configure(self, atomic):
+        """Keep the ledger in Postgres; ``atomic()`` yields a cursor in a transaction."""
+        self.atomic = atomic
+
+    def _rows(self, cursor, now, lock=True):
+        """Today's state for every configured key, with the key rows locked.
+
+        ``lock=False`` only reads: nothing is written or locked, and a key
+        without a row yet shows as it would start, with a full bucket.
+        """
+        day = quota_day(now)
+        if lock:
+            for label in self.keys:
+                cursor.execute(ENSURE_SQL, [label, day, self.daily_limit, self.burst, now])
+        cursor.execute(LOCK_SQL if lock else READ_SQL, [list(self.keys)])
+        stored = {label: state for label, *state in cursor.fetchall()}
+        rows = []
+        for label in sorted(self.keys):
+            row_day, units_used, tokens, refilled_at, exhausted = stored.get(label, (day, 0, self.burst, now, False))
+            if row_day != day:
+                # A new quota day: every key starts over with a full bucket
+                units_used, tokens, refilled_at, exhausted = 0, self.burst, now, False
+            elapsed = max((now - refilled_at).total_seconds(), 0)
+            rows.append({
+                'label': label,
+                'units_used': units_used,
+                'tokens': min(self.burst, tokens + elapsed * self.rate),
+                'exhausted': exhausted,
+            })
+        return rows
+
+    def acquire(self, method, max_wait=None):
+        """Reserve quota for one call; returns ``(label, api_key)`` of the key to use.
+
+        Waits for the token bucket to refill, up to ``max_wait`` seconds.
+        Raises QuotaDeferred if every key is used up for the day or the wait
+        would be longer.
+        """
+        units = cost(method)
+        max_wait = self.max_wait if max_wait is None else max_wait
+        if not self.keys:
+            raise RuntimeError('No YouTube Data API key configured')
+        if self.atomic is None:
+            for label, api_key in self.keys.items():
+                if label not in self.local_exhausted:
+                    return label, api_key
+            now = datetime.now(timezone.utc)
+            raise QuotaDeferred('Every API key is out of quota for today', next_reset(now))
+
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self.atomic() as cursor:
+                now = datetime.now(timezone.utc)
+                rows = [
+                    row for row in self._rows(cursor, now)
+                    if not row['exhausted'] and row['units_used'] + units <= self.daily_limit
+                ]
+                if not rows:
+                    raise QuotaDeferred('Every API key is out of quota for today', next_reset(now))
+                row = max(rows, key=lambda row: row['tokens'])
+                if row['tokens'] >= units:
+                    cursor.execute(UPDATE_SQL, [
+                        quota_day(now), row['units_used'] + units, self.daily_limit,
+                        row['tokens'] - units, now, False, row['label'],
+                    ])
+                    cursor.execute(LEDGER_SQL, [row['label'], method, units, now])
+                    return row['label'], self.keys[row['label']]
+                wait = (units - row['tokens']) / self.rate
+            if time.monotonic() + wait > deadline:
+                raise QuotaDeferred(
+                    f'{method} paced: next {units} quota units free in {math.ceil(wait)}s',
+                    now + timedelta(seconds=wait),
+                )
+            time.sleep(wait)
+
+    def mark_exhausted(self, label):
+        """Stop using a key for the rest of the day after YouTube refused it."""
+        if self.atomic is None:
+            self.local_exhausted.add(label)
+            return
+        with self.atomic() as cursor:
+            now = datetime.now(timezone.utc)
+            day = quota_day(now)
+            self._rows(cursor, now)
+            cursor.execute(
+                """
+                UPDATE youtube_api_quota
+                SET units_used = CASE WHEN day = %s THEN units_used ELSE 0 END,
+                    day = %s, exhausted = true
+                WHERE label = %s
+                """,
+                [day, day, label],
+            )
+
+    def remaining(self):
+        """Units still available today across all keys."""
+        return sum(key['remaining'] for key in self.status()['keys'])
+
+    def status(self):
+        """Today's quota per key. Read-only, so monitoring never waits on or delays API calls."""
+        now = datetime.now(timezone.utc)
+        if self.atomic is None:
+            keys = [
+                {'label': label, 'units_used': None, 'tokens': None,
+                 'exhausted': label in self.local_exhausted,
+                 'remaining': 0 if label in self.local_exhausted else self.daily_limit}
+                for label in self.keys
+            ]
+        else:
+            with self.atomic() as cursor:
+                keys = self._rows(cursor, now, lock=False)
+            for key in keys:
+                key['tokens'] = round(key['tokens'], 1)
+                key['remaining'] = 0 if key['exhausted'] else max(self.daily_limit - key['units_used'], 0)
+        return {
+            'daily_limit': self.daily_limit,
+            'burst': self.burst,
+            'resets_at': next_reset(now).isoformat(),
+            'keys': keys,
+        }
@@ -0,0 +1,274 @@
+"""Shared retry policy and circuit breaker for every call to YouTube.
+
+``call`` retries transient failures with capped exponential backoff and full
+jitter, but only while the retry budget allows it. The budget caps retries
+at a fraction of overall traffic, so one outage cannot multiply the load.
+Errors that mean YouTube is refusing us (an IP block, an exhausted quota)
+open the circuit breaker. While it is open, every thread in the process waits
+out the cooldown instead of sending requests that are bound to fail. A single
+probe then decides whether to close it again.
+
+Breaker state lives in process memory. Each queue worker, web worker and
+script trips its own breaker after its own rejected requests; a block seen
+by one worker does not pause the others. The Data API quota, which is what
+all of them share, is paced across processes by ``quota.QuotaScheduler``.
+
+No Django imports; the web app, queue workers and scripts share the same
+module-level policies, whose state is reported by ``status()``.
+"""
+import random
+import threading
+import time
+
+import httplib2
+import requests
+from googleapiclient.errors import HttpError
+from youtube_transcript_api._errors import (
+    AgeRestricted,
+    InvalidVideoId,
+    NoTranscriptFound,
+    NotTranslatable,
+    PoTokenRequired,
+    RequestBlocked,
+    TranscriptsDisabled,
+    TranslationLanguageNotAvailable,
+    VideoUnavailable,
+    VideoUnplayable,
+)
+
+from .metrics import RETRY_EVENTS, RETRY_SLEEP_SECONDS
+from .quota import QuotaDeferred
+
+# Outcomes of a failed attempt
+TRANSIENT = 'transient'  # worth retrying
+BLOCKED = 'blocked'  # YouTube is refusing us: open the breaker
+PERMANENT = 'permanent'  # retrying cannot help; re-raise at once
+DEFERRED = 'deferred'  # never reached YouTube; re-raise without touching the breaker
+
+
+class CircuitOpen(Exception):
+    """YouTube calls are paused because the circuit breaker is open."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f'{name} calls paused for {retry_after:.0f}s after YouTube rejected requests')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, cooldown=60, max_cooldown=900):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.times_opened = 0
+        self.probing = False
+
+    def remaining(self):
+        with self.lock:
+            return max(self.open_until - time.monotonic(), 0) if self.state != 'closed' else 0
+
+    def before_call(self, block=True):
+        """Wait until a call may go out; raise CircuitOpen if ``block`` is False."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self.state == 'closed':
+                    return
+                if now >= self.open_until and not self.probing:
+                    # Let exactly one caller probe whether YouTube is back
+                    self.state = 'half_open'
+                    self.probing = True
+                    return
+                wait = max(self.open_until - now, 1)
+            if not block:
+                raise CircuitOpen(self.name, wait)
+            RETRY_SLEEP_SECONDS.inc(min(wait, 5), policy=self.name, reason='circuit_open')
+            time.sleep(min(wait, 5))
+
+    def record_success(self):
+        with self.lock:
+            self.state = 'closed'
+            self.consecutive_failures = 0
+            self.cooldown = self.base_cooldown
+            self.probing = False
+
+    def release(self):
+        """End a call that has no outcome; another caller may probe instead."""
+        with self.lock:
+            self.probing = False
+
+    def record_failure(self, blocked=False):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.state == 'half_open':
+                # The probe failed: stay open, and back off harder
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self._open()
+            elif blocked or self.consecutive_failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        self.state = 'open'
+        self.open_until = time.monotonic() + self.cooldown
+        self.times_opened += 1
+        self.probing = False
+
+    def status(self):
+        with self.lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'times_opened': self.times_opened,
+                'retry_after_seconds': round(max(self.open_until - time.monotonic(), 0), 1)
+                if self.state != 'closed' else 0,
+            }
+
+
+class RetryBudget:
+    """Retries may use at most ``ratio`` of the call volume, plus a small reserve."""
+
+    def __init__(self, ratio=0.2, reserve=10):
+        self.ratio = ratio
+        self.capacity = reserve
+        self.tokens = float(reserve)
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.tokens + self.ratio, self.capacity)
+
+    def withdraw(self):
+        with self.lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class RetryPolicy:
+    def __init__(self, name, classify, max_attempts=4, base_delay=1.0, max_delay=30.0,
+                 breaker=None, budget=None):
+        self.name = name
+        self.classify = classify
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker(name)
+        self.budget = budget or RetryBudget()
+        self.lock = threading.Lock()
+        self.counters = {'calls': 0, 'attempts': 0, 'retries': 0, 'failures': 0,
+                         'budget_exhausted': 0, 'rejected_open': 0}
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+        RETRY_EVENTS.inc(policy=self.name, event=name)
+
+    def backoff(self, attempt):
+        """Full jitter: uniform in [0, min(max_delay, base * 2**attempt)]."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, block=True):
+        """Run ``fn()`` under the policy and return its result.
+
+        ``block=False`` raises CircuitOpen instead of waiting for an open
+        breaker, for callers such as web requests that must not stall.
+        """
+        self._count('calls')
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                self.breaker.before_call(block=block)
+            except CircuitOpen:
+                self._count('rejected_open')
+                raise
+            self._count('attempts')
+            try:
+                result = fn()
+            except Exception as e:
+                kind = self.classify(e)
+                if kind == DEFERRED:
+                    self.breaker.release()
+                    raise
+                if kind == PERMANENT:
+                    # YouTube answered; the request itself was the problem
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure(blocked=kind == BLOCKED)
+                attempt += 1
+                if kind == BLOCKED or attempt >= self.max_attempts:
+                    self._count('failures')
+                    raise
+                if not self.budget.withdraw():
+                    self._count('budget_exhausted')
+                    self._count('failures')
+                    raise
+                self._count('retries')
+                delay = self.backoff(attempt)
+                RETRY_SLEEP_SECONDS.inc(delay, policy=self.name, reason='backoff')
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+    def status(self):
+        with self.lock:
+            counters = dict(self.counters)
+        counters['breaker'] = self.breaker.status()
+        counters['retry_budget_tokens'] = round(self.budget.tokens, 2)
+        return counters
+
+
+PERMANENT_TRANSCRIPT_ERRORS = (
+    TranscriptsDisabled, NoTranscriptFound, VideoUnavailable, VideoUnplayable, InvalidVideoId,
+    AgeRestricted, NotTranslatable, TranslationLanguageNotAvailable, PoTokenRequired,
+)
+
+QUOTA_REASONS = {'quotaExceeded', 'dailyLimitExceeded', 'rateLimitExceeded', 'userRateLimitExceeded'}
+
+
+def classify_transcript_error(error):
+    if isinstance(error, RequestBlocked):
+        return BLOCKED
+    if isinstance(error, PERMANENT_TRANSCRIPT_ERRORS):
+        return PERMANENT
+    if isinstance(error, requests.HTTPError) and error.response is not None \
+            and error.response.status_code == 429:
+        return BLOCKED
+    return TRANSIENT
+
+
+def http_error_reasons(error):
+    details = getattr(error, 'error_details', None)
+    if isinstance(details, list):
+        return {detail.get('reason') for detail in details if isinstance(detail, dict)}
+    return set()
+
+
+def classify_data_api_error(error):
+    if isinstance(error, QuotaDeferred):
+        return DEFERRED  # no quota to pay for the call; the caller defers the work
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        if status == 429 or (status == 403 and http_error_reasons(error) & QUOTA_REASONS):
+            return BLOCKED
+        if status >= 500:
+            return TRANSIENT
+        return PERMANENT  # including 304 Not Modified for conditional requests
+    if isinstance(error, (OSError, httplib2.HttpLib2Error)):
+        return TRANSIENT
+    return PERMANENT
+
+
+transcript_policy = RetryPolicy('transcripts', classify_transcript_error)
+data_api_policy = RetryPolicy('data_api', classify_data_api_error)
+
+
+def status():
+    return {policy.name: policy.status() for policy in (transcript_policy, data_api_policy)}
@@ -1,14 +1,34 @@
 from rest_framework import serializers
-from .models import PlaylistSearchJob, VideoRecord
+from .models import PlaylistMembership, PlaylistSearchJob, VideoRecord
 
 class VideoRecordSerializer(serializers.ModelSerializer):
+    # Per playlist; only set when videos are listed for one job
+    removed_at = serializers.DateTimeField(read_only=True, default=None)
+
     class Meta:
         model = VideoRecord
-        fields = ['id', 'video_id', 'title', 'channel_name', 'duration', 'transcript_fetched', 'created_at']
+        fields = ['id', 'video_id', 'title', 'channel_name', 'duration', 'views', 'transcript_fetched', 'created_at', 'removed_at']
+
+class PlaylistVideoSerializer(serializers.ModelSerializer):
+    """A video as a member of one playlist: the video's fields plus its place in the playlist."""
+
+    class Meta:
+        model = PlaylistMembership
+        fields = ['position', 'removed_at']
+
+    def to_representation(self, membership):
+        return {**VideoRecordSerializer(membership.video).data, **super().to_representation(membership)}
+
+class PlaylistSearchJobSummarySerializer(serializers.ModelSerializer):
+    """Job without its videos, for list views; page videos via /api/videos/?job=<id>."""
+
+    class Meta:
+        model = PlaylistSearchJob
+        fields = ['id', 'playlist_id', 'playlist_title', 'video_count', 'known_video_count', 'status', 'task', 'error_message', 'created_at', 'completed_at', 'last_synced_at']
 
 class PlaylistSearchJobSerializer(serializers.ModelSerializer):
-    videos = VideoRecordSerializer(many=True, read_only=True)
+    videos = PlaylistVideoSerializer(source='memberships', many=True, read_only=True)
 
     class Meta:
         model = PlaylistSearchJob
-        fields = ['id', 'playlist_id', 'playlist_title', 'video_count', 'status', 'error_message', 'videos', 'created_at', 'completed_at']
\ No newline at end of file
+        fields = ['id', 'playlist_id', 'playlist_title', 'video_count', 'known_video_count', 'status', 'task', 'error_message', 'videos', 'created_at', 'completed_at', 'last_synced_at']
@@ -0,0 +1,52 @@
+"""Streaming responses that stay streams under both WSGI and ASGI.
+
+Django 4.2 only streams a ``StreamingHttpResponse`` chunk by chunk when its
+iterator matches the server: a plain iterator under WSGI, an async one under
+ASGI. Given the other kind it reads the whole body into memory first, which
+would turn a 300-second progress stream or a large export into one late
+response. ``response()`` hands each server the kind it can stream.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+_DONE = object()
+
+
+def is_asgi(request):
+    return isinstance(request, ASGIRequest)
+
+
+async def _iterate(iterator):
+    """Advance a blocking iterator one chunk at a time off the event loop.
+
+    ``sync_to_async`` is thread-sensitive by default, so every chunk is made
+    on the request's own thread and a server-side cursor keeps its connection.
+    """
+    step = sync_to_async(next)
+    try:
+        while True:
+            chunk = await step(iterator, _DONE)
+            if chunk is _DONE:
+                return
+            yield chunk
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def response(request, content, **kwargs):
+    """A ``StreamingHttpResponse`` over ``content``.
+
+    ``content`` is an iterable, optionally also async-iterable (``__aiter__``),
+    in which case ASGI requests use the async side directly.
+    """
+    if not is_asgi(request):
+        content = iter(content)
+    elif hasattr(content, '__aiter__'):
+        # StreamingHttpResponse tries iter() first, so pass the async side alone
+        content = aiter(content)
+    else:
+        content = _iterate(iter(content))
+    return StreamingHttpResponse(content, **kwargs)
@@ -0,0 +1,59 @@
+"""Tokenizing and term counting for transcript text.
+
+Plain Python with no Django imports so the analysis scripts can use it from
+worker processes.
+"""
+import re
+from collections import Counter
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)*")
+
+STOP_WORDS = frozenset("""
+a about above after again against all also am an and any are aren't as at be
+because been before being below between both but by can can't cannot could
+couldn't did didn't do does doesn't doing don't down during each few for from
+further get gets getting go goes going gonna got had hadn't has hasn't have
+haven't having he he'd he'll he's her here here's hers herself him himself his
+how how's i i'd i'll i'm i've if in into is isn't it it's its itself just know
+let's like me more most mustn't my myself no nor not now of off oh okay ok on
+once only or other ought our ours ourselves out over own really right same say
+shan't she she'd she'll she's should shouldn't so some such than that that's
+the their theirs them themselves then there there's these they they'd they'll
+they're they've this those through to too um uh under until up us very was
+wasn't we we'd we'll we're we've well were weren't what what's when when's
+where where's which while who who's whom why why's will with won't would
+wouldn't yeah yes you you'd you'll you're you've your yours yourself
+yourselves
+""".split())
+
+
+def tokenize(text):
+    """Lowercase word tokens; captions like ``[Music]`` yield plain words."""
+    return TOKEN_RE.findall(text.lower())
+
+
+def ngrams(tokens, n):
+    """Space-joined n-grams that neither start nor end with a stop word.
+
+    Unigrams are simply the non-stop-word tokens.
+    """
+    if n == 1:
+        return [t for t in tokens if t not in STOP_WORDS and not t.isdigit()]
+    return [
+        " ".join(tokens[i:i + n])
+        for i in range(len(tokens) - n + 1)
+        if tokens[i] not in STOP_WORDS and tokens[i + n - 1] not in STOP_WORDS
+    ]
+
+
+def count_terms(documents, n=1):
+    """Count n-grams per document.
+
+    ``documents`` is a list of ``(video_id, [line, ...])``. Lines of a video
+    are joined so n-grams can span caption boundaries. Returns a list of
+    ``(video_id, Counter)``.
+    """
+    return [
+        (video_id, Counter(ngrams(tokenize(" ".join(lines)), n)))
+        for video_id, lines in documents
+    ]
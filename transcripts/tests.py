@@ -1,3 +1,1021 @@
-from django.test import TestCase
+import gzip
+import json
+import tempfile
+import time
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import httplib2
+import requests
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+from youtube_transcript_api._errors import NoTranscriptFound, RequestBlocked, TranscriptsDisabled
+
+from scripts.fake_youtube import FakeYouTube
+
+from . import (
+    batches, enrichment, export, fulltext, ingestion, jobqueue, metrics, packed, pages, phrases, quota,
+    retry, transcript_cache, transcript_fetcher, youtube, youtube_metadata,
+)
+from .ingestion import store_page
+from .models import PlaylistBatch, PlaylistMembership, PlaylistSearchJob, VideoRecord
+from .quota import QuotaDeferred, QuotaScheduler
+from .transcript_cache import TranscriptCache
+
+
+def segment(text, start, duration=1.0):
+    return {'text': text, 'start': start, 'duration': duration}
+
+
+def create_video(job, video_id, **fields):
+    video = VideoRecord.objects.create(
+        playlist_job=job, video_id=video_id, title=f'Title {video_id}', channel_name='Channel', duration=0,
+        **fields
+    )
+    PlaylistMembership.objects.create(job=job, video=video)
+    return video
+
+
+def temporary_cache(test):
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    return TranscriptCache(directory.name, max_bytes=10 ** 6, ttl_seconds=60, missing_ttl_seconds=60)
+
+
+def create_transcripts_table(lines, packed_transcripts=None, on_commit='DROP'):
+    """Temporary ``transcripts`` and ``transcripts_packed`` tables (created by init_db.py, not migrations).
+
+    ``lines`` are ``(video_id, start_time, text)`` rows and
+    ``packed_transcripts`` maps video ids to segments. The tables are dropped
+    when the test's transaction ends; tests without one pass
+    ``on_commit='PRESERVE ROWS'`` and drop them with ``drop_transcripts_table``.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE TEMP TABLE transcripts (
+                id SERIAL PRIMARY KEY,
+                video_id VARCHAR(255) NOT NULL,
+                text TEXT NOT NULL,
+                start_time FLOAT,
+                duration FLOAT,
+                text_tsv tsvector GENERATED ALWAYS AS (to_tsvector('english', text)) STORED
+            ) ON COMMIT {on_commit}
+        """)
+        cursor.execute(f"""
+            CREATE TEMP TABLE transcripts_packed (
+                video_id VARCHAR(255) PRIMARY KEY,
+                segments INT NOT NULL,
+                data BYTEA NOT NULL
+            ) ON COMMIT {on_commit}
+        """)
+        cursor.executemany(
+            "INSERT INTO transcripts (video_id, start_time, text, duration) VALUES (%s, %s, %s, 1.0)", lines
+        )
+        cursor.executemany(
+            "INSERT INTO transcripts_packed (video_id, segments, data) VALUES (%s, %s, %s)",
+            [(video_id, len(segments), packed.pack(segments))
+             for video_id, segments in (packed_transcripts or {}).items()],
+        )
+
+
+def drop_transcripts_table():
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS transcripts, transcripts_packed")
+
+
+class JobQueueTests(TestCase):
+    def test_claims_oldest_pending_job(self):
+        first = PlaylistSearchJob.objects.create(playlist_id='first')
+        PlaylistSearchJob.objects.create(playlist_id='second')
+
+        job = jobqueue.claim_job('worker-1', lease_seconds=60)
+        self.assertEqual(job.pk, first.pk)
+        self.assertEqual(job.attempts, 1)
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.worker_id), ('processing', 'worker-1'))
+        self.assertGreater(first.lease_expires_at, timezone.now())
+
+    def test_skips_jobs_not_due_yet(self):
+        PlaylistSearchJob.objects.create(playlist_id='later', run_after=timezone.now() + timedelta(hours=1))
+        self.assertIsNone(jobqueue.claim_job('worker-1'))
+
+    def test_expired_lease_is_claimed_again(self):
+        job = PlaylistSearchJob.objects.create(
+            playlist_id='stuck', status='processing', worker_id='dead', attempts=1,
+            lease_expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        claimed = jobqueue.claim_job('worker-2')
+        self.assertEqual((claimed.pk, claimed.attempts), (job.pk, 2))
+        # The old worker can no longer renew or complete it
+        with self.assertRaises(jobqueue.LeaseLost):
+            jobqueue.heartbeat(job, 'dead')
+        self.assertFalse(jobqueue.complete_job(job, 'dead'))
+        self.assertTrue(jobqueue.complete_job(job, 'worker-2'))
+
+    def test_live_lease_is_not_claimed(self):
+        PlaylistSearchJob.objects.create(
+            playlist_id='busy', status='processing', worker_id='alive', attempts=1,
+            lease_expires_at=timezone.now() + timedelta(seconds=60),
+        )
+        self.assertIsNone(jobqueue.claim_job('worker-2'))
+
+    def test_expired_lease_out_of_attempts_fails(self):
+        job = PlaylistSearchJob.objects.create(
+            playlist_id='doomed', status='processing', worker_id='dead', attempts=jobqueue.MAX_ATTEMPTS,
+            lease_expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        self.assertIsNone(jobqueue.claim_job('worker-2'))
+        self.assertEqual(jobqueue.reclaim_expired(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_defer_gives_the_attempt_back(self):
+        PlaylistSearchJob.objects.create(playlist_id='deferred')
+        job = jobqueue.claim_job('worker-1')
+        run_after = timezone.now() + timedelta(hours=1)
+        self.assertTrue(jobqueue.defer_job(job, 'worker-1', run_after, 'out of quota'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.run_after), ('pending', 0, run_after))
+
+
+class RateLimiterTests(SimpleTestCase):
+    def test_spaces_out_acquisitions(self):
+        limiter = transcript_fetcher.RateLimiter(50)
+        started = time.monotonic()
+        for _ in range(6):
+            limiter.acquire()
+        # No burst: even the first calls wait their turn
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_zero_rate_is_unlimited(self):
+        limiter = transcript_fetcher.RateLimiter(0)
+        started = time.monotonic()
+        for _ in range(1000):
+            limiter.acquire()
+        self.assertLess(time.monotonic() - started, 0.5)
+
+
+class FetchTranscriptsTests(TestCase):
+    def setUp(self):
+        self.job = PlaylistSearchJob.objects.create(playlist_id='playlist')
+        self.cache = temporary_cache(self)
+        patcher = mock.patch.object(transcript_fetcher, 'cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def download(self, video_id):
+        if video_id == 'disabled':
+            raise TranscriptsDisabled(video_id)
+        self.cache.set(video_id, ('en',), [segment(video_id, 0.0)])
+
+    def test_fetches_and_flags_videos(self):
+        for video_id in ('a', 'b', 'disabled'):
+            create_video(self.job, video_id)
+        self.cache.set('b', ('en',), [])
+
+        with mock.patch.object(transcript_fetcher, 'download_transcript', side_effect=self.download) as download:
+            report = transcript_fetcher.fetch_transcripts(self.job.videos.all(), max_workers=2, rate=0, chunk_size=1)
+
+        self.assertEqual((report['fetched'], report['failed']), (2, 1))
+        self.assertEqual(report['stats']['cache_hits'], 1)
+        # 'b' came from the cache; 'disabled' is permanent and not retried
+        self.assertEqual(sorted(call.args[0] for call in download.call_args_list), ['a', 'disabled'])
+        self.assertEqual(
+            set(VideoRecord.objects.filter(transcript_fetched=True).values_list('video_id', flat=True)), {'a', 'b'}
+        )
+
+    def test_view_skips_removed_videos(self):
+        create_video(self.job, 'a')
+        create_video(self.job, 'gone')
+        PlaylistMembership.objects.filter(video__video_id='gone').update(removed_at=timezone.now())
+
+        with mock.patch.object(transcript_fetcher, 'download_transcript', side_effect=self.download):
+            response = self.client.post(
+                f'/api/playlists/{self.job.pk}/fetch_transcripts/', {'rps': 0}, content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['video_id'] for result in response.json()['results']], ['a'])
+
+    def test_view_rejects_bad_options(self):
+        response = self.client.post(
+            f'/api/playlists/{self.job.pk}/fetch_transcripts/', {'rps': -1}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+def playlist_item(video_id):
+    return {'snippet': {'resourceId': {'videoId': video_id}, 'title': f'Title {video_id}', 'channelTitle': 'Channel'}}
+
+
+class StorePageTests(TestCase):
+    def setUp(self):
+        self.job = PlaylistSearchJob.objects.create(playlist_id='playlist')
+
+    def test_inserts_new_videos_with_positions(self):
+        inserted, known = store_page(self.job, [playlist_item('a'), playlist_item('b'), playlist_item('a')], 50)
+        self.assertEqual((inserted, known), (['a', 'b'], []))
+        self.assertEqual(
+            list(self.job.memberships.order_by('position').values_list('video__video_id', 'position')),
+            [('a', 50), ('b', 51)],
+        )
+
+    def test_rerun_is_idempotent(self):
+        store_page(self.job, [playlist_item('a')])
+        inserted, known = store_page(self.job, [playlist_item('a'), playlist_item('b')])
+        # 'a' was stored by this job's earlier attempt: neither new nor known
+        self.assertEqual((inserted, known), (['b'], []))
+        self.assertEqual(VideoRecord.objects.count(), 2)
+        self.assertEqual(PlaylistMembership.objects.filter(job=self.job).count(), 2)
+
+    def test_videos_shared_with_another_playlist(self):
+        other = PlaylistSearchJob.objects.create(playlist_id='other')
+        store_page(other, [playlist_item('a')])
+        inserted, known = store_page(self.job, [playlist_item('a'), playlist_item('b')])
+        self.assertEqual((inserted, known), (['b'], ['a']))
+        video = VideoRecord.objects.get(video_id='a')
+        self.assertEqual(video.playlist_job_id, other.pk)
+        self.assertEqual(set(video.playlists.values_list('pk', flat=True)), {other.pk, self.job.pk})
+
+    def test_skips_items_without_a_video(self):
+        deleted = {'snippet': {'resourceId': {}, 'title': 'Deleted video', 'channelTitle': ''}}
+        inserted, _ = store_page(self.job, [deleted, playlist_item('a')])
+        self.assertEqual(inserted, ['a'])
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        create_transcripts_table([
+            ('a', 0.0, 'We talk about the weather'),
+            ('a', 5.5, 'Python parsing, python testing and more python'),
+            ('b', 1.0, 'A short python aside'),
+            ('b', 2.0, 'Nothing to see here'),
+        ])
+
+    def test_plain_search_in_insertion_order(self):
+        with connection.cursor() as cursor:
+            rows = fulltext.search(cursor, 'python').fetchall()
+        self.assertEqual([row[:2] for row in rows], [('a', 5.5), ('b', 1.0)])
+
+    def test_ranked_search_puts_the_best_match_first(self):
+        with connection.cursor() as cursor:
+            rows = fulltext.search(cursor, 'python', ranked=True).fetchall()
+        self.assertEqual([row[0] for row in rows], ['a', 'b'])
+        self.assertGreater(rows[0][2], rows[1][2])
+        self.assertIn('[Python]', rows[0][3])
+
+    def test_paging_and_query_syntax(self):
+        with connection.cursor() as cursor:
+            rows = fulltext.search(cursor, 'python', limit=1, offset=1, ranked=True).fetchall()
+            self.assertEqual([row[0] for row in rows], ['b'])
+            rows = fulltext.search(cursor, 'python -testing').fetchall()
+            self.assertEqual([row[0] for row in rows], ['b'])
+
+    def test_api(self):
+        response = self.client.get('/api/search/', {'q': 'weather'})
+        self.assertEqual(response.status_code, 200)
+        [result] = response.json()['results']
+        self.assertEqual(result['url'], 'https://www.youtube.com/watch?v=a&t=0s')
+        self.assertEqual(self.client.get('/api/search/', {'q': ' '}).status_code, 400)
+
+    def test_watch_url(self):
+        self.assertEqual(fulltext.watch_url('v', 61.9), 'https://www.youtube.com/watch?v=v&t=61s')
+        self.assertEqual(fulltext.watch_url('v', None), 'https://www.youtube.com/watch?v=v')
+
+
+class PlaylistApiTests(TestCase):
+    def setUp(self):
+        self.job = PlaylistSearchJob.objects.create(playlist_id='playlist')
+        for position, video_id in enumerate('abcde'):
+            video = create_video(self.job, video_id)
+            PlaylistMembership.objects.filter(video=video).update(position=position)
+
+    def test_list_leaves_out_videos(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/playlists/')
+        [job] = response.json()['results']
+        self.assertEqual(job['playlist_id'], 'playlist')
+        self.assertNotIn('videos', job)
+
+    def test_detail_prefetches_videos_in_playlist_order(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/playlists/{self.job.pk}/')
+        self.assertEqual([video['video_id'] for video in response.json()['videos']], list('abcde'))
+
+    def test_videos_are_cursor_paginated(self):
+        seen = []
+        url = f'/api/videos/?job={self.job.pk}&page_size=2'
+        while url:
+            # One query per page, and no COUNT(*)
+            with self.assertNumQueries(1):
+                page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 2)
+            self.assertNotIn('count', page)
+            seen += [video['video_id'] for video in page['results']]
+            url = page['next']
+        self.assertEqual(seen, list('edcba'))
+
+    def test_videos_show_removal_from_the_job(self):
+        PlaylistMembership.objects.filter(video__video_id='a').update(removed_at=timezone.now())
+        videos = self.client.get(f'/api/videos/?job={self.job.pk}').json()['results']
+        self.assertEqual([video['video_id'] for video in videos if video['removed_at']], ['a'])
+        self.assertEqual(self.client.get('/api/videos/?job=x').status_code, 400)
+
+
+class TranscriptCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = temporary_cache(self)
+
+    def test_round_trip(self):
+        self.assertIsNone(self.cache.get('v', ('en',)))
+        self.cache.set('v', ('en',), [segment('a', 0.0)])
+        self.assertEqual(self.cache.get('v', ('en',)), [segment('a', 0.0)])
+        self.assertIsNone(self.cache.get('v', ('de',)))
+
+    def test_missing_entries(self):
+        self.cache.set_missing('v', ('en',), TranscriptsDisabled('v'))
+        self.assertEqual(self.cache.get_missing('v', ('en',)), 'TranscriptsDisabled')
+        self.assertIsNone(self.cache.get('v', ('en',)))
+        # A transcript showing up replaces the negative entry
+        self.cache.set('v', ('en',), [])
+        self.assertIsNone(self.cache.get_missing('v', ('en',)))
+
+    def test_missing_entries_expire(self):
+        self.cache.missing_ttl_seconds = -1
+        self.cache.set_missing('v', ('en',), TranscriptsDisabled('v'))
+        self.assertIsNone(self.cache.get_missing('v', ('en',)))
+
+
+class FakePlaylist:
+    """Stands in for ``ingestion.execute``: a playlist of ``pages`` that honours ETags."""
+
+    def __init__(self, *pages):
+        self.pages = [list(page) for page in pages]
+        self.requests = []
+
+    def response(self, method, youtube):
+        if method == 'playlists.list':
+            # Like YouTube's, the playlist ETag ignores which videos are in it
+            count = sum(len(page) for page in self.pages)
+            return {
+                'etag': 'playlist',
+                'items': [{'snippet': {'title': 'Playlist'}, 'contentDetails': {'itemCount': count}}],
+            }
+        index = int(youtube.playlistItems.return_value.list.call_args.kwargs['pageToken'] or 0)
+        response = {
+            'etag': ','.join(self.pages[index]),
+            'items': [playlist_item(video_id) for video_id in self.pages[index]],
+        }
+        if index + 1 < len(self.pages):
+            response['nextPageToken'] = str(index + 1)
+        return response
+
+    def execute(self, build_request, method, headers=None):
+        youtube = mock.MagicMock()
+        build_request(youtube)
+        response = self.response(method, youtube)
+        modified = (headers or {}).get('If-None-Match') != response['etag']
+        self.requests.append((method, modified))
+        if not modified:
+            raise HttpError(httplib2.Response({'status': '304'}), b'')
+        return response
+
+
+def video_metadata(video_ids):
+    return [{'video_id': video_id, 'duration': 60, 'views': 1} for video_id in video_ids]
+
+
+class SyncPlaylistTests(TestCase):
+    def setUp(self):
+        self.job = PlaylistSearchJob.objects.create(playlist_id='playlist')
+        self.playlist = FakePlaylist(['a', 'b'], ['c'])
+        for patcher in (
+            mock.patch.object(ingestion, 'execute', self.playlist.execute),
+            mock.patch.object(ingestion, 'fetch_video_metadata', side_effect=video_metadata),
+            mock.patch.object(ingestion.quota_scheduler, 'remaining', return_value=10000),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def sync(self):
+        self.playlist.requests = []
+        self.job.refresh_from_db()
+        return ingestion.sync_playlist(self.job)
+
+    def current(self):
+        return sorted(ingestion.current_videos(self.job).values_list('video_id', flat=True))
+
+    def test_first_sync(self):
+        result = self.sync()
+        self.assertEqual((result['inserted'], result['enriched'], result['unchanged']), (3, 3, False))
+        self.assertEqual(self.current(), ['a', 'b', 'c'])
+        self.assertEqual(VideoRecord.objects.get(video_id='c').duration, 60)
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.video_count, self.job.playlist_title), (3, 'Playlist'))
+
+    def test_unchanged_playlist_is_answered_with_304s(self):
+        self.sync()
+        result = self.sync()
+        self.assertTrue(result['unchanged'])
+        self.assertEqual((result['inserted'], result['removed'], result['enriched']), (0, 0, 0))
+        self.assertEqual([modified for _, modified in self.playlist.requests], [False, False, False])
+        self.assertEqual(self.current(), ['a', 'b', 'c'])
+
+    def test_removal_and_re_add(self):
+        self.sync()
+        # Same item count, so the playlist itself is not modified; only a page is
+        self.playlist.pages[1] = ['d']
+        result = self.sync()
+        self.assertEqual((result['inserted'], result['removed'], result['unchanged']), (1, 1, False))
+        self.assertEqual(self.playlist.requests, [
+            ('playlists.list', False), ('playlistItems.list', False), ('playlistItems.list', True),
+        ])
+        self.assertEqual(self.current(), ['a', 'b', 'd'])
+        self.assertIsNotNone(PlaylistMembership.objects.get(job=self.job, video__video_id='c').removed_at)
+
+        self.playlist.pages[1] = ['d', 'c']
+        result = self.sync()
+        self.assertEqual((result['inserted'], result['removed']), (0, 0))
+        self.assertEqual(self.current(), ['a', 'b', 'c', 'd'])
+
+    def test_forced_requeue_downloads_every_page(self):
+        self.sync()
+        PlaylistSearchJob.objects.filter(pk=self.job.pk).update(status='completed')
+        self.assertTrue(jobqueue.requeue(self.job, 'resync', force=True))
+        result = self.sync()
+        self.assertFalse(result['unchanged'])
+        self.assertEqual([modified for _, modified in self.playlist.requests], [True, True, True])
+
+
+class VideoMetadataTests(TestCase):
+    def test_parse_duration(self):
+        self.assertEqual(youtube_metadata.parse_duration('PT1H2M3S'), 3723)
+        self.assertEqual(youtube_metadata.parse_duration('PT45.5S'), 45)
+        self.assertEqual(youtube_metadata.parse_duration('P1DT1M'), 86460)
+        self.assertEqual(youtube_metadata.parse_duration('P1W'), 604800)
+        for live in ('P0D', '', None, 'garbage'):
+            self.assertEqual(youtube_metadata.parse_duration(live), 0)
+
+    def test_looks_videos_up_fifty_at_a_time(self):
+        batches = []
+
+        def execute(build_request, method):
+            youtube = mock.MagicMock()
+            build_request(youtube)
+            ids = youtube.videos.return_value.list.call_args.kwargs['id'].split(',')
+            batches.append(len(ids))
+            # Private and deleted videos are left out of the response
+            return {'items': [
+                {'id': video_id, 'snippet': {'title': video_id, 'channelTitle': 'Channel'},
+                 'contentDetails': {'duration': 'PT1M'}}
+                for video_id in ids if video_id != 'v7'
+            ]}
+
+        video_ids = [f'v{n}' for n in range(120)] + ['v0']
+        with mock.patch.object(youtube_metadata, 'execute', execute):
+            metadata = list(youtube_metadata.fetch_video_metadata(video_ids))
+        self.assertEqual(batches, [50, 50, 20])
+        self.assertEqual(len(metadata), 119)
+        self.assertEqual(metadata[0], {
+            'video_id': 'v0', 'title': 'v0', 'channel_name': 'Channel', 'duration': 60, 'views': 0,
+        })
+
+    def test_enrich_keeps_finished_batches(self):
+        job = PlaylistSearchJob.objects.create(playlist_id='playlist')
+        for video_id in 'abcde':
+            create_video(job, video_id)
+
+        def fetch(video_ids):
+            if 'e' in video_ids:
+                raise QuotaDeferred('out of quota', timezone.now())
+            # 'b' is private: looked up, but nothing comes back
+            return video_metadata(set(video_ids) - {'b'})
+
+        with mock.patch.object(ingestion, 'ENRICH_BATCH_SIZE', 2), \
+                mock.patch.object(ingestion, 'fetch_video_metadata', side_effect=fetch):
+            with self.assertRaises(QuotaDeferred):
+                ingestion.enrich_videos('abcde')
+        self.assertEqual(
+            sorted(ingestion.pending_metadata(job).values_list('video_id', flat=True)), ['e']
+        )
+        self.assertEqual(
+            dict(VideoRecord.objects.values_list('video_id', 'duration')),
+            {'a': 60, 'b': 0, 'c': 60, 'd': 60, 'e': 0},
+        )
+
+
+class RetryPolicyTests(SimpleTestCase):
+    def policy(self, **kwargs):
+        kwargs.setdefault('base_delay', 0)
+        return retry.RetryPolicy('test', retry.classify_transcript_error, **kwargs)
+
+    def test_classify_transcript_error(self):
+        self.assertEqual(retry.classify_transcript_error(TranscriptsDisabled('v')), retry.PERMANENT)
+        self.assertEqual(retry.classify_transcript_error(RequestBlocked('v')), retry.BLOCKED)
+        response = requests.Response()
+        response.status_code = 429
+        self.assertEqual(
+            retry.classify_transcript_error(requests.HTTPError(response=response)), retry.BLOCKED
+        )
+        self.assertEqual(retry.classify_transcript_error(requests.ConnectionError()), retry.TRANSIENT)
+
+    def test_transient_errors_are_retried(self):
+        outcomes = [requests.ConnectionError(), requests.ConnectionError(), 'ok']
+
+        def call():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        policy = self.policy()
+        self.assertEqual(policy.call(call), 'ok')
+        self.assertEqual(policy.status()['retries'], 2)
+        self.assertEqual(policy.status()['breaker']['state'], 'closed')
+
+    def test_permanent_errors_are_not_retried(self):
+        attempts = []
+
+        def call():
+            attempts.append(1)
+            raise NoTranscriptFound('v', ['en'], '')
+
+        with self.assertRaises(NoTranscriptFound):
+            self.policy().call(call)
+        self.assertEqual(len(attempts), 1)
+
+    def test_gives_up_after_max_attempts(self):
+        attempts = []
+
+        def call():
+            attempts.append(1)
+            raise requests.ConnectionError()
+
+        with self.assertRaises(requests.ConnectionError):
+            self.policy(max_attempts=3).call(call)
+        self.assertEqual(len(attempts), 3)
+
+    def test_retry_budget_limits_retries(self):
+        policy = self.policy(max_attempts=10, budget=retry.RetryBudget(ratio=0, reserve=2))
+
+        def call():
+            raise requests.ConnectionError()
+
+        with self.assertRaises(requests.ConnectionError):
+            policy.call(call)
+        status = policy.status()
+        self.assertEqual(status['retries'], 2)
+        self.assertEqual(status['budget_exhausted'], 1)
+
+    def test_blocked_opens_the_breaker(self):
+        policy = self.policy()
+
+        def call():
+            raise RequestBlocked('v')
+
+        with self.assertRaises(RequestBlocked):
+            policy.call(call)
+        self.assertEqual(policy.status()['breaker']['state'], 'open')
+        with self.assertRaises(retry.CircuitOpen):
+            policy.call(lambda: 'ok', block=False)
+
+    def test_quota_deferral_leaves_the_breaker_alone(self):
+        policy = retry.RetryPolicy('test', retry.classify_data_api_error, base_delay=0)
+        policy.breaker.record_failure()
+
+        def call():
+            raise QuotaDeferred('out of quota', timezone.now())
+
+        with self.assertRaises(QuotaDeferred):
+            policy.call(call)
+        self.assertEqual(policy.status()['breaker']['consecutive_failures'], 1)
+
+    def test_deferred_probe_lets_another_caller_probe(self):
+        breaker = retry.CircuitBreaker('test', cooldown=0)
+        breaker.record_failure(blocked=True)
+        policy = retry.RetryPolicy('test', retry.classify_data_api_error, breaker=breaker)
+
+        def call():
+            raise QuotaDeferred('out of quota', timezone.now())
+
+        with self.assertRaises(QuotaDeferred):
+            policy.call(call, block=False)
+        self.assertEqual(policy.call(lambda: 'ok', block=False), 'ok')
+        self.assertEqual(breaker.status()['state'], 'closed')
+
+
+class QuotaSchedulerTests(TestCase):
+    def scheduler(self, **kwargs):
+        scheduler = QuotaScheduler(['key-a', 'key-b'], **kwargs)
+        # The Django-backed ledger the app configures on startup
+        scheduler.configure(youtube.quota_scheduler.atomic)
+        return scheduler
+
+    def spent(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT method, SUM(units) FROM youtube_api_quota_ledger GROUP BY method")
+            return dict(cursor.fetchall())
+
+    def test_acquire_spreads_calls_over_keys(self):
+        scheduler = self.scheduler(daily_limit=1000, burst=150)
+        first, _ = scheduler.acquire('search.list')
+        # The other key now has more tokens left
+        second, api_key = scheduler.acquire('search.list')
+        self.assertNotEqual(first, second)
+        self.assertEqual(quota.key_label(api_key), second)
+        scheduler.acquire('playlistItems.list')
+        self.assertEqual(self.spent(), {'search.list': 200, 'playlistItems.list': 1})
+        self.assertEqual(scheduler.remaining(), 2000 - 201)
+
+    def test_empty_bucket_defers_instead_of_waiting_long(self):
+        scheduler = self.scheduler(daily_limit=1000, burst=100)
+        scheduler.acquire('search.list')
+        scheduler.acquire('search.list')
+        with self.assertRaises(QuotaDeferred) as raised:
+            scheduler.acquire('search.list', max_wait=0)
+        self.assertGreater(raised.exception.retry_at, timezone.now())
+        self.assertLess(raised.exception.retry_at, quota.next_reset(timezone.now()))
+
+    def test_exhausted_keys_are_skipped_until_the_reset(self):
+        scheduler = self.scheduler()
+        scheduler.mark_exhausted(quota.key_label('key-a'))
+        self.assertEqual(scheduler.acquire('videos.list'), (quota.key_label('key-b'), 'key-b'))
+        scheduler.mark_exhausted(quota.key_label('key-b'))
+        with self.assertRaises(QuotaDeferred) as raised:
+            scheduler.acquire('videos.list')
+        self.assertEqual(raised.exception.retry_at, quota.next_reset(timezone.now()))
+        self.assertEqual(scheduler.remaining(), 0)
+
+    def test_status_writes_nothing(self):
+        status = self.scheduler(daily_limit=1000).status()
+        self.assertEqual([key['remaining'] for key in status['keys']], [1000, 1000])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM youtube_api_quota")
+            self.assertEqual(cursor.fetchone(), (0,))
+
+    def test_next_reset_is_pacific_midnight(self):
+        # 07:59 UTC in summer is 00:59 in Los Angeles
+        now = datetime(2024, 7, 1, 7, 59, tzinfo=dt_timezone.utc)
+        self.assertEqual(quota.next_reset(now), datetime(2024, 7, 2, 7, 0, tzinfo=dt_timezone.utc))
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.job = PlaylistSearchJob.objects.create(playlist_id='playlist')
+        for position, video_id in enumerate(['rows', 'packed', 'none']):
+            video = create_video(self.job, video_id)
+            PlaylistMembership.objects.filter(video=video).update(position=position)
+        create_transcripts_table(
+            [('rows', 0.0, 'first'), ('rows', 1.0, 'say "hi", then'), ('other', 0.0, 'not in the job')],
+            {'packed': [segment('packed line', 2.0, 0.5)]},
+        )
+
+    def export(self, **params):
+        response = self.client.get(f'/api/playlists/{self.job.pk}/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_ndjson(self):
+        lines = [json.loads(line) for line in self.export().decode().splitlines()]
+        self.assertEqual([(line['video_id'], line['text']) for line in lines], [
+            ('rows', 'first'), ('rows', 'say "hi", then'), ('packed', 'packed line'),
+        ])
+        self.assertEqual(lines[2], {
+            'video_id': 'packed', 'title': 'Title packed', 'channel_name': 'Channel',
+            'start_time': 2.0, 'duration': 0.5, 'text': 'packed line',
+        })
+
+    def test_gzipped_csv(self):
+        body = gzip.decompress(self.export(format='csv', gzip='1')).decode()
+        self.assertEqual(body.splitlines(), [
+            'video_id,title,channel_name,start_time,duration,text',
+            'rows,Title rows,Channel,0.0,1.0,first',
+            'rows,Title rows,Channel,1.0,1.0,"say ""hi"", then"',
+            'packed,Title packed,Channel,2.0,0.5,packed line',
+        ])
+
+    def test_empty_export(self):
+        self.assertEqual(list(export.encode_csv([])), [(','.join(export.COLUMNS) + '\r\n').encode()])
+        self.assertEqual(gzip.decompress(b''.join(export.gzip_stream(export.encode_ndjson([])))), b'')
+
+    def test_chunks(self):
+        with connection.cursor() as cursor:
+            chunks = list(export.iter_rows(cursor, self.job.pk, chunk_rows=1))
+        self.assertEqual([len(chunk) for chunk in chunks], [1, 1, 1])
+
+    def test_unknown_format(self):
+        response = self.client.get(f'/api/playlists/{self.job.pk}/export/', {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportCursorTests(TransactionTestCase):
+    def setUp(self):
+        job = PlaylistSearchJob.objects.create(playlist_id='playlist')
+        create_video(job, 'v')
+        create_transcripts_table([('v', float(n), f'line {n}') for n in range(5000)], on_commit='PRESERVE ROWS')
+        self.addCleanup(drop_transcripts_table)
+        self.url = f'/api/playlists/{job.pk}/export/'
+
+    def test_cursor_is_not_held_over_a_commit(self):
+        response = self.client.get(self.url)
+        content = iter(response.streaming_content)
+        first = next(content)
+        # A WITH HOLD cursor would have run the whole query already
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT is_holdable FROM pg_cursors")
+            self.assertEqual(cursor.fetchall(), [(False,)])
+        self.assertEqual((first + b''.join(content)).count(b'\n'), 5000)
+        response.close()
+
+
+class PackedTranscriptTests(SimpleTestCase):
+    def test_round_trip(self):
+        segments = [segment('hello', 0.0, 1.5), segment('wörld ✓', 1.5, 2.25), segment('', 3.75, 0.001)]
+        self.assertEqual(packed.PackedTranscript(packed.pack(segments)).to_raw_data(), segments)
+
+    def test_indexing_matches_iteration(self):
+        transcript = packed.PackedTranscript(packed.pack([segment('a', 0.0), segment('b', 1.0)]))
+        self.assertEqual(len(transcript), 2)
+        self.assertEqual(transcript[-1], segment('b', 1.0))
+        with self.assertRaises(IndexError):
+            transcript[2]
+
+    def test_missing_duration_round_trips_as_none(self):
+        transcript = packed.PackedTranscript(packed.pack([segment('a', 0.0, None)]))
+        self.assertIsNone(transcript[0]['duration'])
+
+    def test_rejects_other_data(self):
+        with self.assertRaises(ValueError):
+            packed.PackedTranscript(b'XXXX' + bytes(8))
+
+    def test_line_at(self):
+        segments = [segment('a', 0.0), segment('b', 2.0), segment('c', 4.0)]
+        for transcript in (segments, packed.PackedTranscript(packed.pack(segments))):
+            self.assertEqual(packed.line_at(transcript, 0)['text'], 'a')
+            self.assertEqual(packed.line_at(transcript, 2.0)['text'], 'b')
+            self.assertEqual(packed.line_at(transcript, 3.9)['text'], 'b')
+            self.assertEqual(packed.line_at(transcript, 100)['text'], 'c')
+            # Before the first line: the first line
+            self.assertEqual(packed.line_at(transcript, -1)['text'], 'a')
+
+    def test_line_at_with_missing_start(self):
+        segments = [segment('a', 5.0), segment('b', None), segment('x', 7.0)]
+        for transcript in (segments, packed.PackedTranscript(packed.pack(segments))):
+            self.assertEqual(packed.line_at(transcript, 7.2)['text'], 'x')
+            self.assertEqual(packed.line_at(transcript, 6)['text'], 'b')
+
+    def test_line_at_empty_transcript(self):
+        self.assertIsNone(packed.line_at([], 1.0))
+        self.assertIsNone(packed.line_at(packed.PackedTranscript(packed.pack([])), 1.0))
+
+
+class MetricsTests(SimpleTestCase):
+    def test_render(self):
+        registry = metrics.Registry()
+        requests_total = registry.counter('requests_total', 'Requests', ['method'])
+        in_flight = registry.gauge('in_flight', 'In flight')
+        latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1))
+        requests_total.inc(method='GET')
+        requests_total.inc(2, method='say "hi"')
+        in_flight.set(3)
+        latency.observe(0.05)
+        latency.observe(0.5)
+        latency.observe(5)
+
+        self.assertEqual(registry.render(), '\n'.join([
+            '# HELP requests_total Requests',
+            '# TYPE requests_total counter',
+            'requests_total{method="GET"} 1',
+            'requests_total{method="say \\"hi\\""} 2',
+            '# HELP in_flight In flight',
+            '# TYPE in_flight gauge',
+            'in_flight 3',
+            '# HELP latency_seconds Latency',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{le="0.1"} 1',
+            'latency_seconds_bucket{le="1.0"} 2',
+            'latency_seconds_bucket{le="+Inf"} 3',
+            'latency_seconds_count 3',
+            'latency_seconds_sum 5.55',
+        ]) + '\n')
+
+    def test_labels_must_match(self):
+        counter = metrics.Counter('c', 'C', ['method'])
+        with self.assertRaises(ValueError):
+            counter.inc(route='/')
+
+
+class FakeYouTubeTests(SimpleTestCase):
+    def start(self, **kwargs):
+        fake = FakeYouTube(**kwargs).start()
+        self.addCleanup(fake.stop)
+        return fake
+
+    def test_pages_and_etags(self):
+        fake = self.start(playlist_size=60)
+        url = fake.url + 'youtube/v3/playlistItems'
+        first = requests.get(url, params={'playlistId': 'p', 'maxResults': 50}).json()
+        self.assertEqual(len(first['items']), 50)
+        second = requests.get(url, params={'playlistId': 'p', 'pageToken': first['nextPageToken']}).json()
+        self.assertEqual([item['snippet']['resourceId']['videoId'] for item in second['items']][-1], 'p-00059')
+        self.assertNotIn('nextPageToken', second)
+
+        response = requests.get(url, params={'playlistId': 'p'}, headers={'If-None-Match': first['etag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(fake.stats()['requests'], {'playlistItems': 3})
+
+    def test_injected_errors(self):
+        fake = self.start(error_rate=1.0)
+        self.assertEqual(requests.get(fake.url + 'youtube/v3/videos', params={'id': 'a'}).status_code, 500)
+        self.assertEqual(fake.stats()['injected_errors'], {'videos': 1})
+
+
+class SharedVideoTests(TestCase):
+    def test_video_inserted_concurrently_counts_as_known(self):
+        job = PlaylistSearchJob.objects.create(playlist_id='playlist')
+        other = PlaylistSearchJob.objects.create(playlist_id='other')
+        bulk_create = VideoRecord.objects.bulk_create
+        inserted_order = []
+
+        def racing_bulk_create(videos, **kwargs):
+            # Another worker stores 'c' between the lookup and the insert
+            VideoRecord.objects.create(playlist_job=other, video_id='c', title='c', channel_name='', duration=0)
+            inserted_order.extend(video.video_id for video in videos)
+            return bulk_create(videos, **kwargs)
+
+        with mock.patch.object(VideoRecord.objects, 'bulk_create', racing_bulk_create):
+            inserted, known = store_page(job, [playlist_item(video_id) for video_id in 'cab'])
+        self.assertEqual((inserted, known), (['a', 'b'], ['c']))
+        self.assertEqual(inserted_order, ['a', 'b', 'c'])
+        self.assertEqual(
+            list(job.memberships.order_by('position').values_list('video__video_id', flat=True)), ['c', 'a', 'b']
+        )
+
+    def test_batch_report(self):
+        first, second, idle = (
+            PlaylistSearchJob.objects.create(playlist_id=playlist_id) for playlist_id in ('first', 'second', 'idle')
+        )
+        store_page(first, [playlist_item(video_id) for video_id in 'abc'])
+        store_page(second, [playlist_item(video_id) for video_id in 'bcd'])
+        store_page(idle, [playlist_item('a')])
+        # Removed from the second playlist: no longer shared
+        PlaylistMembership.objects.filter(job=second, video__video_id='c').update(removed_at=timezone.now())
+        VideoRecord.objects.filter(video_id='b').update(transcript_fetched=True)
+        batch = PlaylistBatch.objects.create()
+        batch.jobs.add(first, second)
+
+        report = batches.report(batch)
+        self.assertEqual(
+            [(p['playlist_id'], p['videos'], p['shared_videos'], p['unique_videos']) for p in report['playlists']],
+            [('first', 3, 1, 2), ('second', 2, 1, 1)],
+        )
+        self.assertEqual(report['totals'], {
+            'playlists': 2, 'pending': 2, 'memberships': 5, 'distinct_videos': 4,
+            'duplicates_avoided': 1, 'transcripts_fetched': 1,
+        })
+        self.assertEqual(sorted(batches.videos(batch).values_list('video_id', flat=True)), list('abcd'))
+
+
+class EnrichmentTests(SimpleTestCase):
+    def setUp(self):
+        enrichment.init_worker(0, {})
+
+    def test_enrich_chunk(self):
+        documents = [
+            ('v1', ['Python makes parsing easy.', 'We love python, it is great and wonderful.']),
+            ('v2', ['The weather today is terrible.', 'Rain and awful wind all day.']),
+        ]
+        rows, doc_freq = enrichment.enrich_chunk(documents, keywords=3, summary_sentences=1)
+
+        self.assertEqual([row[0] for row in rows], ['v1', 'v2'])
+        (_, summary, keywords, sentiment, language), (_, _, _, sentiment2, _) = rows
+        self.assertIn(summary, ['Python makes parsing easy.', 'We love python, it is great and wonderful.'])
+        self.assertEqual(keywords.split(', ')[0], 'python')
+        self.assertEqual(len(keywords.split(', ')), 3)
+        self.assertNotIn('the', keywords.split(', '))
+        self.assertEqual(sentiment, 'positive')
+        self.assertEqual(sentiment2, 'negative')
+        self.assertEqual(language, 'en')
+        self.assertEqual(doc_freq['python'], 1)
+
+    def test_reads_packed_blobs(self):
+        blob = packed.pack([segment('Python makes parsing easy and we love it', 0.0)])
+        rows, _ = enrichment.enrich_chunk([('v1', blob)])
+        self.assertIn('python', rows[0][2])
+
+    def test_negation_flips_sentiment(self):
+        self.assertEqual(enrichment.sentiment(['not', 'good']), 'negative')
+        self.assertEqual(enrichment.sentiment(['good']), 'positive')
+        self.assertEqual(enrichment.sentiment([]), 'neutral')
+
+    def test_unknown_language(self):
+        self.assertEqual(enrichment.detect_language('12345 ?!'), enrichment.UNKNOWN_LANGUAGE)
+
+
+class PhraseIndexTests(SimpleTestCase):
+    def test_positions_run_across_lines(self):
+        postings, first_positions, start_times = phrases.index_video(
+            [('the quick brown', 0.0), ('fox jumps', 2.5), (None, 4.0), ('the end', 5.0)]
+        )
+        self.assertEqual(postings['the'], [0, 5])
+        self.assertEqual(postings['fox'], [3])
+        self.assertEqual(first_positions, [0, 3, 5, 5])
+        self.assertEqual(start_times, [0.0, 2.5, 4.0, 5.0])
+
+    def test_windows(self):
+        # term 0 at 1 and 10, term 1 at 3 and 30
+        self.assertEqual(phrases._windows([[1, 10], [3, 30]], within=5), [(1, 3)])
+        self.assertEqual(phrases._windows([[1, 10], [3, 30]], within=2), [])
+        # Windows do not overlap
+        self.assertEqual(phrases._windows([[0, 2], [1, 3]], within=4), [(0, 2), (2, 2)])
+
+    def test_windows_take_the_tightest_span(self):
+        self.assertEqual(phrases._windows([[0, 4], [5]], within=10), [(4, 2)])
+
+
+class ConditionalPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.job = PlaylistSearchJob.objects.create(playlist_id='playlist', status='completed')
+        for position, video_id in enumerate('ab'):
+            video = create_video(self.job, video_id)
+            PlaylistMembership.objects.filter(video=video).update(position=position)
+
+    def test_unchanged_pages_are_not_modified(self):
+        for url in ('/', f'/job/{self.job.pk}/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('no-cache', response['Cache-Control'])
+            revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(revalidated.status_code, 304)
+
+    def test_job_page_changes_with_its_videos(self):
+        etag, _ = pages.job_version(self.job.pk, 1)
+        VideoRecord.objects.filter(video_id='a').update(title='New title', updated_at=timezone.now())
+        changed, _ = pages.job_version(self.job.pk, 1)
+        self.assertNotEqual(changed, etag)
+        self.assertContains(self.client.get(f'/job/{self.job.pk}/', HTTP_IF_NONE_MATCH=etag), 'New title')
+
+        PlaylistMembership.objects.filter(video__video_id='b').update(removed_at=timezone.now())
+        self.assertNotEqual(pages.job_version(self.job.pk, 1)[0], changed)
+
+    def test_out_of_range_pages_are_the_last_page(self):
+        self.assertEqual(pages.job_version(self.job.pk, 5), pages.job_version(self.job.pk, 1))
+        self.assertEqual(pages.job_version(0, 1), (None, None))
+        self.assertEqual(self.client.get('/job/0/').status_code, 404)
+
+    def test_renders_once_per_version(self):
+        context = mock.Mock(return_value={'jobs': []})
+        first = pages.cached_render('v1', 'transcripts/index.html', context)
+        self.assertEqual(pages.cached_render('v1', 'transcripts/index.html', context), first)
+        self.assertEqual(context.call_count, 1)
+        pages.cached_render('v2', 'transcripts/index.html', context)
+        self.assertEqual(context.call_count, 2)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.job = PlaylistSearchJob.objects.create(playlist_id='playlist', playlist_title='Playlist')
+        self.video = create_video(self.job, 'v')
+        self.cache = temporary_cache(self)
+        patcher = mock.patch.object(transcript_cache, 'cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_fetch_transcript_from_the_cache(self):
+        self.cache.set('v', ('en',), [segment('hello', 0.0), segment('world', 1.0)])
+        response = await self.async_client.post(f'/api/videos/{self.video.pk}/fetch_transcript/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['transcript'], 'hello world')
+        self.assertTrue((await VideoRecord.objects.aget(pk=self.video.pk)).transcript_fetched)
+
+    async def test_fetch_transcript_errors(self):
+        self.cache.set_missing('v', ('en',), TranscriptsDisabled('v'))
+        response = await self.async_client.post(f'/api/videos/{self.video.pk}/fetch_transcript/')
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.post('/api/videos/0/fetch_transcript/')
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(f'/api/videos/{self.video.pk}/fetch_transcript/')
+        self.assertEqual(response.status_code, 405)
+
+    async def test_open_breaker_fails_fast(self):
+        policy = retry.RetryPolicy('test', retry.classify_transcript_error)
+        policy.breaker.record_failure(blocked=True)
+        with mock.patch.object(transcript_cache, 'transcript_policy', policy):
+            response = await self.async_client.post(f'/api/videos/{self.video.pk}/fetch_transcript/')
+        self.assertEqual(response.status_code, 503)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+    async def test_job_status(self):
+        response = await self.async_client.get(f'/api/playlists/{self.job.pk}/status/')
+        self.assertEqual(response.status_code, 200)
+        status = response.json()
+        self.assertEqual((status['playlist_title'], status['status']), ('Playlist', 'pending'))
+        self.assertIn('progress', status)
+        self.assertNotIn('videos', status)
+        response = await self.async_client.get('/api/playlists/0/status/')
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,254 @@
+"""Persistent on-disk transcript cache shared by the web app and the scripts.
+
+Entries are content-addressed: the file name is the SHA-256 of the video id
+and requested languages, so every process on the machine (gunicorn workers,
+queue workers, ``scripts/transcript_download_db.py``) reads the same files.
+Each entry expires after a TTL, and the directory is kept under a size limit
+by evicting the least recently used files (a cache hit refreshes the file's
+mtime). Videos without a transcript (``TranscriptsDisabled``,
+``NoTranscriptFound``) are remembered for a few hours as well, so reruns do
+not ask YouTube again. No Django imports, so the scripts can use it directly.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import requests
+from dotenv import load_dotenv
+from youtube_transcript_api import YouTubeTranscriptApi
+from youtube_transcript_api._errors import NoTranscriptFound, TranscriptsDisabled
+
+from .metrics import TRANSCRIPT_FETCH_IN_FLIGHT, TRANSCRIPT_FETCH_SECONDS
+from .retry import transcript_policy
+
+load_dotenv()
+
+DEFAULT_DIRECTORY = Path(__file__).resolve().parent.parent / '.transcript_cache'
+
+# Permanent answers worth remembering; other errors may clear up on a retry
+MISSING_ERRORS = (TranscriptsDisabled, NoTranscriptFound)
+
+
+class TranscriptCache:
+    def __init__(self, directory, max_bytes, ttl_seconds, missing_ttl_seconds=6 * 3600):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.missing_ttl_seconds = missing_ttl_seconds
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'expired': 0, 'stores': 0, 'evictions': 0, 'missing_hits': 0}
+        self.total_bytes = None
+
+    @staticmethod
+    def key(video_id, languages):
+        return hashlib.sha256(f"{video_id}:{','.join(languages)}".encode()).hexdigest()
+
+    def path(self, key):
+        return self.directory / key[:2] / f'{key}.json.gz'
+
+    def missing_path(self, video_id, languages):
+        return self.path(self.key(video_id, languages) + '-missing')
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _read(self, path, ttl_seconds):
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry['fetched_at'] > ttl_seconds:
+            self._count('expired')
+            path.unlink(missing_ok=True)
+            return None
+
+        os.utime(path)  # mark as recently used
+        return entry
+
+    def get(self, video_id, languages=('en',)):
+        """Cached segments for the video, or None on a miss."""
+        entry = self._read(self.path(self.key(video_id, languages)), self.ttl_seconds)
+        if entry is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return entry['segments']
+
+    def get_missing(self, video_id, languages=('en',)):
+        """Name of the permanent error recently cached for the video, or None."""
+        entry = self._read(self.missing_path(video_id, languages), self.missing_ttl_seconds)
+        if entry is None:
+            return None
+        self._count('missing_hits')
+        return entry['error']
+
+    def set(self, video_id, languages, segments):
+        self._write(self.path(self.key(video_id, languages)), {
+            'video_id': video_id, 'languages': list(languages), 'fetched_at': time.time(), 'segments': segments,
+        })
+        self.missing_path(video_id, languages).unlink(missing_ok=True)
+
+    def set_missing(self, video_id, languages, error):
+        """Remember that fetching the video's transcript raised ``error``, one of ``MISSING_ERRORS``."""
+        self._write(self.missing_path(video_id, languages), {
+            'video_id': video_id, 'languages': list(languages), 'fetched_at': time.time(),
+            'error': type(error).__name__,
+        })
+
+    def _write(self, path, entry):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                f.write(json.dumps(entry).encode('utf-8'))
+            os.replace(tmp, path)
+        except OSError:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+        with self.lock:
+            self.counters['stores'] += 1
+            if self.counters['stores'] % 100 == 0:
+                # Other processes write here too; recount now and then.
+                self.total_bytes = None
+            elif self.total_bytes is not None:
+                self.total_bytes += path.stat().st_size
+        if self.size() > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        for path in self.directory.glob('*/*.json.gz'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # evicted by another process
+            yield path, stat
+
+    def size(self):
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(stat.st_size for _, stat in self._entries())
+            return self.total_bytes
+
+    def evict(self):
+        """Delete least recently used entries until the cache is 90% full."""
+        entries = sorted(self._entries(), key=lambda entry: entry[1].st_mtime)
+        total = sum(stat.st_size for _, stat in entries)
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for path, stat in entries:
+            if total <= target:
+                break
+            path.unlink(missing_ok=True)
+            total -= stat.st_size
+            evicted += 1
+        with self.lock:
+            self.total_bytes = total
+            self.counters['evictions'] += evicted
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        lookups = counters['hits'] + counters['misses']
+        counters['hit_rate'] = round(counters['hits'] / lookups, 3) if lookups else None
+        counters['size_bytes'] = self.size()
+        counters['max_bytes'] = self.max_bytes
+        return counters
+
+
+cache = TranscriptCache(
+    os.getenv('TRANSCRIPT_CACHE_DIR', DEFAULT_DIRECTORY),
+    max_bytes=int(os.getenv('TRANSCRIPT_CACHE_MAX_MB', '1024')) * 1024 * 1024,
+    ttl_seconds=int(os.getenv('TRANSCRIPT_CACHE_TTL_DAYS', '30')) * 86400,
+    missing_ttl_seconds=int(os.getenv('TRANSCRIPT_MISSING_TTL_HOURS', '6')) * 3600,
+)
+
+
+_local = threading.local()
+
+
+def transcript_api():
+    """This thread's ``YouTubeTranscriptApi``, created on first use.
+
+    Each instance owns a ``requests.Session``, whose pooled keep-alive
+    connections to youtube.com are reused by every later fetch on the same
+    thread. Sessions are not shared between threads because their cookie
+    jar (consent cookies) is not thread-safe.
+    """
+    api = getattr(_local, 'api', None)
+    if api is None:
+        api = _local.api = YouTubeTranscriptApi(http_client=requests.Session())
+    return api
+
+
+def fetch_transcript(video_id, languages=('en',), block=True):
+    """Transcript segments as ``[{'text', 'start', 'duration'}, ...]``.
+
+    Served from the cache when possible; otherwise fetched from YouTube under
+    the shared retry policy and cached. ``block=False`` raises
+    ``retry.CircuitOpen`` instead of waiting out an open breaker. Errors from
+    ``YouTubeTranscriptApi`` propagate unchanged once retries are exhausted.
+    """
+    segments = cache.get(video_id, tuple(languages))
+    if segments is None:
+        raise_if_missing(video_id, languages)
+        segments = transcript_policy.call(partial(download_transcript, video_id, languages), block=block)
+    return segments
+
+
+# Threads lent to async callers (the ASGI views) for the blocking download
+# and its retry sleeps; also the most downloads one process runs at once
+# for them. Further calls wait for a free thread without blocking the loop.
+async_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('TRANSCRIPT_ASYNC_THREADS', '16')), thread_name_prefix='transcript-fetch'
+)
+
+
+async def afetch_transcript(video_id, languages=('en',), block=True):
+    """``fetch_transcript`` for coroutines, run on ``async_executor``."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(async_executor, partial(fetch_transcript, video_id, languages, block))
+
+
+def raise_if_missing(video_id, languages=('en',)):
+    """Raise the permanent error cached for the video, if any, without asking YouTube."""
+    error = cache.get_missing(video_id, tuple(languages))
+    if error == TranscriptsDisabled.__name__:
+        raise TranscriptsDisabled(video_id)
+    if error == NoTranscriptFound.__name__:
+        raise NoTranscriptFound(video_id, list(languages), '(cached answer; available transcripts not listed)')
+
+
+def download_transcript(video_id, languages=('en',)):
+    """Fetch from YouTube without checking the cache, then store the result.
+
+    ``MISSING_ERRORS`` are stored too, for ``raise_if_missing``.
+    """
+    languages = tuple(languages)
+    outcome = 'error'
+    started = time.perf_counter()
+    try:
+        with TRANSCRIPT_FETCH_IN_FLIGHT.track_in_progress():
+            segments = transcript_api().fetch(video_id, languages=languages).to_raw_data()
+        outcome = 'ok'
+    except Exception as e:
+        outcome = type(e).__name__
+        if isinstance(e, MISSING_ERRORS):
+            cache.set_missing(video_id, languages, e)
+        raise
+    finally:
+        TRANSCRIPT_FETCH_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+    cache.set(video_id, languages, segments)
+    return segments
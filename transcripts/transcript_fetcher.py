@@ -0,0 +1,137 @@
+"""Bounded, rate-limited concurrent transcript fetching.
+
+Transcripts are downloaded on a thread pool while a shared token bucket caps
+the global request rate. Videos already in the transcript cache cost no
+request at all. Successful fetches are flagged on ``VideoRecord`` in
+one UPDATE per chunk rather than one ``save()`` per video.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import progress
+from .metrics import DB_WRITE_SECONDS
+from .models import VideoRecord
+from .retry import transcript_policy
+from .transcript_cache import cache, download_transcript, raise_if_missing
+
+
+class RateLimiter:
+    """Thread-safe token bucket allowing ``rate`` acquisitions per second."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def fetch_one(video_id, limiter):
+    """Fetch one transcript under the shared retry policy. Returns an outcome dict."""
+    started = time.monotonic()
+    outcome = {'video_id': video_id, 'status': 'fetched', 'error': None, 'attempts': 0,
+               'cached': cache.get(video_id) is not None}
+
+    def attempt():
+        # Every attempt, retries included, counts against the rate cap
+        limiter.acquire()
+        outcome['attempts'] += 1
+        return download_transcript(video_id)
+
+    if not outcome['cached']:
+        try:
+            raise_if_missing(video_id)
+            transcript_policy.call(attempt)
+        except Exception as e:
+            outcome.update(status='failed', error=str(e))
+    outcome['elapsed'] = round(time.monotonic() - started, 3)
+    return outcome
+
+
+def _mark_fetched(pks):
+    if pks:
+        with DB_WRITE_SECONDS.time(operation='mark_transcripts_fetched'):
+            VideoRecord.objects.filter(pk__in=pks).update(transcript_fetched=True, updated_at=timezone.now())
+
+
+def fetch_transcripts(videos, max_workers=None, rate=None, chunk_size=None, job=None):
+    """Fetch transcripts for ``videos`` concurrently.
+
+    ``max_workers`` bounds the number of in-flight fetches and ``rate`` caps
+    the requests per second across all of them (0 disables the cap). With a
+    ``job``, its progress counters advance once per chunk. Returns a dict
+    with ``fetched``/``failed`` counts, per-video ``results`` and wall-clock
+    ``stats``.
+    """
+    max_workers = max_workers or settings.TRANSCRIPT_FETCH_WORKERS
+    rate = settings.TRANSCRIPT_FETCH_RPS if rate is None else rate
+    chunk_size = chunk_size or settings.TRANSCRIPT_FETCH_CHUNK_SIZE
+
+    pk_by_video_id = {video.video_id: video.pk for video in videos}
+    # No burst: even the first requests of a run stay under ``rate``
+    limiter = RateLimiter(rate)
+    results = []
+    pending_pks = []
+    pending_failed = 0
+    started = time.monotonic()
+    if job is not None:
+        progress.set_phase(job, 'transcripts', transcripts_total=len(pk_by_video_id),
+                           transcripts_fetched=0, transcripts_failed=0)
+
+    def flush():
+        _mark_fetched(pending_pks)
+        if job is not None:
+            progress.add(job, transcripts_fetched=len(pending_pks), transcripts_failed=pending_failed)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='transcripts') as pool:
+        futures = [pool.submit(fetch_one, video_id, limiter) for video_id in pk_by_video_id]
+        for future in as_completed(futures):
+            outcome = future.result()
+            results.append(outcome)
+            if outcome['status'] == 'fetched':
+                pending_pks.append(pk_by_video_id[outcome['video_id']])
+            else:
+                pending_failed += 1
+            if len(pending_pks) + pending_failed >= chunk_size:
+                flush()
+                pending_pks = []
+                pending_failed = 0
+    flush()
+
+    elapsed = time.monotonic() - started
+    fetched = sum(1 for r in results if r['status'] == 'fetched')
+    cached = sum(1 for r in results if r['cached'])
+    per_video = sorted(r['elapsed'] for r in results)
+    return {
+        'fetched': fetched,
+        'failed': len(results) - fetched,
+        'results': results,
+        'stats': {
+            'videos': len(results),
+            'cache_hits': cached,
+            'workers': max_workers,
+            'rate_limit': rate,
+            'wall_clock_seconds': round(elapsed, 3),
+            'videos_per_second': round(len(results) / elapsed, 2) if elapsed else None,
+            'median_fetch_seconds': per_video[len(per_video) // 2] if per_video else None,
+            'max_fetch_seconds': per_video[-1] if per_video else None,
+        },
+    }
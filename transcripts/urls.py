@@ -2,17 +2,26 @@
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PlaylistSearchJobViewSet, VideoRecordViewSet, index, job_detail
+from .views import PlaylistBatchViewSet, PlaylistSearchJobViewSet, VideoRecordViewSet, TranscriptSearchViewSet, export_job, fetch_transcript, index, job_progress, job_detail, job_status, metrics_view, youtube_status
 
 # Create router
 router = DefaultRouter()
 router.register(r'playlists', PlaylistSearchJobViewSet, basename='playlist')
+router.register(r'batches', PlaylistBatchViewSet, basename='playlist-batch')
 router.register(r'videos', VideoRecordViewSet, basename='video')
+router.register(r'search', TranscriptSearchViewSet, basename='transcript-search')
 
 urlpatterns = [
 
     #  Create API routes
+    path('api/youtube/status/', youtube_status, name='youtube_status'),
+    path('api/playlists/<int:pk>/export/', export_job, name='playlist_export'),
+    path('api/playlists/<int:pk>/progress/', job_progress, name='playlist_progress'),
+    # Async views; fetch_transcript is matched before the router, which is sync only
+    path('api/playlists/<int:pk>/status/', job_status, name='playlist_status'),
+    path('api/videos/<int:pk>/fetch_transcript/', fetch_transcript, name='video_fetch_transcript'),
     path('api/', include(router.urls)),
+    path('metrics', metrics_view, name='metrics'),
 
     # Create HTML routes
     path('', index, name='index'),
@@ -1,36 +1,71 @@
-from django.shortcuts import render, get_object_or_404
-from django.utils import timezone
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Prefetch
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
 from rest_framework import viewsets
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-import os
-from dotenv import load_dotenv
-from googleapiclient.discovery import build
-from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_transcript_api._errors import (
     TranscriptsDisabled,
     NoTranscriptFound,
     CouldNotRetrieveTranscript
 )
-from .models import PlaylistSearchJob, VideoRecord
-from .serializers import PlaylistSearchJobSerializer, VideoRecordSerializer
-import time
-
-load_dotenv()
-
-YOUTUBE_API_KEY = os.getenv('GOOGLE_DEVELOPER_API_KEY')
+from . import (
+    batches, export, fulltext, ingestion, jobqueue, metrics, packed, pages, phrases, progress, retry,
+    streams, transcript_fetcher,
+)
+from .models import PlaylistBatch, PlaylistMembership, PlaylistSearchJob, VideoRecord
+from .pagination import VideoCursorPagination
+from .retry import CircuitOpen
+from .serializers import (
+    PlaylistSearchJobSerializer,
+    PlaylistSearchJobSummarySerializer,
+    VideoRecordSerializer
+)
+from .transcript_cache import afetch_transcript, cache as transcript_cache
+from .youtube import client_pool, quota_scheduler
 
+# Upper bound on the parallelism a client may request for fetch_transcripts
+MAX_FETCH_WORKERS = 32
 
-def get_youtube():
 
-    return build('youtube', 'v3', developerKey=YOUTUBE_API_KEY, cache_discovery=False)
+def fetch_options(data):
+    """``(workers, rps)`` from a fetch_transcripts request body; ValueError if invalid."""
+    try:
+        workers = int(data.get('workers') or settings.TRANSCRIPT_FETCH_WORKERS)
+        rate = float(data.get('rps', settings.TRANSCRIPT_FETCH_RPS))
+    except (TypeError, ValueError):
+        raise ValueError('workers and rps must be numbers')
+    if not 1 <= workers <= MAX_FETCH_WORKERS or not 0 <= rate < math.inf:
+        raise ValueError(f'workers must be 1-{MAX_FETCH_WORKERS} and rps a finite number >= 0')
+    return workers, rate
 
 
 # REST API ViewSets
 class PlaylistSearchJobViewSet(viewsets.ModelViewSet):
-    queryset = PlaylistSearchJob.objects.all()
+    queryset = PlaylistSearchJob.objects.order_by('-created_at')
     serializer_class = PlaylistSearchJobSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(Prefetch(
+                'memberships', queryset=PlaylistMembership.objects.select_related('video').order_by('position')
+            ))
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return PlaylistSearchJobSummarySerializer
+        return super().get_serializer_class()
+
     @action(detail=False, methods=['post'])
     def search_playlist(self, request):
         playlist_id = request.data.get('playlist_id', '').strip()
@@ -44,140 +79,356 @@ class PlaylistSearchJobViewSet(viewsets.ModelViewSet):
         if existing_job:
             return Response({'error': 'Playlist already being processed'}, status=400)
 
-        job = None
-        try:
-            job = PlaylistSearchJob.objects.create(
-                playlist_id=playlist_id,
-                status='processing'
+        completed_job = PlaylistSearchJob.objects.filter(playlist_id=playlist_id, status='completed').first()
+        if completed_job:
+            return Response(
+                {'error': 'Playlist already ingested; use resync to refresh it', 'job_id': completed_job.id},
+                status=400
             )
 
-            youtube = get_youtube()
-
-            # Fetch playlist info
-            playlist_request = youtube.playlists().list(part='snippet', id=playlist_id)
-            playlist_response = playlist_request.execute()
-
-            if not playlist_response['items']:
-                job.status = 'failed'
-                job.error_message = 'Playlist not found'
-                job.save()
-                return Response({'error': 'Playlist not found'}, status=404)
-
-            job.playlist_title = playlist_response['items'][0]['snippet']['title']
-            job.save()
-
-            # Fetch videos
-            next_page_token = None
-            video_count = 0
-            while True:
-                request = youtube.playlistItems().list(
-                    part='snippet',
-                    playlistId=playlist_id,
-                    maxResults=50,
-                    pageToken=next_page_token
-                )
-                response = request.execute()
-                for item in response['items']:
-                    video_id = item['snippet']['resourceId'].get('videoId')
-                    if not video_id:
-                        continue
-                    VideoRecord.objects.create(
-                        video_id=video_id,
-                        title=item['snippet']['title'],
-                        channel_name=item['snippet']['channelTitle'],
-                        duration=0,
-                        playlist_job=job
-                    )
-                    video_count += 1
-
-                next_page_token = response.get('nextPageToken')
-                if not next_page_token:
-                    break
-
-            job.video_count = video_count
-            job.status = 'completed'
-            job.completed_at = timezone.now()
-            job.save()
-
-            return Response({'message': f'{video_count} videos added', 'job_id': job.id})
-
-        except Exception as e:
-            if job:
-                job.status = 'failed'
-                job.error_message = str(e)
-                job.save()
-            return Response({'error': str(e)}, status=500)
+        # Ingestion runs in `manage.py run_worker`; just queue the job here.
+        job, _ = jobqueue.enqueue(playlist_id)
+        return Response(
+            {'message': 'Playlist queued for processing', 'job_id': job.id, 'status': job.status},
+            status=202
+        )
+
+    @action(detail=True, methods=['post'])
+    def resync(self, request, pk=None):
+        job = self.get_object()
+        force = str(request.data.get('force', '')).lower() in ('1', 'true', 'yes')
+        if not jobqueue.requeue(job, 'resync', force=force):
+            return Response({'error': 'Playlist already being processed'}, status=400)
+        return Response(
+            {'message': 'Playlist queued for resync', 'job_id': job.id, 'status': 'pending'},
+            status=202
+        )
 
     @action(detail=True, methods=['post'])
     def fetch_transcripts(self, request, pk=None):
         job = self.get_object()
-        fetched_count = 0
-        failed_count = 0
+        try:
+            workers, rate = fetch_options(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
 
-        for video in job.videos.all():
-            try:
-                for attempt in range(3):
-                    try:
-                        transcript = YouTubeTranscriptApi().fetch(video.video_id)
-                        break
-                    except CouldNotRetrieveTranscript:
-                        if attempt < 2:
-                            time.sleep(2)  # wait before retry
-                        else:
-                            raise
-                video.transcript_fetched = True
-                video.save()
-                fetched_count += 1
-            except (TranscriptsDisabled, NoTranscriptFound, CouldNotRetrieveTranscript):
-                failed_count += 1
-            except Exception:
-                failed_count += 1
-
-        return Response({'fetched': fetched_count, 'failed': failed_count})
+        previous = progress.current_phase(job) or 'queued'
+        # Videos dropped from the playlist by a resync are left alone
+        report = transcript_fetcher.fetch_transcripts(
+            ingestion.current_videos(job), max_workers=workers, rate=rate, job=job
+        )
+        # A finished job shows its outcome again; otherwise the phase it was in
+        job.refresh_from_db(fields=['status'])
+        progress.leave_phase(job, 'transcripts', job.status if job.status in progress.FINAL_PHASES else previous)
+        return Response(report)
+
+
+class PlaylistBatchViewSet(viewsets.ViewSet):
+    """Many playlists at once: POST /api/batches/ with {"playlist_ids": [...]}
+
+    Each playlist becomes an ordinary queued job; GET /api/batches/{id}/
+    reports their progress and how many videos they share.
+    """
+    lookup_value_regex = r'\d+'
+
+    def create(self, request):
+        playlist_ids = request.data.get('playlist_ids')
+        if not isinstance(playlist_ids, list) or not all(isinstance(p, str) for p in playlist_ids):
+            return Response({'error': 'playlist_ids must be a list of playlist IDs'}, status=400)
+        # Keep the submitted order, without repeats
+        playlist_ids = list(dict.fromkeys(p.strip() for p in playlist_ids if p.strip()))
+        if not playlist_ids:
+            return Response({'error': 'Playlist IDs required'}, status=400)
+        if len(playlist_ids) > batches.MAX_PLAYLISTS:
+            return Response({'error': f'At most {batches.MAX_PLAYLISTS} playlists per batch'}, status=400)
+
+        batch, entries = batches.submit(playlist_ids)
+        return Response(
+            {
+                'message': 'Playlists queued for processing',
+                'batch_id': batch.pk,
+                'jobs': [
+                    {'playlist_id': job.playlist_id, 'job_id': job.pk, 'status': job.status, 'created': created}
+                    for job, created in entries
+                ],
+            },
+            status=202
+        )
+
+    def retrieve(self, request, pk=None):
+        batch = get_object_or_404(PlaylistBatch, pk=pk)
+        return Response(batches.report(batch))
 
+    @action(detail=True, methods=['post'])
+    def fetch_transcripts(self, request, pk=None):
+        """Fetch the transcripts the batch's videos are still missing, each video once."""
+        batch = get_object_or_404(PlaylistBatch, pk=pk)
+        try:
+            workers, rate = fetch_options(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        report = transcript_fetcher.fetch_transcripts(
+            batches.videos(batch).filter(transcript_fetched=False), max_workers=workers, rate=rate
+        )
+        return Response(report)
 
 
 class VideoRecordViewSet(viewsets.ModelViewSet):
     queryset = VideoRecord.objects.all()
     serializer_class = VideoRecordSerializer
+    pagination_class = VideoCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        job_id = self.request.query_params.get('job')
+        if job_id:
+            if not job_id.isdigit():
+                raise ValidationError({'job': 'Must be a job id'})
+            # One row per video in the playlist, with its removal from this playlist
+            queryset = queryset.filter(memberships__job_id=job_id).annotate(
+                removed_at=F('memberships__removed_at')
+            )
+        return queryset
 
-    @action(detail=True, methods=['post'])
-    def fetch_transcript(self, request, pk=None):
+    @action(detail=True, methods=['get'])
+    def transcript(self, request, pk=None):
+        """Stored transcript lines in either storage format; ``?at=<seconds>`` returns one line."""
         video = self.get_object()
+        with connection.cursor() as cursor:
+            segments = packed.read_transcript(cursor, video.video_id)
+        if segments is None:
+            return Response({'error': 'No stored transcript for this video'}, status=404)
+        at = request.query_params.get('at')
+        if at is None:
+            return Response({'video_id': video.video_id, 'segments': list(segments)})
         try:
-            transcript_text = ""
-            # Retry 2 times
-            for attempt in range(2):
-                try:
-                    transcript_list = YouTubeTranscriptApi().fetch(video.video_id)
-                    transcript_text = " ".join([t['text'] for t in transcript_list])
-                    break
-                except CouldNotRetrieveTranscript:
-                    if attempt < 1:
-                        time.sleep(2)
-                    else:
-                        raise
-
-            # Save transcript to the DB to show in job_html
-            video.transcript = transcript_text
-            video.transcript_fetched = True
-            video.save()
-
-            return Response({'message': f'Transcript fetched for {video.title}', 'transcript': transcript_text})
-        except (TranscriptsDisabled, NoTranscriptFound, CouldNotRetrieveTranscript) as e:
-            return Response({'error': str(e)}, status=400)
-        except Exception as e:
-            return Response({'error': str(e)}, status=500)
+            seconds = float(at)
+        except ValueError:
+            return Response({'error': 'at must be a number of seconds'}, status=400)
+        segment = packed.line_at(segments, seconds)
+        if segment is None:
+            return Response({'error': 'The stored transcript has no lines'}, status=404)
+        return Response({'video_id': video.video_id, 'segment': segment})
+
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        return Response(transcript_cache.stats())
+
+
+@api_view(['GET'])
+def youtube_status(request):
+    """Retry counters, circuit breaker state, Data API quota and client pool use."""
+    return Response({**retry.status(), 'quota': quota_scheduler.status(), 'clients': client_pool.stats()})
+
+
+class TranscriptSearchViewSet(viewsets.ViewSet):
+    """Ranked full-text search over stored transcript lines: GET /api/search/?q=
+
+    ``GET /api/search/phrase/?q=`` finds the moments an exact phrase is said,
+    even across caption lines; add ``within=N`` to match the words in any
+    order within N words.
+    """
+
+    max_limit = 100
+
+    def page(self, request):
+        """``(query, limit, offset)``; raises ValidationError if invalid."""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'error': 'Query parameter q required'})
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), self.max_limit)
+            offset = int(request.query_params.get('offset', 0))
+        except ValueError:
+            raise ValidationError({'error': 'limit and offset must be integers'})
+        if limit < 1 or offset < 0:
+            raise ValidationError({'error': 'limit must be positive and offset non-negative'})
+        return query, limit, offset
+
+    def list(self, request):
+        query, limit, offset = self.page(request)
+        with connection.cursor() as cursor:
+            rows = fulltext.search(cursor, query, limit=limit, offset=offset, ranked=True).fetchall()
+
+        results = [
+            {
+                'video_id': video_id,
+                'start_time': start_time,
+                'rank': rank,
+                'snippet': snippet,
+                'url': fulltext.watch_url(video_id, start_time),
+            }
+            for video_id, start_time, rank, snippet in rows
+        ]
+        return Response({'query': query, 'limit': limit, 'offset': offset, 'results': results})
+
+    @action(detail=False, methods=['get'])
+    def phrase(self, request):
+        query, limit, offset = self.page(request)
+        within = request.query_params.get('within')
+        if within is not None:
+            try:
+                within = int(within)
+            except ValueError:
+                raise ValidationError({'error': 'within must be an integer'})
+            if within < 1:
+                raise ValidationError({'error': 'within must be positive'})
+
+        with connection.cursor() as cursor:
+            results = phrases.search(cursor, query, within=within, limit=limit, offset=offset)
+        return Response({'query': query, 'within': within, 'limit': limit, 'offset': offset, 'results': results})
+
+
+@require_GET
+def export_job(request, pk):
+    """Stream every transcript line of a job: GET /api/playlists/{id}/export/?format=ndjson|csv
+
+    A plain Django view rather than a DRF action, because DRF reserves
+    ``?format=`` for picking a renderer. ``gzip=1`` compresses on the fly.
+    """
+    job = get_object_or_404(PlaylistSearchJob, pk=pk)
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in export.FORMATS:
+        return JsonResponse({'error': f"format must be one of {', '.join(export.FORMATS)}"}, status=400)
+    compress = request.GET.get('gzip', '').lower() in ('1', 'true', 'yes')
+    content_type, extension = export.FORMATS[fmt]
+
+    def body():
+        # A named (server-side) cursor: rows arrive in chunks as they are sent.
+        # Outside a transaction it would be WITH HOLD, which makes Postgres run
+        # the whole query before the first FETCH.
+        with transaction.atomic(), connection.chunked_cursor() as cursor:
+            yield from export.stream(cursor, job.pk, fmt, compress=compress)
+
+    filename = f'{job.playlist_id}.{extension}' + ('.gz' if compress else '')
+    response = streams.response(request, body(), content_type='application/gzip' if compress else content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@require_GET
+def metrics_view(request):
+    """Counters and histograms of this process in the Prometheus text format: GET /metrics"""
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Seconds between progress checks
+PROGRESS_INTERVAL = 1.0
+
+
+@require_GET
+def job_progress(request, pk):
+    """Server-Sent Events with a job's progress counters: GET /api/playlists/{id}/progress/
+
+    See ``progress.EventStream``. Counters come from ``progress.snapshot``,
+    never from scanning videos.
+    """
+    job = get_object_or_404(PlaylistSearchJob, pk=pk)
+    try:
+        interval = max(float(request.GET.get('interval', PROGRESS_INTERVAL)), 0.5)
+    except ValueError:
+        return JsonResponse({'error': 'interval must be a number of seconds'}, status=400)
+
+    response = streams.response(
+        request, progress.EventStream(job.pk, interval), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
+
+
+# Async views: native under ASGI (uvicorn), where a slow YouTube response
+# holds neither a worker nor a thread of the event loop; under WSGI Django
+# runs them to completion on the worker thread as before.
+
+async def fetch_transcript(request, pk):
+    """Download one video's transcript: POST /api/videos/{id}/fetch_transcript/
+
+    The blocking transcript client and its retry sleeps run on
+    ``transcript_cache.async_executor``; the database is reached through the
+    async ORM. Routed ahead of the DRF router, which is sync only.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    video = await VideoRecord.objects.filter(pk=pk).afirst()
+    if video is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    try:
+        # Retries follow the shared policy; an open breaker fails fast
+        # rather than holding the request.
+        transcript_list = await afetch_transcript(video.video_id, block=False)
+        transcript_text = " ".join([t['text'] for t in transcript_list])
+
+        video.transcript_fetched = True
+        with metrics.DB_WRITE_SECONDS.time(operation='save_transcript'):
+            await video.asave(update_fields=['transcript_fetched', 'updated_at'])
+
+        return JsonResponse({'message': f'Transcript fetched for {video.title}', 'transcript': transcript_text})
+    except CircuitOpen as e:
+        response = JsonResponse({'error': str(e)}, status=503)
+        response['Retry-After'] = str(math.ceil(e.retry_after))
+        return response
+    except (TranscriptsDisabled, NoTranscriptFound, CouldNotRetrieveTranscript) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+# The page's fetch() sends no CSRF token, as with the DRF action it replaces.
+# Set directly: csrf_exempt's wrapper would hide the coroutine in Django 4.2.
+fetch_transcript.csrf_exempt = True
+
+
+async def job_status(request, pk):
+    """A job's state and progress counters without its videos: GET /api/playlists/{id}/status/"""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    job = await PlaylistSearchJob.objects.filter(pk=pk).values(
+        'id', 'playlist_id', 'playlist_title', 'status', 'video_count', 'error_message',
+        'attempts', 'run_after', 'created_at', 'updated_at', 'completed_at',
+    ).afirst()
+    if job is None:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    job['progress'] = await sync_to_async(progress.snapshot)(pk)
+    return JsonResponse(job)
 
 
 # HTML Views
 
+def _page_version(request, pk=None):
+    """``(etag, last_modified)`` of the requested page, looked up once per request."""
+    if not hasattr(request, 'page_version'):
+        if pk is None:
+            request.page_version = pages.index_version()
+        else:
+            request.page_version = pages.job_version(pk, pages.page_number(request))
+    return request.page_version
+
+
+# 304 Not Modified when the page's version matches If-None-Match/If-Modified-Since
+conditional_page = condition(
+    etag_func=lambda request, pk=None: _page_version(request, pk)[0],
+    last_modified_func=lambda request, pk=None: _page_version(request, pk)[1],
+)
+
+
+@cache_control(no_cache=True)
+@conditional_page
 def index(request):
-    jobs = PlaylistSearchJob.objects.all()[:10]
-    return render(request, 'transcripts/index.html', {'jobs': jobs})
+    etag, _ = _page_version(request)
+    return HttpResponse(pages.cached_render(etag, 'transcripts/index.html', pages.index_context))
 
 
+@cache_control(no_cache=True)
+@conditional_page
 def job_detail(request, pk):
-    job = get_object_or_404(PlaylistSearchJob, pk=pk)
-    videos = job.videos.all()
-    return render(request, 'transcripts/job_detail.html', {'job': job, 'videos': videos})
\ No newline at end of file
+    """One page of a job's videos: /job/{id}/?page="""
+    etag, _ = _page_version(request, pk)
+    if etag is None:
+        raise Http404('No such job')
+    page = pages.page_number(request)
+    return HttpResponse(pages.cached_render(
+        etag,
+        'transcripts/job_detail.html',
+        lambda: pages.job_context(get_object_or_404(PlaylistSearchJob, pk=pk), page),
+    ))
@@ -0,0 +1,150 @@
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import httplib2
+from dotenv import load_dotenv
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+
+from .metrics import CLIENT_BUILD_SECONDS, DATA_API_IN_FLIGHT, DATA_API_REQUESTS, DATA_API_SECONDS
+from .quota import QuotaScheduler, key_label
+from .retry import data_api_policy, http_error_reasons
+
+load_dotenv()
+
+# Several comma-separated keys spread the daily quota over more than one project
+API_KEYS = [
+    key.strip()
+    for key in os.getenv('GOOGLE_DEVELOPER_API_KEYS', os.getenv('GOOGLE_DEVELOPER_API_KEY', '')).split(',')
+    if key.strip()
+]
+YOUTUBE_API_KEY = API_KEYS[0] if API_KEYS else None
+# Send Data API calls somewhere other than googleapis.com, e.g. a local fake
+YOUTUBE_API_ENDPOINT = os.getenv('YOUTUBE_API_ENDPOINT') or None
+HTTP_TIMEOUT = float(os.getenv('YOUTUBE_HTTP_TIMEOUT', '30'))
+
+# 403 reasons that mean the key is spent until the daily reset
+DAILY_QUOTA_REASONS = {'quotaExceeded', 'dailyLimitExceeded'}
+
+quota_scheduler = QuotaScheduler(
+    API_KEYS,
+    daily_limit=int(os.getenv('YOUTUBE_DAILY_QUOTA', '10000')),
+    burst=int(os.getenv('YOUTUBE_QUOTA_BURST', '500')),
+    max_wait=float(os.getenv('YOUTUBE_QUOTA_MAX_WAIT', '60')),
+)
+
+# The discovery document shipped with google-api-python-client, parsed once
+# per process instead of on every build().
+DISCOVERY_DOCUMENT = json.loads(discovery_cache.get_static_doc('youtube', 'v3'))
+
+
+def get_youtube(api_key=None, api_endpoint=YOUTUBE_API_ENDPOINT):
+    """Build a new client. Prefer ``client_pool.client()``, which reuses them."""
+    with CLIENT_BUILD_SECONDS.time():
+        return build_from_document(
+            DISCOVERY_DOCUMENT,
+            developerKey=api_key or YOUTUBE_API_KEY,
+            http=httplib2.Http(timeout=HTTP_TIMEOUT),
+            client_options={'api_endpoint': api_endpoint} if api_endpoint else None,
+        )
+
+
+class ClientPool:
+    """Process-wide pool of Data API clients, one free list per key.
+
+    A client and its ``httplib2.Http`` are not thread-safe, so each is
+    checked out by one thread at a time. Returned clients keep their
+    keep-alive connection to googleapis.com, so later calls skip both the
+    client build and the TCP/TLS handshake. The most recently returned
+    client is handed out first because its connection is the least likely
+    to have been closed by the server.
+    """
+
+    def __init__(self, api_endpoint=YOUTUBE_API_ENDPOINT):
+        self.api_endpoint = api_endpoint
+        self.free = {}
+        self.lock = threading.Lock()
+        self.counters = {'checkouts': 0, 'builds': 0, 'discarded': 0}
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    @contextmanager
+    def client(self, api_key=None):
+        api_key = api_key or YOUTUBE_API_KEY
+        with self.lock:
+            free = self.free.setdefault(api_key, queue.LifoQueue())
+        self._count('checkouts')
+        try:
+            youtube = free.get_nowait()
+        except queue.Empty:
+            self._count('builds')
+            youtube = get_youtube(api_key, self.api_endpoint)
+        broken = False
+        try:
+            yield youtube
+        except (OSError, httplib2.HttpLib2Error):
+            # Never hand out a client whose connection just failed
+            broken = True
+            self._count('discarded')
+            raise
+        finally:
+            if not broken:
+                free.put(youtube)
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            free = dict(self.free)
+        counters['idle'] = {key_label(api_key or ''): clients.qsize() for api_key, clients in free.items()}
+        return counters
+
+
+client_pool = ClientPool()
+
+
+def execute(build_request, method, headers=None):
+    """Execute a Data API request under the shared quota and retry policy.
+
+    ``build_request`` receives a client and returns the request, e.g.
+    ``lambda youtube: youtube.playlists().list(...)``; ``method`` names the
+    API method (``'playlists.list'``) for quota accounting. Every attempt
+    pays for its quota first. A key that YouTube reports as out of quota is
+    marked exhausted and the call moves on to the next key.
+    """
+    def send(request):
+        outcome = 'error'
+        started = time.perf_counter()
+        try:
+            with DATA_API_IN_FLIGHT.track_in_progress():
+                response = request.execute()
+            outcome = 'ok'
+            return response
+        except HttpError as e:
+            outcome = 'not_modified' if e.resp.status == 304 else str(e.resp.status)
+            raise
+        finally:
+            DATA_API_SECONDS.observe(time.perf_counter() - started, method=method)
+            DATA_API_REQUESTS.inc(method=method, outcome=outcome)
+
+    def attempt():
+        while True:
+            label, api_key = quota_scheduler.acquire(method)
+            with client_pool.client(api_key) as youtube:
+                request = build_request(youtube)
+                request.headers.update(headers or {})
+                try:
+                    return send(request)
+                except HttpError as e:
+                    if e.resp.status == 403 and http_error_reasons(e) & DAILY_QUOTA_REASONS:
+                        quota_scheduler.mark_exhausted(label)
+                        continue
+                    raise
+
+    return data_api_policy.call(attempt)
@@ -2,6 +2,8 @@ import os
 from dotenv import load_dotenv
 from pathlib import Path
 
+from transcripts.db import django_database
+
 load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -27,6 +29,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the other middleware too
+    "transcripts.middleware.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -60,15 +64,9 @@ WSGI_APPLICATION = "transcripts_project.wsgi.application"
 # PostgreSQL database
 import os
 
+# Shared with the scripts/ tools; see transcripts/db.py for the DB_* variables
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('DB_NAME', 'youtube_pipeline_db'),
-        'USER': os.getenv('DB_USER', 'youtube_pipeline_db_user'),
-        'PASSWORD': os.getenv('DB_PASSWORD', 'yourpassword'),
-        'HOST': os.getenv('DB_HOST', 'dpg-d4legh8dl3ps73853mbg-a.oregon-postgres.render.com'),
-        'PORT': os.getenv('DB_PORT', '5432'),  
-    }
+    'default': django_database(),
 }
 
 
@@ -91,8 +89,34 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Rendered HTML pages (transcripts/pages.py) and progress snapshots. Local
+# memory needs no extra service but is per process; set CACHE_DIR to share a
+# file-based cache between gunicorn workers.
+CACHE_DIR = os.getenv("CACHE_DIR")
+if CACHE_DIR:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": CACHE_DIR,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "youtube-pipeline",
+            "OPTIONS": {"MAX_ENTRIES": 1000},
+        }
+    }
+
 # REST Framework pagination
 REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 20,
 }
+
+# Transcript fetching: parallel downloads, global requests/second cap (0 = no cap)
+# and how many videos to flag per UPDATE.
+TRANSCRIPT_FETCH_WORKERS = int(os.getenv("TRANSCRIPT_FETCH_WORKERS", "8"))
+TRANSCRIPT_FETCH_RPS = float(os.getenv("TRANSCRIPT_FETCH_RPS", "5"))
+TRANSCRIPT_FETCH_CHUNK_SIZE = int(os.getenv("TRANSCRIPT_FETCH_CHUNK_SIZE", "50"))